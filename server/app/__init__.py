@@ -19,6 +19,8 @@ def get_app(
 ):
     from app.auth import configure_auth
     from app.auth.oidc import OidcAuth
+    from app.gallery.listener import listener as gallery_listener
+    from app.inference import engine
     from app.routers import cameras, identities, recognition, users
     from fastapi import FastAPI, Request, status
 
@@ -58,6 +60,24 @@ def get_app(
 
             return response
 
+    # Fork the inference workers before starting any thread
+    @app.on_event('startup')
+    def start_inference_engine():
+        engine.start()
+
+    @app.on_event('shutdown')
+    def stop_inference_engine():
+        engine.stop()
+
+    # Keep the in-memory gallery in sync with the database
+    @app.on_event('startup')
+    def start_gallery_listener():
+        gallery_listener.start()
+
+    @app.on_event('shutdown')
+    def stop_gallery_listener():
+        gallery_listener.stop()
+
     # Create the routes
     app.include_router(identities.router, prefix='/identities')
     app.include_router(recognition.router, prefix='/recognition')
@@ -4,12 +4,13 @@ import queue
 import time
 import threading
 
+from app.cameras.frames import FrameRef, FrameRing
 from app.constants import RECORDS_DIR
 from app.models.cameras import Camera
 from app.mqtt import client as mqtt
 from app.utils.time import TimeTracker
 from datetime import datetime
-from typing import Any, Tuple
+from typing import Any, Callable, List, Optional, Tuple
 
 
 class BaseThread(threading.Thread):
@@ -33,13 +34,26 @@ class BaseThread(threading.Thread):
         self._logger.debug('Stopping the thread')
         self._running = False
 
+    @property
+    def running(self) -> bool:
+        return bool(self._running)
+
 
 class FrameHandler(BaseThread):
+    # Executor of the supervisor running the handler
+    executor = 'handlers'
+
     def __init__(self, stream: 'VideoStream', max_queue_size: int = 0):
         super().__init__(name=stream.camera_id)
 
         self._queue = queue.Queue(max_queue_size)
+        self._queue_lock = threading.Lock()
+        self._discarding = False
         self._stream = stream
+        self._received_at = time.monotonic()
+
+        # Called after a frame is queued, when the handler is not run by its own thread
+        self.notify: Optional[Callable[[], None]] = None
 
     def __str__(self) -> str:
         return '{}({})'.format(
@@ -47,34 +61,111 @@ class FrameHandler(BaseThread):
             self.name
         )
 
+    @property
+    def max_fps(self) -> Optional[float]:
+        """
+        Rate overriding the one given to the stream, if any
+        """
+        return None
+
     def process(self, frame: any):
         pass
 
+    def open(self) -> None:
+        """
+        Acquire the resources of the handler before the first frame
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        Release the resources of the handler after the last frame
+        """
+        pass
+
+    def start(self) -> None:
+        self.open()
+        return super().start()
+
+    def poll(self, timeout: Optional[float] = None) -> Optional[Tuple[float, FrameRef]]:
+        """
+        Next queued frame, None if there is none before the timeout
+        """
+        try:
+            return self._queue.get(block=timeout is not None, timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def handle(self, item: Tuple[float, FrameRef]) -> None:
+        """
+        Process a queued frame and release it
+        """
+        self._received_at, frame = item
+
+        try:
+            self._tracker.reset()
+            self.process(frame.array)
+        except Exception as e:
+            self._logger.exception('Uncaught exception')
+        finally:
+            frame.release()
+
+    def discard(self) -> None:
+        """
+        Release the queued frames and the ones queued afterwards, once the handler failed
+        """
+        with self._queue_lock:
+            self._discarding = True
+
+        item = self.poll()
+
+        while item is not None:
+            item[1].release()
+            item = self.poll()
+
     def run(self):
         while self._running or not self._queue.empty():
+            item = self.poll(timeout=1)
+
+            if item is not None:
+                self.handle(item)
+
+        self.close()
+
+    def add(self, frame: FrameRef):
+        """
+        Queue a frame, the handler holds a reference until it is processed
+        """
+        with self._queue_lock:
+            if self._discarding:
+                return
+
             try:
-                frame = self._queue.get(block=True, timeout=1)
-                self._tracker.reset()
-                self.process(frame)
-            except queue.Empty:
-                pass
-            except Exception as e:
-                self._logger.exception('Uncaught exception')
-
-    def add(self, frame):
-        try:
-            self._queue.put_nowait(frame.copy())
-        except queue.Full:
-            pass
+                self._queue.put_nowait((time.monotonic(), frame.retain()))
+            except queue.Full:
+                frame.release()
+                return
+
+        if self.notify is not None:
+            self.notify()
 
 
 class VideoStream(BaseThread):
     RECORD_EXTENSION = 'webm'
 
-    def __init__(self, camera: Camera):
+    # Seconds to wait before opening the capture again after a failure
+    _retry_delay = 1.0
+
+    def __init__(self, camera: Camera, ring_slots: int = 8, shared_frames: bool = False):
         super().__init__(name=str(camera.id))
         self._camera = camera
         self._handlers = []
+        self._ring = None
+        self._ring_slots = ring_slots
+        self._shared_frames = shared_frames
+        self._snapshot = None
+        self._snapshot_requested = False
+        self._snapshot_ready = threading.Event()
         self._last_frame = 0
         self._record = None
         self._record_file = None
@@ -94,17 +185,72 @@ class VideoStream(BaseThread):
         })
         return handler
 
+    def remove_handler(self, handler: FrameHandler) -> None:
+        """
+        Stop dispatching the frames to a handler
+        """
+        self._handlers = list(item for item in self._handlers if item['handler'] is not handler)
+
+    @property
+    def handlers(self) -> List[FrameHandler]:
+        return list(handler['handler'] for handler in self._handlers)
+
     def start(self) -> None:
         for handler in self._handlers:
             handler['handler'].start()
         return super().start()
 
-    def next(self) -> Any:
+    def snapshot(self, timeout: float = 1.0) -> Optional[Any]:
+        """
+        Wait for the next decoded frame, None if none was read before the timeout
+        """
+        self._snapshot_ready.clear()
+        self._snapshot_requested = True
+
+        if not self._snapshot_ready.wait(timeout):
+            return None
+
+        return self._snapshot
+
+    def _delay(self, handler: dict) -> float:
+        """
+        Minimum delay between two frames of a handler, in milliseconds
+        """
+        max_fps = handler['handler'].max_fps
+        return 1000.0 / max_fps if max_fps else handler['delay']
+
+    def next(self, retrieve: bool = True) -> Any:
+        """
+        Read the next frame, False on error or None if the frame is skipped without being retrieved
+        """
         raise NotImplementedError()
 
     def get_size(self) -> Tuple[int, int]:
         raise NotImplementedError()
 
+    @property
+    def connected(self) -> bool:
+        """
+        Whether the capture is open
+        """
+        return True
+
+    @property
+    def retry_delay(self) -> float:
+        return self._retry_delay
+
+    def connect(self) -> bool:
+        """
+        Open the capture, which may block for long, return False on failure
+        """
+        return True
+
+    def close(self) -> None:
+        """
+        Release the capture, it is opened again by the next read
+        """
+        pass
+
     @property
     def camera(self) -> Camera:
         return self._camera
@@ -142,57 +288,106 @@ class VideoStream(BaseThread):
 
         return frame
 
-    def run(self):
-        while self._running:
-            self._tracker.reset()
-
-            try:
-                frame = self.next()
-                self._tracker.add('Read frame')
+    def attach(self) -> None:
+        """
+        Prepare the stream to be driven by a supervisor instead of its own thread
+        """
+        self._running = True
 
-                # Compute avg fps
-                now = self._tracker.now()
-                self._fps_count += 1
+    def step(self) -> Any:
+        """
+        Read a frame and dispatch it to the due handlers, return the read frame
+        """
+        frame = False
+        self._tracker.reset()
 
-                if not self._fps_timestamp or (now - self._fps_timestamp) >= 1000:
-                    self._fps_avg = self._fps_count
-                    self._fps_timestamp = now
-                    self._fps_count = 0
+        try:
+            # Only retrieve the frames which are recorded or due to a handler, see the backends for what it saves
+            timestamp = time.time_ns() / 1e6
+            due = list(handler for handler in self._handlers if timestamp - handler['last'] >= self._delay(handler))
+            frame = self.next(retrieve=bool(due) or self.recording or self._snapshot_requested)
+            self._tracker.add('Read frame' if frame is not None else 'Grab frame')
+
+            # Compute avg fps
+            now = self._tracker.now()
+            self._fps_count += 1
+
+            if not self._fps_timestamp or (now - self._fps_timestamp) >= 1000:
+                self._fps_avg = self._fps_count
+                self._fps_timestamp = now
+                self._fps_count = 0
+
+            if self._record:
+                if self._record_timeout <= datetime.now().timestamp():
+                    self.stop_record()
+
+            if frame is not False and frame is not None:
+                if self._record_size is None:
+                    self._record_size = self.get_size()
+
+                if self._snapshot_requested:
+                    self._snapshot = frame
+                    self._snapshot_requested = False
+                    self._snapshot_ready.set()
 
                 if self._record:
-                    if self._record_timeout <= datetime.now().timestamp():
-                        self.stop_record()
-
-                if frame is not False:
-                    if self._record_size is None:
-                        self._record_size = self.get_size()
-
-                    if self._record:
-                        self._record.write(
-                            self.recorded_frame(frame)
-                        )
-                        self._tracker.add('Record')
-
-                    now = time.time_ns() / 1e6
-
-                    for handler in self._handlers:
-                        if now - handler['last'] >= handler['delay']:
-                            handler['last'] = now
-                            handler['handler'].add(frame)
-                        self._tracker.add('Handler {}'.format(handler['handler']))
-                
-                self._tracker.show_inline(fn=self._logger.debug)
-            except Exception:
-                self._logger.exception('Uncaught exception')
+                    self._record.write(
+                        self.recorded_frame(frame)
+                    )
+                    self._tracker.add('Record')
+
+                if due:
+                    # Write the frame once and share it with the handlers
+                    if self._ring is None or not self._ring.matches(frame):
+                        if self._ring is not None:
+                            self._ring.close()
+                        self._ring = FrameRing(self._ring_slots, frame.shape, frame.dtype, self._shared_frames)
+
+                    ref = self._ring.write(frame)
+                    self._tracker.add('Write frame')
+
+                    try:
+                        for handler in due:
+                            handler['last'] = timestamp
+                            handler['handler'].add(ref)
+                            self._tracker.add('Handler {}'.format(handler['handler']))
+                    finally:
+                        ref.release()
+
+            self._tracker.show_inline(fn=self._logger.debug)
+        except Exception:
+            self._logger.exception('Uncaught exception')
+
+        return frame
+
+    def shutdown(self) -> None:
+        """
+        Release the capture and the ring buffer and stop the record, once the handlers are stopped
+        """
+        self.close()
+
+        if self._ring is not None:
+            if self._ring.overflows:
+                self._logger.debug('%d frames did not fit in the ring buffer', self._ring.overflows)
+            self._ring.close()
+            self._ring = None
+
+        # Stop the record
+        if self.recording:
+            self.stop_record()
+
+    def run(self):
+        while self._running:
+            self.step()
+
+        self.close()
 
         # Stopping handlers threads
         for handler in self._handlers:
             handler['handler'].stop()
             handler['handler'].join()
 
-        # Stop the record
-        if self.recording:
-            self.stop_record()
+        self.shutdown()
 
     def start_record(self, timeout: int = 30):
         self._logger.info('Starting record')
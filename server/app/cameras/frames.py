@@ -0,0 +1,135 @@
+import numpy as np
+import threading
+
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+
+class FrameRef:
+    """
+    Reference counted read-only frame of a ring buffer
+    """
+    def __init__(self, ring: 'FrameRing', slot: int, array: np.ndarray):
+        self._ring = ring
+        self._slot = slot
+        self._count = 1
+        self.array = array
+
+    @property
+    def name(self) -> Optional[str]:
+        """
+        Name of the shared memory holding the frame, if any
+        """
+        return self._ring.slot_name(self._slot)
+
+    def retain(self) -> 'FrameRef':
+        with self._ring.lock:
+            self._count += 1
+        return self
+
+    def release(self) -> None:
+        with self._ring.lock:
+            self._count -= 1
+
+            if self._count == 0:
+                self._ring.free(self._slot)
+
+
+class FrameRing:
+    """
+    Preallocated frame slots written once by a stream and shared by its handlers
+
+    A slot is reused once every handler released its reference. When all
+    the slots are in use, the frame is copied to a new array instead and
+    counted as an overflow. With `shared`, slots are backed by shared
+    memory so that other processes can map them by name.
+    """
+    def __init__(self, slots: int, shape: Tuple[int, ...], dtype: np.dtype = np.uint8, shared: bool = False):
+        self.lock = threading.Lock()
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.overflows = 0
+        self._next = 0
+        self._used = [False] * slots
+        self._memories: List[shared_memory.SharedMemory] = []
+        self._closed = False
+
+        size = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        if shared:
+            self._memories = list(shared_memory.SharedMemory(create=True, size=max(1, size)) for _ in range(0, slots))
+            self._slots = list(np.ndarray(self.shape, dtype=self.dtype, buffer=memory.buf) for memory in self._memories)
+        else:
+            self._slots = list(np.empty(self.shape, dtype=self.dtype) for _ in range(0, slots))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def matches(self, frame: np.ndarray) -> bool:
+        return frame.shape == self.shape and frame.dtype == self.dtype
+
+    def slot_name(self, slot: int) -> Optional[str]:
+        return self._memories[slot].name if self._memories and slot >= 0 else None
+
+    def _acquire(self) -> int:
+        with self.lock:
+            for offset in range(0, len(self._slots)):
+                slot = (self._next + offset) % len(self._slots)
+
+                if not self._used[slot]:
+                    self._used[slot] = True
+                    self._next = slot + 1
+                    return slot
+
+            self.overflows += 1
+            return -1
+
+    def free(self, slot: int) -> None:
+        """
+        Make a slot available again, called with the lock held
+        """
+        if slot < 0:
+            return
+
+        self._used[slot] = False
+
+        if self._closed and not any(self._used):
+            self._release_memories()
+
+    def write(self, frame: np.ndarray) -> FrameRef:
+        """
+        Copy a frame to a free slot, the caller owns the returned reference
+        """
+        slot = self._acquire()
+
+        if slot < 0:
+            array = frame.copy()
+        else:
+            array = self._slots[slot]
+            np.copyto(array, frame)
+
+        view = array.view()
+        view.flags.writeable = False
+        return FrameRef(self, slot, view)
+
+    def _release_memories(self) -> None:
+        self._slots = []
+
+        for memory in self._memories:
+            try:
+                memory.close()
+            except BufferError:
+                # A view is still alive, the mapping is released with it
+                pass
+            memory.unlink()
+        self._memories = []
+
+    def close(self) -> None:
+        """
+        Release the shared memory once every frame is released
+        """
+        with self.lock:
+            self._closed = True
+
+            if not any(self._used):
+                self._release_memories()
@@ -1,23 +1,36 @@
+import asyncio
 import cv2
 import datetime
-import face_recognition
+import logging
+import numpy as np
 import select
 import socket
 import struct
+import time
 
 from app.cameras import BaseThread, FrameHandler, VideoStream
+from app.cameras.motion import MotionGate
+from app.cameras.rates import RateController
+from app.cameras.regions import RegionMask
+from app.cameras.tracking import FaceTracker, iou
 from app.controllers.recognition import RecognitionController
 from app.constants import SOCKET_DIR
 from app.database import SessionLocal
+from app.inference import crop, engine, map_locations, scale_locations
+from app.inference.detectors import Location
+from app.inference.limiter import limiter
+from app.inference.scheduler import scheduler
 from app.models.cameras import Camera
 from app.mqtt import client as mqtt
 from app.schemas.recognition import Recognition
 from datetime import datetime
 from pathlib import Path
-from typing import Union
+from typing import Any, List, Optional, Tuple, Union
 
 
 class RecognitionHandler(FrameHandler):
+    executor = 'inference'
+
     def __init__(
         self,
         stream: VideoStream,
@@ -25,6 +38,15 @@ class RecognitionHandler(FrameHandler):
         record: bool = False,
         record_timeout: int = 30,
         record_increase_timeout: int = 15,
+        motion_threshold: float = 0.0,
+        motion_fps: float = 1.0,
+        stats_interval: int = 60,
+        face_tracker: Optional[FaceTracker] = None,
+        full_resolution: bool = True,
+        rates: Optional[RateController] = None,
+        max_delay: float = 2.0,
+        main_stream: Optional[VideoStream] = None,
+        snapshot_timeout: float = 0.5,
     ):
         super().__init__(stream, max_queue_size=0)
 
@@ -33,12 +55,33 @@ class RecognitionHandler(FrameHandler):
         self._record = record
         self._record_timeout = record_timeout
         self._record_increase_timeout = record_increase_timeout
+        self._motion_gate = MotionGate(motion_threshold)
+        self._motion_fps = motion_fps
+        self._stats_interval = stats_interval
+        self._stats_timestamp = time.monotonic()
+        self._faces = face_tracker or FaceTracker()
+        self._full_resolution = full_resolution
+        self._regions = RegionMask(stream.camera.regions)
+        self._rates = rates
+        self._max_delay = max_delay
+        self._detect_at = 0.0
+        self._cost: Optional[float] = None
+
+        # Recognition may run on a substream, the main stream is recorded and used to identify faces
+        self._main_stream = main_stream or stream
+        self._snapshot_timeout = snapshot_timeout
+
+        if rates:
+            rates.register(stream.camera_id)
+        self._encoded = 0
+        self._reused = 0
 
     def __del__(self):
         self._db.close()
 
-    def _publish_mqtt(self, recognition: Recognition):
+    def _publish_mqtt(self, recognition: Recognition, track: int):
         return mqtt.publish('detection', {
+            'track': track,
             'camera': {
                 'id': self._stream.camera_id,
                 'name': self._stream.camera_name,
@@ -49,9 +92,159 @@ class RecognitionHandler(FrameHandler):
                 'last_name': recognition.identity.last_name,
             } if recognition.identity else None,
             'score': recognition.score,
+            'candidates': [
+                {
+                    'id': str(candidate.identity.id),
+                    'score': candidate.score,
+                    'votes': candidate.votes,
+                } for candidate in recognition.candidates
+            ],
         })
 
+    @property
+    def stats(self) -> dict:
+        return {
+            'gated': self._motion_gate.gated,
+            'processed': self._motion_gate.processed,
+            'encoded': self._encoded,
+            'reused': self._reused,
+            'dropped': limiter.stats().get(self._stream.camera_id, {}).get('dropped', 0),
+            **({
+                'fps': self._rates.rate(self._stream.camera_id),
+                'budget': self._rates.usage().get(self._stream.camera_id, 0.0),
+            } if self._rates else {}),
+        }
+
+    def _publish_stats(self):
+        now = time.monotonic()
+
+        if now - self._stats_timestamp >= self._stats_interval:
+            self._stats_timestamp = now
+            self._logger.debug(
+                'Gated %(gated)d frames, processed %(processed)d frames, encoded %(encoded)d faces, reused %(reused)d identities',
+                self.stats,
+            )
+            mqtt.publish('stats', {
+                'camera': {
+                    'id': self._stream.camera_id,
+                    'name': self._stream.camera_name,
+                },
+                **self.stats,
+            })
+
+    @property
+    def max_fps(self) -> Optional[float]:
+        if not self._rates:
+            return None
+
+        # Motion is checked at its own rate, faces are detected at the rate of the camera
+        rate = self._rates.rate(self._stream.camera_id)
+        return max(rate, self._motion_fps) if self._motion_gate.enabled else rate
+
     def process(self, frame: any):
+        self._publish_stats()
+        self._cost = None
+        active = self._process(frame)
+
+        # Frames only checked for motion between two detections are not reported
+        if self._rates and active is not None:
+            self._rates.report(self._stream.camera_id, active, self._cost)
+
+    def _work(self, function, *args, **kwargs):
+        """
+        Run a detection or identification step, its duration is counted in the cost of the frame
+        """
+        start = time.monotonic()
+
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._cost = (self._cost or 0.0) + time.monotonic() - start
+
+    def _process(self, frame: any) -> Optional[bool]:
+        """
+        Process a frame, return True if faces or motion were found, None if the detection is not due
+        """
+        # Only keep the bounding box of the regions of interest
+        shape = frame.shape
+        frame, (offset_top, offset_left) = self._regions.crop(frame)
+        self._tracker.add('Regions')
+
+        # Skip the frames without motion
+        moving = self._motion_gate.check(frame)
+        self._tracker.add('Motion gate')
+
+        if not moving:
+            self._faces.expire()
+            return False
+
+        # Motion is checked at its own rate, only detect the faces at the rate of the camera
+        if self._rates and self._motion_gate.enabled:
+            interval = 1.0 / self._rates.rate(self._stream.camera_id)
+
+            # Compare the arrival times of the frames, with a tolerance for the jitter of the queue
+            if self._received_at < self._detect_at - 0.1 * interval:
+                return None
+
+            self._detect_at = max(self._detect_at, self._received_at - 0.5 * interval) + interval
+
+        return self._recognize(frame, shape, (offset_top, offset_left))
+
+    def _slot(self, deadline: Optional[float] = None):
+        """
+        Inference slot of the camera, only held during the inference calls
+        """
+        return limiter.slot(self._stream.camera_id, self._stream.camera.priority or 0, deadline)
+
+    def _identification_frame(self, image: any, locations: List[Location], shape: Tuple[int, ...], offset: Tuple[int, int]) -> Tuple[any, List[Location]]:
+        """
+        Frame and locations to identify faces on, from the main stream when the recognition runs on a substream
+        """
+        if self._main_stream is self._stream or not self._full_resolution:
+            return image, locations
+
+        frame = self._main_stream.snapshot(self._snapshot_timeout)
+        self._tracker.add('Main stream frame')
+
+        if frame is None:
+            self._logger.debug('No frame read from the main stream, identifying on the substream')
+            return image, locations
+
+        # Locations are relative to the crop of the substream frame, whose aspect ratio may differ
+        return frame, self._align(frame, map_locations(
+            list((top + offset[0], right + offset[1], bottom + offset[0], left + offset[1]) for top, right, bottom, left in locations),
+            shape,
+            frame.shape,
+        ))
+
+    def _align(self, frame: any, locations: List[Location]) -> List[Location]:
+        """
+        Detect the faces again around their mapped locations, the main stream frame is read after the substream one
+        """
+        aligned = []
+
+        with self._slot():
+            for location in locations:
+                face_crop, (relative,) = crop(frame, [location])
+                found = self._work(engine.detect, face_crop, self._stream.camera.detector)
+                best = max(found, key=lambda rect: iou(rect, relative), default=None)
+
+                if best is None or iou(best, relative) <= 0:
+                    # The face moved too far or is not detected on the main stream, keep the mapped location
+                    aligned.append(location)
+                    continue
+
+                top = location[0] - relative[0]
+                left = location[3] - relative[3]
+                aligned.append((best[0] + top, best[1] + left, best[2] + top, best[3] + left))
+
+        self._tracker.add('Align')
+        return aligned
+
+    def _recognize(self, frame: any, shape: Tuple[int, ...], offset: Tuple[int, int]) -> bool:
+        """
+        Detect and identify the faces of a frame cropped at the offset of a frame of the given shape
+        """
         # Resize the frame if required
         if frame.shape[1] > self._max_width:
             ratio = self._max_width / frame.shape[1]
@@ -61,31 +254,98 @@ class RecognitionHandler(FrameHandler):
             image = frame
         self._tracker.add('Resize')
 
-        # Fetch locations
-        locations = face_recognition.face_locations(image)
-        self._tracker.add('Fetch locations')
+        # Wait for an inference slot, drop the frame if it is too late
+        deadline = self._received_at + self._max_delay if self._max_delay > 0 else None
+
+        with self._slot(deadline) as granted:
+            self._tracker.add('Wait')
+
+            if not granted:
+                self._logger.debug('Dropping frame received %.02f seconds ago', time.monotonic() - self._received_at)
+                self._faces.expire()
+                return False
+
+            # Fetch locations
+            locations = self._work(scheduler.detect, image, self._stream.camera.detector)
+            self._tracker.add('Fetch locations')
+
+        # Locations on the full resolution frame
+        frame_locations = scale_locations(locations, ratio, frame.shape) if ratio != 1 else locations
+
+        # Discard the faces outside of the regions of interest
+        if self._regions.enabled:
+            keep = list(
+                index for index, location in enumerate(frame_locations)
+                if self._regions.contains(location, shape, offset)
+            )
+            locations = list(locations[index] for index in keep)
+            frame_locations = list(frame_locations[index] for index in keep)
+
+        # Encode and store the faces from the full resolution frame
+        if self._full_resolution:
+            locations = frame_locations
+            image = frame
 
         if len(locations):
             # Start recording if locations found
             if self._record:
-                if not self._stream.recording:
-                    self._stream.start_record(self._record_timeout)
-                else:
-                    self._stream.increase_record(self._record_increase_timeout)
-
-            # Fetch identities
-            result = RecognitionController.query(self._db, image, locations)
-
-            for recognition in result.recognitions:
-                if recognition.identity:
-                    self._logger.info('Found %s with score of %.02f %%', recognition.identity.first_name, recognition.score * 100)
+                if not self._main_stream.recording:
+                    self._main_stream.start_record(self._record_timeout)
                 else:
-                    self._logger.info('Found unknown person')
-                self._publish_mqtt(recognition)
-            self._tracker.add('Identify')
+                    self._main_stream.increase_record(self._record_increase_timeout)
+
+        # Follow the faces and only identify the new or uncertain ones
+        tracks = self._faces.update(locations)
+        pending = [index for index, track in enumerate(tracks) if self._faces.needs_identification(track)]
+        self._reused += len(tracks) - len(pending)
+        self._tracker.add('Track')
+
+        if pending:
+            image, pending_locations = self._identification_frame(image, [locations[index] for index in pending], shape, offset)
+            face_crop, crop_locations = crop(image, pending_locations)
+
+            with self._slot():
+                encodings = self._work(engine.encode, face_crop, crop_locations)
+            self._encoded += len(pending)
+            self._tracker.add('Encode')
+
+            if len(encodings) == len(pending):
+                for position, index in reversed(list(enumerate(pending))):
+                    resumed = self._faces.resume(tracks[index], encodings[position])
+
+                    if resumed is not None:
+                        self._logger.debug('Resumed track %d', resumed.id)
+                        del pending[position]
+                        del pending_locations[position]
+                        del encodings[position]
+                self._tracker.add('Resume')
+
+                if pending:
+                    # Fetch identities
+                    result = self._work(
+                        RecognitionController.query,
+                        self._db,
+                        image,
+                        pending_locations,
+                        encodings=np.asarray(encodings, dtype=np.float32),
+                    )
+
+                    for index, recognition, encoding in zip(pending, result.recognitions, encodings):
+                        tracks[index].identify(recognition, encoding)
+
+                        if recognition.identity:
+                            self._logger.info('Found %s with score of %.02f %%', recognition.identity.first_name, recognition.score * 100)
+                        else:
+                            self._logger.info('Found unknown person')
+                        self._publish_mqtt(recognition, tracks[index].id)
+                    self._tracker.add('Identify')
+            else:
+                self._logger.warning('Unable to encode %d faces', len(pending))
 
         self._tracker.show_inline(fn=self._logger.debug)
 
+        return bool(locations) or self._motion_gate.enabled
+
 
 class StreamServer(BaseThread):
     def __init__(self, socket_file: Path):
@@ -180,6 +440,93 @@ class StreamServer(BaseThread):
         return self._clients
 
 
+class AsyncStreamServer:
+    """
+    Unix socket server sending the frames to its clients from the event loop of a supervisor
+
+    Frames are sent from any thread, clients whose buffer is above
+    `max_buffer_size` are too slow to keep up and miss the frame.
+    """
+    def __init__(self, socket_file: Path, max_buffer_size: int = 4 * 1024 * 1024):
+        self._socket_file = socket_file
+        self._max_buffer_size = max_buffer_size
+        self._server = None
+        self._loop = None
+        self._clients: List[asyncio.StreamWriter] = []
+        self._logger = logging.getLogger('{}.{}({})'.format(
+            __name__,
+            self.__class__.__name__,
+            socket_file
+        ))
+
+    async def start(self) -> None:
+        if self._server is not None:
+            raise Exception('Server already running')
+
+        if not self._socket_file.parent.exists():
+            self._logger.debug('Creating streams directory %s', self._socket_file.parent)
+            self._socket_file.parent.mkdir(parents=True)
+
+        if self._socket_file.exists():
+            self._socket_file.unlink()
+
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_unix_server(self._connected, path=str(self._socket_file))
+
+    async def _connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._logger.debug('New connection')
+        self._clients.append(writer)
+
+        try:
+            while await reader.read(1024):
+                pass
+        except OSError:
+            pass
+        finally:
+            self._logger.debug('Client disconnected')
+            if writer in self._clients:
+                self._clients.remove(writer)
+            writer.close()
+
+    def _send(self, data: bytes) -> None:
+        for client in list(self._clients):
+            if client.is_closing():
+                continue
+
+            if client.transport.get_write_buffer_size() > self._max_buffer_size:
+                continue
+
+            client.write(data)
+
+    def send_to_clients(self, jpeg_bytes):
+        if self._loop is None or self._loop.is_closed():
+            return
+
+        size = len(jpeg_bytes)
+        self._loop.call_soon_threadsafe(self._send, struct.pack('>L', size) + jpeg_bytes)
+
+    @property
+    def clients(self):
+        return self._clients
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+        # Close all clients connections
+        for client in self._clients:
+            client.close()
+        self._clients = []
+
+        if self._socket_file.exists():
+            self._logger.debug('Deleting socket %s', self._socket_file)
+            self._socket_file.unlink()
+
+
 class SocketHandler(FrameHandler):
     @classmethod
     def socket_file(cls, src: Union[VideoStream, Camera]) -> Path:
@@ -192,31 +539,32 @@ class SocketHandler(FrameHandler):
 
         return SOCKET_DIR / f'{id}.sock'
 
-    def __init__(self, stream: VideoStream, max_width: int = 0):
+    def __init__(self, stream: VideoStream, max_width: int = 0, server: Optional[Any] = None):
         super().__init__(stream, max_queue_size=1)
 
-        self._server = StreamServer(self.socket_file(stream))
+        # Any server sending the frames to the clients of the socket, a thread by default
+        self._server = server or StreamServer(self.socket_file(stream))
         self._max_width = max_width
 
-    def start(self) -> None:
-        self._server.start()
-        return super().start()
+    def open(self) -> None:
+        if isinstance(self._server, StreamServer):
+            self._server.start()
 
-    def run(self):
-        super().run()
-
-        self._server.stop()
-        self._server.join()
+    def close(self) -> None:
+        if isinstance(self._server, StreamServer):
+            self._server.stop()
+            self._server.join()
 
     def process(self, frame: any):
         if self._server.clients:
-            frame = frame.copy()
-            self._tracker.add('Copy frame')
-
+            # Frames are shared with the other handlers, draw on a resized frame or a copy
             if self._max_width > 0 and frame.shape[1] > self._max_width:
                 ratio = self._max_width / frame.shape[1]
                 frame = cv2.resize(frame, (0, 0), fx=ratio, fy=ratio)
                 self._tracker.add('Resize frame')
+            else:
+                frame = frame.copy()
+                self._tracker.add('Copy frame')
 
             font = cv2.FONT_HERSHEY_COMPLEX
             scale = 1.5
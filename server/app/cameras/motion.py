@@ -0,0 +1,62 @@
+import cv2
+import numpy as np
+
+from typing import Optional
+
+
+class MotionGate:
+    """
+    Tell whether a frame changed enough from the recent ones to be processed
+
+    Frames are downscaled to `width` pixels wide, converted to grayscale,
+    blurred and compared to a running average of the previous frames so
+    that slow lighting changes do not count as motion. A frame passes the
+    gate when more than `threshold` of its pixels differ by more than
+    `pixel_threshold` gray levels.
+    """
+    def __init__(self, threshold: float = 0.01, pixel_threshold: int = 25, width: int = 64, learning_rate: float = 0.1):
+        self._threshold = threshold
+        self._pixel_threshold = pixel_threshold
+        self._width = width
+        self._learning_rate = learning_rate
+        self._background: Optional[np.ndarray] = None
+        self.gated = 0
+        self.processed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._threshold > 0
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        height = max(1, int(frame.shape[0] * self._width / frame.shape[1]))
+        image = cv2.resize(frame, (self._width, height), interpolation=cv2.INTER_AREA)
+
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        return cv2.GaussianBlur(image, (5, 5), 0).astype(np.float32)
+
+    def check(self, frame: np.ndarray) -> bool:
+        """
+        Return True if the frame has to be processed
+        """
+        if not self.enabled:
+            self.processed += 1
+            return True
+
+        image = self._prepare(frame)
+
+        if self._background is None or self._background.shape != image.shape:
+            self._background = image
+            self.processed += 1
+            return True
+
+        changed = np.count_nonzero(cv2.absdiff(image, self._background) > self._pixel_threshold) / image.size
+        cv2.accumulateWeighted(image, self._background, self._learning_rate)
+
+        if changed < self._threshold:
+            self.gated += 1
+            return False
+
+        self.processed += 1
+        return True
@@ -0,0 +1,91 @@
+import math
+import threading
+import time
+
+from typing import Dict, Optional
+
+
+class RateController:
+    """
+    Share a processing budget between cameras according to their activity
+
+    A camera runs at `active_fps` while faces or motion are reported and
+    its rate decays back to `idle_fps` with a `decay` seconds time constant
+    once it becomes idle. The cost of a processed frame, its detection and
+    identification time, is measured for each camera and, when the wanted
+    rates would take more than `budget` processing seconds per second, the
+    rates above `idle_fps` are scaled down.
+    """
+    def __init__(self, idle_fps: float = 0.2, active_fps: float = 1.0, budget: float = 1.0, decay: float = 10.0, smoothing: float = 0.2):
+        self._idle_fps = idle_fps
+        self._active_fps = max(idle_fps, active_fps)
+        self._budget = budget
+        self._decay = decay
+        self._smoothing = smoothing
+        self._lock = threading.Lock()
+        self._cameras: Dict[str, Dict[str, Optional[float]]] = {}
+
+    def register(self, camera_id: str) -> None:
+        with self._lock:
+            self._cameras.setdefault(camera_id, {
+                'active_at': None,
+                'cost': 0.0,
+            })
+
+    def report(self, camera_id: str, active: bool, duration: Optional[float] = None) -> None:
+        """
+        Record whether the camera is active and the processing time of a frame, if processed
+        """
+        with self._lock:
+            camera = self._cameras[camera_id]
+
+            if duration is not None:
+                if camera['cost']:
+                    camera['cost'] += self._smoothing * (duration - camera['cost'])
+                else:
+                    camera['cost'] = duration
+
+            if active:
+                camera['active_at'] = time.monotonic()
+
+    def _wanted(self, camera: Dict[str, Optional[float]], now: float) -> float:
+        if camera['active_at'] is None:
+            return self._idle_fps
+
+        idle = now - camera['active_at']
+        return self._idle_fps + (self._active_fps - self._idle_fps) * math.exp(-idle / self._decay)
+
+    def rates(self) -> Dict[str, float]:
+        """
+        Current rate of each camera, in frames per second
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            wanted = {camera_id: self._wanted(camera, now) for camera_id, camera in self._cameras.items()}
+            costs = {camera_id: camera['cost'] for camera_id, camera in self._cameras.items()}
+
+        # Scale down the rates above the idle rate to fit the budget
+        idle = sum(self._idle_fps * costs[camera_id] for camera_id in wanted)
+        extra = sum((rate - self._idle_fps) * costs[camera_id] for camera_id, rate in wanted.items())
+
+        if extra > 0 and idle + extra > self._budget:
+            ratio = max(0.0, self._budget - idle) / extra
+            wanted = {camera_id: self._idle_fps + (rate - self._idle_fps) * ratio for camera_id, rate in wanted.items()}
+
+        return wanted
+
+    def rate(self, camera_id: str) -> float:
+        return self.rates().get(camera_id, self._idle_fps)
+
+    def usage(self) -> Dict[str, float]:
+        """
+        Fraction of the budget used by each camera at its current rate
+        """
+        rates = self.rates()
+
+        with self._lock:
+            return {
+                camera_id: rate * self._cameras[camera_id]['cost'] / self._budget if self._budget > 0 else 0.0
+                for camera_id, rate in rates.items()
+            }
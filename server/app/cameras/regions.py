@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+from typing import List, Optional, Sequence, Tuple
+
+
+Polygon = Sequence[Tuple[float, float]]
+
+
+class RegionMask:
+    """
+    Regions of interest of a camera
+
+    Regions are polygons of (x, y) points relative to the frame size, so
+    that they do not depend on the stream resolution. Without region, the
+    whole frame is processed.
+    """
+    def __init__(self, regions: Optional[Sequence[Polygon]] = None):
+        self._regions = list(np.asarray(region, dtype=np.float32).reshape(-1, 2) for region in regions or [])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._regions)
+
+    def _polygons(self, shape: Tuple[int, ...]) -> List[np.ndarray]:
+        height, width = shape[:2]
+        return list(region * np.array([width, height], dtype=np.float32) for region in self._regions)
+
+    def bounds(self, shape: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+        """
+        Bounding box of the regions on a frame, as (top, right, bottom, left)
+        """
+        height, width = shape[:2]
+
+        if not self.enabled:
+            return 0, width, height, 0
+
+        points = np.concatenate(self._polygons(shape))
+        left, top = np.floor(points.min(axis=0)).astype(int)
+        right, bottom = np.ceil(points.max(axis=0)).astype(int)
+
+        return max(0, top), min(width, right), min(height, bottom), max(0, left)
+
+    def crop(self, frame: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        Crop a frame to the bounding box of the regions, return the crop and its (top, left) offset
+        """
+        top, right, bottom, left = self.bounds(frame.shape)
+
+        if (top, right, bottom, left) == (0, frame.shape[1], frame.shape[0], 0):
+            return frame, (0, 0)
+
+        return np.ascontiguousarray(frame[top:bottom, left:right]), (top, left)
+
+    def contains(self, location: Tuple[int, int, int, int], shape: Tuple[int, ...], offset: Tuple[int, int] = (0, 0)) -> bool:
+        """
+        Tell whether the center of a (top, right, bottom, left) location is inside a region
+
+        The location is relative to a crop of the frame starting at the (top, left) offset.
+        """
+        if not self.enabled:
+            return True
+
+        top, right, bottom, left = location
+        center = ((left + right) / 2 + offset[1], (top + bottom) / 2 + offset[0])
+
+        return any(cv2.pointPolygonTest(polygon, center, False) >= 0 for polygon in self._polygons(shape))
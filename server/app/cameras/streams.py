@@ -1,13 +1,30 @@
 import cv2
+import numpy as np
+import os
+import subprocess
 import time
 
 from app.cameras import VideoStream
-from typing import Tuple
+from app.models.cameras import Camera
+from typing import List, Optional, Tuple
 
 
 class NetworkStream(VideoStream):
+    """
+    Stream read with OpenCV
+
+    Every frame is decoded to keep the decoder in sync, skipped frames only
+    save their colour conversion and copy. The ffmpeg backend with key frames
+    only decoding skips the decoding of the frames instead.
+    """
     _cap = None
-    _retry_delay = 1.0
+
+    def __init__(self, camera: Camera, ring_slots: int = 8, shared_frames: bool = False, detection: bool = False):
+        super().__init__(camera, ring_slots, shared_frames)
+
+        # Read the detection substream of the camera instead of its main stream
+        self._url = camera.detection_url if detection else camera.url
+        self._full_url = camera.full_detection_url if detection else camera.full_url
 
     def get_size(self) -> Tuple[int, int]:
         return (
@@ -15,32 +32,237 @@ class NetworkStream(VideoStream):
             int(self._cap.get(4))
         )
 
-    def next(self):
-        if not self._cap:
-            self._logger.debug('Opening capture from URL %s', self._camera.url)
-            self._cap = cv2.VideoCapture(self._camera.full_url)
+    def close(self) -> None:
+        if self._cap:
+            self._cap.release()
+            self._cap = None
+
+    @property
+    def connected(self) -> bool:
+        return self._cap is not None
 
-        if not self._cap.isOpened():
+    def connect(self) -> bool:
+        self._logger.debug('Opening capture from URL %s', self._url)
+        cap = cv2.VideoCapture(self._full_url)
+
+        if not cap.isOpened():
             self._logger.error(
                 'Unable to open capture from URL %s. Waiting %d seconds',
-                self._camera.url,
+                self._url,
                 self._retry_delay
             )
+            cap.release()
+            return False
+
+        self._cap = cap
+        return True
+
+    def next(self, retrieve: bool = True):
+        if not self._cap and not self.connect():
+            if self._running:
+                time.sleep(self._retry_delay)
+            return False
+
+        # grab() demuxes and decodes the frame, retrieve() only converts and copies the used ones
+        if not self._cap.grab():
+            self._logger.error('Unable to read frame, reset connection')
             self._cap.release()
             self._cap = None
+            return False
 
-            try:
-                if self._running:
-                    time.sleep(self._retry_delay)
-            finally:
-                return False
+        if not retrieve:
+            return None
 
-        ret, frame = self._cap.read()
+        ret, frame = self._cap.retrieve()
 
         if not ret:
-            self._logger.error('Unable to read frame, reset connection')
+            self._logger.error('Unable to decode frame, reset connection')
             self._cap.release()
             self._cap = None
             return False
 
         return frame
+
+
+class FFmpegStream(VideoStream):
+    """
+    Stream decoded by an ffmpeg process writing raw BGR frames to a pipe
+
+    Frames are scaled down to `width` pixels wide if given, decoded with
+    `threads` threads and, with `keyframes_only`, only the key frames are
+    decoded which is enough for a low rate recognition.
+    """
+    def __init__(
+        self,
+        camera: Camera,
+        ring_slots: int = 8,
+        shared_frames: bool = False,
+        detection: bool = False,
+        width: int = 0,
+        threads: int = 0,
+        keyframes_only: bool = False,
+        ffmpeg: str = 'ffmpeg',
+        ffprobe: str = 'ffprobe',
+    ):
+        super().__init__(camera, ring_slots, shared_frames)
+
+        self._url = camera.detection_url if detection else camera.url
+        self._full_url = camera.full_detection_url if detection else camera.full_url
+        self._width = width
+        self._threads = threads
+        self._keyframes_only = keyframes_only
+        self._ffmpeg = ffmpeg
+        self._ffprobe = ffprobe
+        self._process: Optional[subprocess.Popen] = None
+        self._size: Optional[Tuple[int, int]] = None
+        self._scratch: Optional[bytearray] = None
+
+    def _transport_options(self) -> List[str]:
+        return ['-rtsp_transport', 'tcp'] if self._full_url.startswith('rtsp://') else []
+
+    def _input_options(self) -> List[str]:
+        options = self._transport_options()
+
+        if self._threads > 0:
+            options += ['-threads', str(self._threads)]
+
+        if self._keyframes_only:
+            options += ['-skip_frame', 'nokey']
+
+        return options
+
+    def probe(self) -> Tuple[int, int]:
+        """
+        Size of the video of the stream
+        """
+        output = subprocess.run(
+            [
+                self._ffprobe, '-v', 'error', *self._transport_options(),
+                '-select_streams', 'v:0', '-show_entries', 'stream=width,height', '-of', 'csv=p=0',
+                self._full_url,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=30,
+        ).stdout
+        width, height = output.strip().splitlines()[0].split(',')[:2]
+        return int(width), int(height)
+
+    def output_size(self, size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Size of the frames written by ffmpeg for a video of the given size
+        """
+        width, height = size
+
+        if 0 < self._width < width:
+            return self._width, max(2, int(round(height * self._width / width / 2)) * 2)
+
+        return width, height
+
+    def command(self, size: Tuple[int, int]) -> List[str]:
+        width, height = size
+
+        return [
+            self._ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error',
+            *self._input_options(),
+            '-i', self._full_url,
+            '-an', '-vf', f'scale={width}:{height}', '-vsync', '0',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-',
+        ]
+
+    def get_size(self) -> Tuple[int, int]:
+        return self._size
+
+    def _open(self) -> None:
+        self._logger.debug('Opening ffmpeg capture from URL %s', self._url)
+        self._size = self.output_size(self.probe())
+        self._scratch = bytearray(self._size[0] * self._size[1] * 3)
+        self._process = subprocess.Popen(self.command(self._size), stdout=subprocess.PIPE, bufsize=0)
+
+    def close(self) -> None:
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process.stdout.close()
+            self._process = None
+
+    def _read(self, buffer: memoryview) -> bool:
+        offset = 0
+
+        while offset < len(buffer):
+            count = self._process.stdout.readinto(buffer[offset:])
+
+            if not count:
+                return False
+
+            offset += count
+
+        return True
+
+    @property
+    def connected(self) -> bool:
+        return self._process is not None
+
+    def connect(self) -> bool:
+        try:
+            self._open()
+        except (OSError, ValueError, IndexError, subprocess.SubprocessError):
+            self._logger.error(
+                'Unable to open ffmpeg capture from URL %s. Waiting %d seconds',
+                self._url,
+                self._retry_delay
+            )
+            self.close()
+            return False
+
+        return True
+
+    def next(self, retrieve: bool = True):
+        if self._process is None and not self.connect():
+            if self._running:
+                time.sleep(self._retry_delay)
+            return False
+
+        # Every frame is read from the pipe, only the used ones get their own array
+        if retrieve:
+            frame = np.empty((self._size[1], self._size[0], 3), dtype=np.uint8)
+            buffer = memoryview(frame).cast('B')
+        else:
+            frame = None
+            buffer = memoryview(self._scratch)
+
+        if not self._read(buffer):
+            self._logger.error('Unable to read frame, restarting ffmpeg')
+            self.close()
+            return False
+
+        return frame
+
+
+"""
+Capture backends which can be selected for each camera, one for each name of CAPTURE_BACKENDS
+
+FFMPEG_DETECTION_WIDTH and FFMPEG_DETECTION_KEYFRAMES only apply to the detection substream: a
+camera without a `detection_url` identifies the faces on its single stream, which must keep the
+full resolution and every frame for the records and the live view, so it decodes it entirely.
+"""
+BACKENDS = {
+    'opencv': NetworkStream,
+    'ffmpeg': lambda camera, ring_slots=8, shared_frames=False, detection=False: FFmpegStream(
+        camera,
+        ring_slots,
+        shared_frames,
+        detection,
+        width=int(os.getenv('FFMPEG_DETECTION_WIDTH', '0')) if detection else 0,
+        threads=int(os.getenv('FFMPEG_THREADS', '0')),
+        keyframes_only=detection and os.getenv('FFMPEG_DETECTION_KEYFRAMES', 'false').lower() in ('1', 'true', 'yes'),
+    ),
+}
+
+
+def open_stream(camera: Camera, ring_slots: int = 8, shared_frames: bool = False, detection: bool = False) -> VideoStream:
+    """
+    Stream of a camera using its capture backend
+    """
+    return BACKENDS[camera.backend or 'opencv'](camera, ring_slots, shared_frames, detection)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+
+from app.cameras import FrameHandler, VideoStream
+from app.mqtt import client as mqtt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+
+class CameraSupervisor:
+    """
+    Run the streams and their handlers as tasks of a single event loop
+
+    Blocking reads run in the 'capture' executor and handlers run in the
+    executor named by their `executor` attribute, 'handlers' or 'inference',
+    so that the number of threads is bounded whatever the number of cameras.
+    Captures are opened in the 'connect' executor and the retry delays are
+    waited on the loop, so that offline cameras never hold a capture worker.
+    A handler processes its frames one at a time, in the order they were
+    queued. Servers with `start` and `stop` coroutines run on the loop.
+    """
+    def __init__(
+        self,
+        capture_workers: int = 8,
+        handler_workers: int = 4,
+        inference_workers: int = 2,
+        stats_interval: int = 60,
+    ):
+        self._capture_workers = capture_workers
+        self._handler_workers = handler_workers
+        self._inference_workers = inference_workers
+        self._stats_interval = stats_interval
+        self._streams: List[VideoStream] = []
+        self._servers: List[Any] = []
+        self._states: Dict[str, Dict[str, str]] = {}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._loop = None
+        self._stopping = None
+        self._logger = logging.getLogger('{}.{}'.format(__name__, self.__class__.__name__))
+
+    def add_stream(self, stream: VideoStream) -> VideoStream:
+        self._streams.append(stream)
+        return stream
+
+    def add_server(self, server: Any) -> Any:
+        self._servers.append(server)
+        return server
+
+    @staticmethod
+    def _stream_task(stream: VideoStream) -> str:
+        return '{}({})'.format(stream.__class__.__name__, stream.camera_id)
+
+    def _set_state(self, camera_id: str, task: str, state: str) -> None:
+        self._states.setdefault(camera_id, {})[task] = state
+
+    def states(self) -> Dict[str, Dict[str, str]]:
+        """
+        State of the tasks of each camera
+        """
+        return {camera_id: dict(tasks) for camera_id, tasks in self._states.items()}
+
+    async def _sleep(self, delay: float) -> None:
+        """
+        Wait for a delay, or until the supervisor is stopped
+        """
+        try:
+            await asyncio.wait_for(self._stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def stop(self) -> None:
+        """
+        Stop the supervisor, may be called from any thread
+        """
+        if self._loop is None or self._stopping is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _run_stream(self, stream: VideoStream) -> None:
+        task = self._stream_task(stream)
+        self._set_state(stream.camera_id, task, 'starting')
+        stream.attach()
+
+        try:
+            while stream.running and not self._stopping.is_set():
+                if not stream.connected:
+                    if not await self._loop.run_in_executor(self._executors['connect'], stream.connect):
+                        self._set_state(stream.camera_id, task, 'reconnecting')
+                        await self._sleep(stream.retry_delay)
+                        continue
+
+                frame = await self._loop.run_in_executor(self._executors['capture'], stream.step)
+                self._set_state(stream.camera_id, task, 'reconnecting' if frame is False else 'running')
+        except Exception:
+            self._logger.exception('Stream %s failed', task)
+            self._set_state(stream.camera_id, task, 'failed')
+            return
+        finally:
+            stream.stop()
+
+        self._set_state(stream.camera_id, task, 'stopped')
+
+    def _fail(self, stream: VideoStream, handler: FrameHandler) -> None:
+        self._set_state(stream.camera_id, str(handler), 'failed')
+
+        # The stream keeps running, stop queuing frames the handler will never process
+        stream.remove_handler(handler)
+        handler.discard()
+
+    async def _run_handler(self, stream: VideoStream, handler: FrameHandler, event: asyncio.Event) -> None:
+        task = str(handler)
+        executor = self._executors[handler.executor]
+        handler.notify = lambda: self._loop.call_soon_threadsafe(event.set)
+
+        self._set_state(stream.camera_id, task, 'starting')
+
+        try:
+            await self._loop.run_in_executor(executor, handler.open)
+        except Exception:
+            self._logger.exception('Handler %s failed to open', task)
+            handler.notify = None
+            self._fail(stream, handler)
+            return
+
+        try:
+            while True:
+                self._set_state(stream.camera_id, task, 'waiting')
+                item = handler.poll()
+
+                if item is None:
+                    # Process the queued frames once the stream stopped
+                    if not stream.running:
+                        break
+
+                    event.clear()
+
+                    # A frame may have been queued before the event was cleared
+                    item = handler.poll()
+
+                    if item is None:
+                        await event.wait()
+                        continue
+
+                self._set_state(stream.camera_id, task, 'processing')
+                await self._loop.run_in_executor(executor, handler.handle, item)
+        except Exception:
+            self._logger.exception('Handler %s failed', task)
+            self._fail(stream, handler)
+            return
+        finally:
+            handler.notify = None
+            await self._loop.run_in_executor(executor, handler.close)
+
+        self._set_state(stream.camera_id, task, 'stopped')
+
+    async def _supervise(self, stream: VideoStream) -> None:
+        events = list(asyncio.Event() for _ in stream.handlers)
+        handlers = list(
+            asyncio.ensure_future(self._run_handler(stream, handler, event))
+            for handler, event in zip(stream.handlers, events)
+        )
+
+        await self._run_stream(stream)
+
+        # Wake up the handlers waiting for a frame so they process the queued frames and stop
+        for event in events:
+            event.set()
+        await asyncio.gather(*handlers)
+
+        await self._loop.run_in_executor(self._executors['capture'], stream.shutdown)
+
+    async def _report(self) -> None:
+        while not self._stopping.is_set():
+            await self._sleep(self._stats_interval)
+
+            for camera_id, tasks in self.states().items():
+                self._logger.debug('Camera %s: %s', camera_id, ', '.join(
+                    '{} {}'.format(task, state) for task, state in tasks.items()
+                ))
+                mqtt.publish('tasks', {
+                    'camera': {
+                        'id': camera_id,
+                    },
+                    'tasks': tasks,
+                    'timestamp': time.time(),
+                })
+
+    async def run(self) -> None:
+        """
+        Run the streams until they all stopped or the supervisor is stopped
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._executors = {
+            # Reads block on the network, the streams share the workers and take turns between frames
+            'capture': ThreadPoolExecutor(self._capture_workers, 'capture'),
+            # Opening a capture may block for long, the threads are only started while cameras reconnect
+            'connect': ThreadPoolExecutor(max(1, len(self._streams)), 'connect'),
+            'handlers': ThreadPoolExecutor(self._handler_workers, 'handlers'),
+            'inference': ThreadPoolExecutor(self._inference_workers, 'inference'),
+        }
+
+        for server in self._servers:
+            await server.start()
+
+        report = asyncio.ensure_future(self._report())
+
+        try:
+            streams = asyncio.gather(*(self._supervise(stream) for stream in self._streams))
+            stopping = asyncio.ensure_future(self._stopping.wait())
+            await asyncio.wait([streams, stopping], return_when=asyncio.FIRST_COMPLETED)
+
+            # Stop the remaining streams and wait for their handlers to process the queued frames
+            self._stopping.set()
+            await streams
+            stopping.cancel()
+        finally:
+            report.cancel()
+
+            for server in self._servers:
+                await server.stop()
+
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+            self._executors = {}
+
@@ -0,0 +1,189 @@
+import itertools
+import numpy as np
+import time
+
+from app.schemas.recognition import Recognition
+from typing import List, Optional, Tuple
+
+
+def iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    """
+    Intersection over union of two (top, right, bottom, left) rectangles
+    """
+    width = min(a[1], b[1]) - max(a[3], b[3])
+    height = min(a[2], b[2]) - max(a[0], b[0])
+
+    if width <= 0 or height <= 0:
+        return 0.0
+
+    intersection = width * height
+    union = (a[1] - a[3]) * (a[2] - a[0]) + (b[1] - b[3]) * (b[2] - b[0]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class Track:
+    """
+    Face followed across consecutive frames
+    """
+    def __init__(self, id: int, rect: Tuple[int, int, int, int]):
+        self.id = id
+        self.rect = rect
+        self.recognition: Optional[Recognition] = None
+        self.encoding: Optional[np.ndarray] = None
+        self.age = 0
+        self.misses = 0
+        self.seen_at = time.monotonic()
+        self.last_identification = None
+
+    def identify(self, recognition: Recognition, encoding: np.ndarray) -> None:
+        self.recognition = recognition
+        self.encoding = np.asarray(encoding, dtype=np.float32)
+        self.last_identification = self.age
+
+    def confident(self, confidence_threshold: float) -> bool:
+        return (
+            self.recognition is not None
+            and self.recognition.score is not None
+            and self.recognition.score >= confidence_threshold
+        )
+
+
+class FaceTracker:
+    """
+    Associate the detected faces to tracks from one frame to the next
+
+    Detections are greedily matched to the live tracks with the highest
+    IoU. A track is forgotten once missing from `max_misses` processed
+    frames or not seen for `max_age` seconds, as frames without motion
+    are not processed. A track is identified when it starts and, while its confidence
+    stays below `confidence_threshold`, again every `retry_interval` frames;
+    otherwise its last identity is reused. A new track whose encoding is
+    within `embedding_distance` of a recently lost track resumes it, so
+    that a face briefly hidden or moving fast is not identified again.
+    """
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_misses: int = 5,
+        confidence_threshold: float = 0.6,
+        retry_interval: int = 5,
+        embedding_distance: float = 0.4,
+        max_age: float = 5.0,
+    ):
+        self._iou_threshold = iou_threshold
+        self._max_misses = max_misses
+        self._max_age = max_age
+        self._confidence_threshold = confidence_threshold
+        self._retry_interval = retry_interval
+        self._embedding_distance = embedding_distance
+        self._ids = itertools.count(1)
+        self._tracks: List[Track] = []
+
+    @property
+    def tracks(self) -> List[Track]:
+        return list(self._tracks)
+
+    def update(self, rects: List[Tuple[int, int, int, int]]) -> List[Track]:
+        """
+        Return the track of each detected face, in the same order
+        """
+        now = time.monotonic()
+
+        # Forget the tracks not seen for too long before matching them
+        self.expire(now)
+
+        pairs = sorted(
+            (
+                (iou(track.rect, rect), track_index, rect_index)
+                for track_index, track in enumerate(self._tracks)
+                for rect_index, rect in enumerate(rects)
+            ),
+            reverse=True,
+        )
+
+        result: List[Optional[Track]] = [None] * len(rects)
+        matched = set()
+
+        for score, track_index, rect_index in pairs:
+            if score < self._iou_threshold:
+                break
+
+            if track_index in matched or result[rect_index] is not None:
+                continue
+
+            matched.add(track_index)
+            result[rect_index] = self._tracks[track_index]
+
+        # Age the tracks, forget the ones missing for too long
+        tracks = []
+        for track_index, track in enumerate(self._tracks):
+            track.age += 1
+
+            if track_index in matched:
+                track.misses = 0
+                track.seen_at = now
+            else:
+                track.misses += 1
+
+            if track.misses <= self._max_misses:
+                tracks.append(track)
+
+        for rect_index, rect in enumerate(rects):
+            if result[rect_index] is None:
+                result[rect_index] = Track(next(self._ids), rect)
+                tracks.append(result[rect_index])
+            else:
+                result[rect_index].rect = rect
+
+        self._tracks = tracks
+        return result
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """
+        Forget the tracks not seen for more than `max_age` seconds
+        """
+        if self._max_age <= 0:
+            return
+
+        now = time.monotonic() if now is None else now
+        self._tracks = list(track for track in self._tracks if now - track.seen_at <= self._max_age)
+
+    def needs_identification(self, track: Track) -> bool:
+        """
+        Tell whether the face of a track has to be encoded and identified
+        """
+        if track.last_identification is None:
+            return True
+
+        if track.confident(self._confidence_threshold):
+            return False
+
+        return track.age - track.last_identification >= self._retry_interval
+
+    def resume(self, track: Track, encoding: np.ndarray) -> Optional[Track]:
+        """
+        Merge a new track into the nearest lost track, if its encoding is close enough
+        """
+        if self._embedding_distance <= 0 or track.last_identification is not None:
+            return None
+
+        lost = [
+            candidate for candidate in self._tracks
+            if candidate.misses > 0 and candidate.encoding is not None
+        ]
+
+        if not lost:
+            return None
+
+        distances = np.linalg.norm(np.stack([candidate.encoding for candidate in lost]) - encoding, axis=1)
+        nearest = int(np.argmin(distances))
+
+        if distances[nearest] > self._embedding_distance:
+            return None
+
+        resumed = lost[nearest]
+        resumed.rect = track.rect
+        resumed.misses = 0
+        resumed.seen_at = track.seen_at
+        self._tracks.remove(track)
+        return resumed
@@ -6,7 +6,15 @@ def cli():
     pass
 
 
+from .benchmark import benchmark as benchmark_commands
 from .cameras import cameras as cameras_commands
+from .database import database as database_commands
+from .faces import faces as faces_commands
+from .gallery import gallery as gallery_commands
 
 
+cli.add_command(benchmark_commands, 'benchmark')
 cli.add_command(cameras_commands, 'cameras')
+cli.add_command(database_commands, 'database')
+cli.add_command(faces_commands, 'faces')
+cli.add_command(gallery_commands, 'gallery')
@@ -0,0 +1,181 @@
+import click
+import cv2
+import numpy as np
+import resource
+import time
+
+from app.cameras.streams import FFmpegStream, NetworkStream
+from app.commands import cli
+from app.constants import ENCODING_SIZE
+from app.gallery import Gallery
+from app.inference.detectors import DETECTORS
+from app.models.cameras import Camera
+from pathlib import Path
+from uuid import uuid4
+
+
+@cli.group()
+def benchmark():
+    pass
+
+
+def synthetic_encodings(size: int, per_identity: int, rng: np.random.Generator):
+    """
+    Build random encodings clustered by identity
+    """
+    identities = max(1, size // per_identity)
+    centers = rng.normal(0, 0.1, (identities, ENCODING_SIZE)).astype(np.float32)
+    labels = rng.integers(0, identities, size)
+    vectors = centers[labels] + rng.normal(0, 0.03, (size, ENCODING_SIZE)).astype(np.float32)
+
+    return centers, labels, vectors
+
+
+@benchmark.command()
+@click.option('--sizes', default='10000,100000,1000000', help='Comma separated gallery sizes')
+@click.option('--queries', default=1000, help='Number of queries per gallery size')
+@click.option('--per-identity', default=10, help='Average number of encodings per identity')
+@click.option('--seed', default=0, help='Random seed')
+def gallery(sizes: str, queries: int, per_identity: int, seed: int):
+    """
+    Compare the exact and the approximate gallery matchers
+    """
+    rng = np.random.default_rng(seed)
+
+    click.echo('{:>10} {:>12} {:>12} {:>12} {:>10}'.format('size', 'build (s)', 'exact (q/s)', 'ivf (q/s)', 'recall@1'))
+
+    for size in (int(size) for size in sizes.split(',')):
+        centers, labels, vectors = synthetic_encodings(size, per_identity, rng)
+        identity_ids = [uuid4() for i in range(0, centers.shape[0])]
+        targets = rng.integers(0, centers.shape[0], queries)
+        encodings = centers[targets] + rng.normal(0, 0.03, (queries, ENCODING_SIZE)).astype(np.float32)
+
+        result = Gallery(index_min_size=0)
+        result.load_encodings([uuid4() for i in range(0, size)], [identity_ids[label] for label in labels], vectors)
+
+        start = time.perf_counter()
+        result.ensure_index(wait=True)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        exact = list(result.search(encoding, threshold=np.finfo(np.float32).max) for encoding in encodings)
+        exact_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        approximate = list(result.search(encoding, threshold=np.finfo(np.float32).max, approximate=True) for encoding in encodings)
+        approximate_time = time.perf_counter() - start
+
+        recall = sum(
+            1 for expected, found in zip(exact, approximate) if found and found[0] == expected[0]
+        ) / queries
+
+        click.echo('{:>10} {:>12.2f} {:>12.1f} {:>12.1f} {:>10.3f}'.format(
+            size,
+            build_time,
+            queries / exact_time,
+            queries / approximate_time,
+            recall
+        ))
+
+
+@benchmark.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option('--detectors', default=','.join(DETECTORS), help='Comma separated detectors')
+@click.option('--max-width', default=320, help='Width to which the images are downscaled, 0 to keep them')
+@click.option('--repeat', default=3, help='Number of runs per image')
+def detectors(directory: Path, detectors: str, max_width: int, repeat: int):
+    """
+    Compare the face detectors on the images of a directory
+    """
+    images = []
+
+    for image_file in sorted(directory.iterdir()):
+        image = cv2.imread(str(image_file))
+
+        if image is None:
+            continue
+
+        if max_width and image.shape[1] > max_width:
+            ratio = max_width / image.shape[1]
+            image = cv2.resize(image, (0, 0), fx=ratio, fy=ratio)
+
+        images.append(image)
+
+    if not images:
+        raise click.ClickException(f'No image found in {directory}')
+
+    click.echo('{:>8} {:>12} {:>12} {:>12}'.format('detector', 'ms/frame', 'detections', 'with faces'))
+
+    for name in detectors.split(','):
+        try:
+            detector = DETECTORS[name]()
+        except Exception as e:
+            click.echo('{:>8} unavailable: {}'.format(name, e))
+            continue
+
+        # Warm up, some backends initialize lazily
+        locations = list(detector.detect(image) for image in images)
+
+        start = time.perf_counter()
+        for _ in range(0, repeat):
+            for image in images:
+                detector.detect(image)
+        elapsed = time.perf_counter() - start
+
+        click.echo('{:>8} {:>12.2f} {:>12} {:>12}'.format(
+            name,
+            elapsed * 1e3 / (repeat * len(images)),
+            sum(len(image_locations) for image_locations in locations),
+            '{}/{}'.format(sum(1 for image_locations in locations if image_locations), len(images)),
+        ))
+
+
+@benchmark.command()
+@click.argument('url')
+@click.option('--frames', default=250, help='Number of frames to read per backend')
+@click.option('--retrieve-every', default=25, help='Decode one frame out of this number, like a 1 fps handler on a 25 fps stream')
+@click.option('--width', default=0, help='Width to which ffmpeg scales the frames, 0 to keep them')
+@click.option('--threads', default=0, help='Number of ffmpeg decoding threads, 0 for automatic')
+@click.option('--keyframes', is_flag=True, help='Only decode the key frames with ffmpeg')
+def capture(url: str, frames: int, retrieve_every: int, width: int, threads: int, keyframes: bool):
+    """
+    Compare the capture backends on a stream or a video file
+    """
+    camera = Camera(id=uuid4(), label='benchmark', url=url)
+    streams = {
+        'opencv': NetworkStream(camera),
+        'ffmpeg': FFmpegStream(camera, width=width, threads=threads, keyframes_only=keyframes),
+    }
+
+    click.echo('{:>8} {:>10} {:>10} {:>10} {:>12}'.format('backend', 'frames', 'decoded', 'frames/s', 'cpu ms/frame'))
+
+    for name, stream in streams.items():
+        read = decoded = 0
+        start = time.perf_counter()
+        cpu = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        while read < frames:
+            frame = stream.next(retrieve=read % max(1, retrieve_every) == 0)
+
+            if frame is False:
+                break
+
+            read += 1
+            decoded += frame is not None
+
+        elapsed = time.perf_counter() - start
+
+        stream.close()
+
+        used = sum(
+            usage.ru_utime + usage.ru_stime - (before.ru_utime + before.ru_stime)
+            for usage, before in zip((resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)), cpu)
+        )
+
+        click.echo('{:>8} {:>10} {:>10} {:>10.1f} {:>12.2f}'.format(
+            name,
+            read,
+            decoded,
+            read / elapsed if elapsed else 0.0,
+            used * 1e3 / read if read else 0.0,
+        ))
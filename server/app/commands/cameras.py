@@ -1,10 +1,20 @@
+import asyncio
+import click
+import os
 import signal
 
-from app.cameras.handlers import RecognitionHandler, SocketHandler
-from app.cameras.streams import NetworkStream
+from app.cameras.handlers import AsyncStreamServer, RecognitionHandler, SocketHandler
+from app.cameras.rates import RateController
+from app.cameras.streams import open_stream
+from app.cameras.supervisor import CameraSupervisor
+from app.cameras.tracking import FaceTracker
 from app.commands import cli
 from app.controllers.cameras import CameraController
 from app.database import SessionLocal
+from app.gallery.listener import listener as gallery_listener
+from app.inference import engine
+from app.inference.limiter import limiter
+from app.inference.scheduler import scheduler
 from app.mqtt import client as mqtt
 
 
@@ -14,31 +24,128 @@ def cameras():
 
 
 @cameras.command()
-def run():
-    # Intercept SIGINT and stop all threads
-    def signal_handler(*args, **kwargs):
-        for stream in streams:
-            stream.stop()
+@click.option('--threads', is_flag=True, help='Run each stream and handler in its own thread instead of the supervisor')
+def run(threads: bool):
+    # Fraction of changed pixels required to process a frame, 0 processes all the frames
+    motion_threshold = float(os.getenv('MOTION_THRESHOLD', '0.01'))
+
+    # Rate at which the motion is checked, faces are only detected at the recognition rate
+    motion_fps = float(os.getenv('MOTION_FPS', '1'))
+
+    # Recognition rate of each camera, raised while faces or motion are present within a shared budget
+    rates = RateController(
+        idle_fps=float(os.getenv('RECOGNITION_IDLE_FPS', '0.2')),
+        active_fps=float(os.getenv('RECOGNITION_FPS', '1')),
+        budget=float(os.getenv('RECOGNITION_BUDGET', '1.0')),
+        decay=float(os.getenv('RECOGNITION_DECAY', '10')),
+    )
+
+    # Faces are tracked between frames so the detection rate can be raised without identifying them again
+    tracking_iou_threshold = float(os.getenv('TRACKING_IOU_THRESHOLD', '0.3'))
+    tracking_max_misses = int(os.getenv('TRACKING_MAX_MISSES', '5'))
+    tracking_max_age = float(os.getenv('TRACKING_MAX_AGE', '5'))
+
+    # Frames waiting longer for an inference slot are dropped
+    max_delay = float(os.getenv('INFERENCE_MAX_DELAY', '2.0'))
+
+    # Frames are written once to a ring buffer of each stream and shared by its handlers
+    ring_slots = int(os.getenv('FRAME_RING_SLOTS', '8'))
+    shared_frames = os.getenv('FRAME_RING_SHARED', 'false').lower() in ('1', 'true', 'yes')
 
-    signal.signal(signal.SIGINT, signal_handler)
+    # Faces are detected on the downscaled frame but encoded from the full resolution one
+    full_resolution = os.getenv('RECOGNITION_FULL_RESOLUTION', 'true').lower() in ('1', 'true', 'yes')
+
+    # Streams and handlers are run by a supervisor with bounded executors unless threads are requested.
+    # The recognition handlers run in the inference executor, whose threads bound the number of cameras
+    # processing a frame at once. Detections and encodings also hold one of the INFERENCE_MAX_CONCURRENCY
+    # slots, one per INFERENCE_WORKERS process by default, which in turn bounds the number of frames batched
+    # by the scheduler below DETECTION_BATCH_SIZE. Twice as many threads as slots by default, so that the
+    # slots stay busy while the other cameras identify their faces.
+    supervisor = None if threads else CameraSupervisor(
+        capture_workers=int(os.getenv('SUPERVISOR_CAPTURE_WORKERS', '8')),
+        handler_workers=int(os.getenv('SUPERVISOR_HANDLER_WORKERS', '4')),
+        inference_workers=int(os.getenv('SUPERVISOR_INFERENCE_WORKERS', '0')) or 2 * limiter.max_concurrency,
+    )
 
     # Fetch cameras
     db = SessionLocal()
     cameras = CameraController.get_cameras(db)
     db.close()
 
+    # Fork the inference workers before starting any thread
+    engine.start()
+
     # Start threads
     mqtt.start()
-    streams = tuple(NetworkStream(camera) for camera in cameras)
+    gallery_listener.start()
+    scheduler.start()
+    streams = []
+
+    for camera in cameras:
+        stream = open_stream(camera, ring_slots, shared_frames)
+        streams.append(stream)
 
-    for stream in streams:
-        stream.add_handler(RecognitionHandler(stream, record=True), max_fps=1)
-        stream.add_handler(SocketHandler(stream, max_width=800), max_fps=5)
-        stream.start()
+        # Run the recognition on the detection substream if any
+        if camera.detection_url:
+            recognition_stream = open_stream(camera, ring_slots, shared_frames, detection=True)
+            streams.append(recognition_stream)
+        else:
+            recognition_stream = stream
 
-    # Wait end of the threads
-    for stream in streams:
-        stream.join()
+        recognition_stream.add_handler(
+            RecognitionHandler(
+                recognition_stream,
+                record=True,
+                motion_threshold=motion_threshold,
+                motion_fps=motion_fps,
+                face_tracker=FaceTracker(tracking_iou_threshold, tracking_max_misses, max_age=tracking_max_age),
+                full_resolution=full_resolution,
+                rates=rates,
+                max_delay=max_delay,
+                main_stream=stream,
+            ),
+        )
+        stream.add_handler(
+            SocketHandler(
+                stream,
+                max_width=800,
+                server=supervisor.add_server(AsyncStreamServer(SocketHandler.socket_file(stream))) if supervisor else None,
+            ),
+            max_fps=5,
+        )
+
+    if supervisor:
+        for stream in streams:
+            supervisor.add_stream(stream)
+
+        async def supervise():
+            # Intercept SIGINT and stop the supervisor
+            asyncio.get_running_loop().add_signal_handler(signal.SIGINT, supervisor.stop)
+            await supervisor.run()
+
+        asyncio.run(supervise())
+    else:
+        # Intercept SIGINT and stop all threads
+        def signal_handler(*args, **kwargs):
+            for stream in streams:
+                stream.stop()
+
+        signal.signal(signal.SIGINT, signal_handler)
+
+        for stream in streams:
+            stream.start()
+
+        # Wait end of the threads
+        for stream in streams:
+            stream.join()
+
+    scheduler.stop()
+    scheduler.join()
+
+    gallery_listener.stop()
+    gallery_listener.join()
 
     mqtt.stop()
     mqtt.join()
+
+    engine.stop()
@@ -0,0 +1,40 @@
+import click
+
+from app.commands import cli
+from app.constants import MIGRATIONS_DIR
+from app.database import SessionLocal
+
+
+@cli.group()
+def database():
+    pass
+
+
+@database.command()
+def migrate():
+    """
+    Apply the pending SQL migrations
+    """
+    db = SessionLocal()
+
+    try:
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migration (
+                name VARCHAR PRIMARY KEY,
+                applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+        applied = set(row[0] for row in db.execute('SELECT name FROM schema_migration'))
+
+        for migration_file in sorted(MIGRATIONS_DIR.glob('*.sql')):
+            if migration_file.name in applied:
+                continue
+
+            click.echo(f'Applying migration {migration_file.name}')
+            db.connection().exec_driver_sql(migration_file.read_text())
+            db.execute('INSERT INTO schema_migration (name) VALUES (:name)', {'name': migration_file.name})
+            db.commit()
+    finally:
+        db.close()
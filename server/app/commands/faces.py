@@ -0,0 +1,35 @@
+import click
+
+from app.commands import cli
+from app.controllers.identities import IdentityController
+from app.database import SessionLocal
+
+
+@cli.group()
+def faces():
+    pass
+
+
+@faces.command()
+@click.option('--distance', default=0.1, help='Distance below which faces are considered duplicates')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+def compact(distance: float, dry_run: bool):
+    """
+    Remove the near duplicate faces of each identity
+    """
+    db = SessionLocal()
+    total_before = 0
+    total_after = 0
+
+    try:
+        for identity in IdentityController.get_identities(db):
+            before, after = IdentityController.compact_identity_faces(db, identity.id, distance, dry_run)
+            total_before += before
+            total_after += after
+
+            if before != after:
+                click.echo(f'{identity.first_name} {identity.last_name}: {before} -> {after} faces')
+    finally:
+        db.close()
+
+    click.echo(f'Total: {total_before} -> {total_after} faces')
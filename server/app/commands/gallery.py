@@ -0,0 +1,28 @@
+import click
+
+from app.commands import cli
+from app.constants import GALLERY_DIR
+from app.database import SessionLocal
+from app.gallery import gallery as face_gallery, storage
+
+
+@cli.group()
+def gallery():
+    pass
+
+
+@gallery.command()
+def snapshot():
+    """
+    Write a snapshot of the face encodings to be mapped by the other processes
+    """
+    db = SessionLocal()
+
+    try:
+        version = storage.get_version(db)
+        face_gallery.load(db, use_snapshot=False)
+    finally:
+        db.close()
+
+    target = storage.save(GALLERY_DIR, version, face_gallery.to_arrays())
+    click.echo(f'Wrote {len(face_gallery)} face encodings to {target} (version {version})')
@@ -30,7 +30,31 @@ Records directory
 RECORDS_DIR = DATA_DIR / 'records'
 
 
+"""
+Gallery snapshots directory
+"""
+GALLERY_DIR = DATA_DIR / 'gallery'
+
+
 """
 Sockets directory
 """
 SOCKET_DIR = Path('/sockets')
+
+
+"""
+SQL migrations directory
+"""
+MIGRATIONS_DIR = Path(__file__).parent.parent / 'postgresql' / 'migrations'
+
+
+"""
+Capture backends which can be selected for each camera
+"""
+CAPTURE_BACKENDS = ('opencv', 'ffmpeg')
+
+
+"""
+Size of a face encoding
+"""
+ENCODING_SIZE = 128
@@ -71,8 +71,13 @@ class CameraController:
         camera = Camera()
         camera.label = payload.label
         camera.url = payload.url
+        camera.detection_url = payload.detection_url
         camera.username = payload.username
         camera.password = payload.password
+        camera.detector = payload.detector
+        camera.regions = payload.regions
+        camera.priority = payload.priority
+        camera.backend = payload.backend
         
         db.add(camera)
         db.commit()
@@ -84,8 +89,13 @@ class CameraController:
         camera = cls.get_camera(db, id)
         camera.label = payload.label
         camera.url = payload.url
+        camera.detection_url = payload.detection_url
         camera.username = payload.username
         camera.password = payload.password
+        camera.detector = payload.detector
+        camera.regions = payload.regions
+        camera.priority = payload.priority
+        camera.backend = payload.backend
 
         db.commit()
 
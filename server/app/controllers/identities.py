@@ -1,11 +1,14 @@
+import numpy as np
 import shutil
 
 from app.constants import FACES_DIR
+from app.gallery import gallery
+from app.gallery.compaction import near_duplicates
 from app.models.identities import Identity
 from app.models.recognition import FaceEncoding
 from app.schemas.identities import IdentityCreate, IdentityUpdate
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Tuple
 from uuid import UUID
 
 
@@ -59,6 +62,8 @@ class IdentityController:
 
         db.commit()
 
+        gallery.remove_identity(identity.id)
+
     @classmethod
     def delete_identity_face(cls, db: Session, identity_id: UUID, face_id: UUID) -> None:
         identity = cls.get_identity(db, identity_id)
@@ -70,6 +75,8 @@ class IdentityController:
 
         db.commit()
 
+        gallery.remove(face_id)
+
     @classmethod
     def clear_identity(cls, db: Session, id: UUID) -> None:
         identity = cls.get_identity(db, id)
@@ -81,3 +88,34 @@ class IdentityController:
             shutil.rmtree(identity_dir)
 
         db.commit()
+
+        gallery.remove_identity(identity.id)
+
+    @classmethod
+    def compact_identity_faces(cls, db: Session, id: UUID, distance: float = 0.1, dry_run: bool = False) -> Tuple[int, int]:
+        """
+        Remove the faces of an identity which are near duplicates of older ones
+
+        Returns the number of faces before and after the compaction.
+        """
+        faces = db.query(FaceEncoding.id, FaceEncoding.vec).filter_by(identity_id=id).order_by(FaceEncoding.created_at.asc()).all()
+
+        if not faces:
+            return 0, 0
+
+        removed = near_duplicates(np.stack(list(face.vec for face in faces)), distance)
+        face_ids = list(face.id for face, remove in zip(faces, removed) if remove)
+
+        if face_ids and not dry_run:
+            db.query(FaceEncoding).filter(FaceEncoding.id.in_(face_ids)).delete(synchronize_session=False)
+            db.commit()
+
+            for face_id in face_ids:
+                face_path = FACES_DIR / str(id) / f'{face_id}.png'
+
+                if face_path.exists():
+                    face_path.unlink()
+
+            gallery.remove_many(face_ids)
+
+        return len(faces), len(faces) - len(face_ids)
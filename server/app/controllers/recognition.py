@@ -1,17 +1,21 @@
 import base64
 import cv2
-import face_recognition
 import logging
+import numpy as np
+import os
 import shutil
 import uuid
 
 from app.constants import FACES_DIR, QUERIES_DIR, TMP_DIR
+from app.gallery import gallery
+from app.inference import engine
 from app.models.identities import Identity
 from app.models.recognition import FaceEncoding, Query, Suggestion
+from app.models.types import Vector
 from app.schemas.recognition import QueryResult, Recognition
 from fastapi import UploadFile
 from sqlalchemy.orm import Session
-from typing import Any, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 
 logger = logging.getLogger(__name__)
@@ -32,6 +36,27 @@ class MultipleEncodingFoundException(RecognitionException):
 
 
 class RecognitionController:
+    """
+    Matcher used to identify faces: `gallery` (in-memory), `ivf` (in-memory
+    approximate index) or `sql`
+    """
+    matcher = os.getenv('RECOGNITION_MATCHER', 'gallery').lower()
+
+    """
+    Number of candidate identities returned for each face
+    """
+    candidates = int(os.getenv('RECOGNITION_CANDIDATES', '3'))
+
+    """
+    Rank the candidates by the number of their encodings among the nearest ones
+    """
+    vote = os.getenv('RECOGNITION_VOTE', 'false').lower() in ('1', 'true', 'yes')
+
+    """
+    Number of nearest encodings considered to rank the candidates
+    """
+    vote_neighbors = int(os.getenv('RECOGNITION_VOTE_NEIGHBORS', '50'))
+
     @classmethod
     def load_uploaded_file(cls, file: UploadFile) -> Any:
         # TODO do it without temp file ?
@@ -52,11 +77,11 @@ class RecognitionController:
         return image
 
     @classmethod
-    def get_faces_locations(cls, image) -> List[tuple[int, int, int, int]]:
+    def get_faces_locations(cls, image, detector: Optional[str] = None) -> List[tuple[int, int, int, int]]:
         """
         Return faces locations on an image
         """
-        return face_recognition.face_locations(image)
+        return engine.detect(image, detector)
 
     @classmethod
     def create_face_encoding(cls, db: Session, identity: Identity, image, rect: Tuple[int, int, int, int], encoding: Optional[List[float]] = None) -> FaceEncoding:
@@ -64,19 +89,18 @@ class RecognitionController:
         Store known face in database
         """
         if encoding is None:
-            encodings = face_recognition.face_encodings(image, known_face_locations=[rect])
+            encodings = engine.encode(image, [rect])
 
             if not encodings:
                 raise NoEncodingFoundException()
             elif len(encodings) > 1:
                 raise MultipleEncodingFoundException()
 
-            encoding = list(float(s) for s in encodings[0])
+            encoding = np.asarray(encodings[0], dtype=np.float32)
 
         result = FaceEncoding()
         result.identity_id = identity.id
-        result.vec_low =  encoding[0:64]
-        result.vec_high = encoding[64:128]
+        result.vec = encoding
 
         db.add(result)
         db.flush()
@@ -93,10 +117,12 @@ class RecognitionController:
 
         db.commit()
 
+        gallery.add(result.id, identity.id, encoding)
+
         return result
 
     @classmethod
-    def query(cls, db: Session, image: Any, faces: List[tuple[int, int, int, int]], confidence_threshold: float = 0.6, returns_picture: bool = False) -> QueryResult:
+    def query(cls, db: Session, image: Any, faces: List[tuple[int, int, int, int]], confidence_threshold: float = 0.6, returns_picture: bool = False, encodings: Optional[np.ndarray] = None) -> QueryResult:
         """
         Create a new query in database
         """
@@ -110,27 +136,31 @@ class RecognitionController:
         if not query_dir.exists():
             query_dir.mkdir(parents=True)
 
-        # Store the full image
-        if not cv2.imwrite(str(query_dir / 'full.png'), image):
-            db.rollback()
-            raise RecognitionException('Unable to write query full image')
-
         result = {
             'recognitions': [],
             'picture': None
         }
+        stored = False
 
-        for (top, right, bottom, left) in faces:
-            recognition, encoding = cls.identify(db, image, (top, right, bottom, left))
+        for (top, right, bottom, left), (recognition, encoding) in zip(faces, cls.identify_many(db, image, faces, encodings=encodings)):
             result['recognitions'].append(recognition)
 
             # Record the query only if identity is not found or if score is below the confidence threshold
             if recognition.score is None or recognition.score < confidence_threshold:
+                # Store the full image once the query has a suggestion, as a JPEG which is much faster to encode
+                if not stored:
+                    if not cv2.imwrite(str(query_dir / 'full.jpg'), image, [cv2.IMWRITE_JPEG_QUALITY, 95]):
+                        db.rollback()
+                        shutil.rmtree(query_dir)
+                        raise RecognitionException('Unable to write query full image')
+
+                    stored = True
+
                 suggestion = Suggestion()
                 suggestion.query_id = query.id
                 suggestion.rect = [top, right, bottom, left]
-                suggestion.vec_low = encoding[0:64]
-                suggestion.vec_high = encoding[64:128]
+                suggestion.vec = encoding
+                suggestion.candidates = cls.candidates_to_json(recognition)
 
                 if recognition.identity:
                     suggestion.identity_id = recognition.identity.id
@@ -226,6 +256,43 @@ class RecognitionController:
     def get_suggestions(cls, db: Session) -> List[Suggestion]:
         return db.query(Suggestion).all()
 
+    @classmethod
+    def candidates_to_json(cls, recognition: Recognition) -> List[dict]:
+        """
+        Ranked candidates of a recognition as stored with a suggestion
+        """
+        return list(
+            {
+                'identity_id': str(candidate.identity.id),
+                'score': candidate.score,
+                'votes': candidate.votes,
+            } for candidate in recognition.candidates
+        )
+
+    @classmethod
+    def get_suggestions_candidates(cls, db: Session, suggestions: List[Suggestion]) -> Dict[uuid.UUID, List[dict]]:
+        """
+        Ranked candidates of each suggestion with their identities, deleted identities are skipped
+
+        The identities of all the suggestions are loaded with a single query.
+        """
+        identity_ids = set(
+            uuid.UUID(candidate['identity_id']) for suggestion in suggestions for candidate in suggestion.candidates or []
+        )
+        identities = {
+            identity.id: identity for identity in db.query(Identity).filter(Identity.id.in_(identity_ids)).all()
+        } if identity_ids else {}
+
+        return {
+            suggestion.id: list(
+                {
+                    'identity': identities[uuid.UUID(candidate['identity_id'])],
+                    'score': candidate['score'],
+                    'votes': candidate['votes'],
+                } for candidate in suggestion.candidates or [] if uuid.UUID(candidate['identity_id']) in identities
+            ) for suggestion in suggestions
+        }
+
     @classmethod
     def get_suggestion(cls, db: Session, query_id: uuid.UUID, suggestion_id: uuid.UUID) -> Suggestion:
         return db.query(Suggestion).filter_by(query_id=query_id, id=suggestion_id).one()
@@ -244,7 +311,7 @@ class RecognitionController:
         if not identity:
             raise RecognitionException('No identity provided')
 
-        encoding = cls.create_face_encoding(db, identity, image, (0, image.shape[1], image.shape[0], 0), suggestion.vec_low + suggestion.vec_high)
+        encoding = cls.create_face_encoding(db, identity, image, (0, image.shape[1], image.shape[0], 0), suggestion.vec)
 
         cls.delete_suggestion(db, query_id, suggestion_id)
 
@@ -283,8 +350,12 @@ class RecognitionController:
         Recompute all existing suggestions
         """
         for suggestion in cls.get_suggestions(db):
-            image_file = QUERIES_DIR / str(suggestion.query.id) / 'full.png'
-            
+            image_file = QUERIES_DIR / str(suggestion.query.id) / 'full.jpg'
+
+            if not image_file.exists():
+                # Queries recorded before the full images were stored as JPEG
+                image_file = image_file.with_suffix('.png')
+
             if not image_file.exists():
                 logger.warning('No file found for suggestion %s: %s', suggestion.id, image_file)
                 continue
@@ -297,6 +368,7 @@ class RecognitionController:
 
             suggestion.identity_id = new_prediction.identity.id if new_prediction.identity else None
             suggestion.score = new_prediction.score
+            suggestion.candidates = cls.candidates_to_json(new_prediction)
             db.commit()
 
             if suggestion.score is not None and suggestion.score >= confidence_threshold:
@@ -315,45 +387,118 @@ class RecognitionController:
                 )
 
     @classmethod
-    def identify(cls, db: Session, image, rect: Tuple[int, int, int, int], threshold: float = 0.6) -> Tuple[Recognition, List[float]]:
+    def match_sql(cls, db: Session, encoding: List[float], threshold: float = 0.6, k: int = 1, vote: bool = False) -> List[Tuple[uuid.UUID, float, int]]:
+        """
+        Find the k best identities of an encoding using the database
+        """
+        neighbors = max(k, cls.vote_neighbors)
+
+        # An HNSW scan returns at most ef_search rows, raise it to get all the neighbors
+        db.execute(f'SET LOCAL hnsw.ef_search = {int(max(neighbors, 40))}')
+
+        return list(tuple(row) for row in db.execute(
+            f"""
+            SELECT identity_id, MIN(score) AS score, COUNT(*) AS votes
+            FROM (
+                SELECT identity_id, vec <-> CAST(:vec AS VECTOR) AS score
+                FROM face_encoding
+                ORDER BY vec <-> CAST(:vec AS VECTOR) ASC
+                LIMIT :neighbors
+            ) AS nearest
+            WHERE score <= :threshold
+            GROUP BY identity_id
+            ORDER BY {'votes DESC, ' if vote else ''}score ASC
+            LIMIT :k
+            """, {
+                'vec': Vector.to_literal(encoding),
+                'threshold': threshold,
+                'neighbors': neighbors,
+                'k': k,
+            }
+        ).fetchall())
+
+    @classmethod
+    def match_many(cls, db: Session, encodings: List[List[float]], threshold: float = 0.6, k: int = 1, vote: bool = False) -> List[List[Tuple[uuid.UUID, float, int]]]:
+        """
+        Find the k best identities of each encoding with their distance and votes
+        """
+        if cls.matcher in ('gallery', 'ivf'):
+            try:
+                gallery.ensure_loaded(db)
+                return gallery.search_candidates_many(
+                    encodings,
+                    threshold,
+                    k=k,
+                    neighbors=max(k, cls.vote_neighbors),
+                    vote=vote,
+                    approximate=cls.matcher == 'ivf'
+                )
+            except Exception:
+                logger.exception('Unable to use the gallery, falling back to SQL matcher')
+
+        return list(cls.match_sql(db, encoding, threshold, k, vote) for encoding in encodings)
+
+    @classmethod
+    def match(cls, db: Session, encoding: List[float], threshold: float = 0.6, k: int = 1, vote: bool = False) -> List[Tuple[uuid.UUID, float, int]]:
+        """
+        Find the k best identities of an encoding with their distance and votes
+        """
+        return cls.match_many(db, [encoding], threshold, k, vote)[0]
+
+    @classmethod
+    def identify(cls, db: Session, image, rect: Tuple[int, int, int, int], threshold: float = 0.6) -> Tuple[Recognition, np.ndarray]:
         """
         Identify face on a picture
         """
-        encodings = face_recognition.face_encodings(image, known_face_locations=[rect])
+        return cls.identify_many(db, image, [rect], threshold)[0]
+
+    @classmethod
+    def identify_many(cls, db: Session, image, rects: List[Tuple[int, int, int, int]], threshold: float = 0.6, encodings: Optional[np.ndarray] = None) -> List[Tuple[Recognition, np.ndarray]]:
+        """
+        Identify all the faces of a picture at once, encoding them unless their encodings are given
+        """
+        if not rects:
+            return []
 
-        if not encodings:
+        if encodings is None:
+            encodings = engine.encode(image, rects)
+
+        if encodings is None or len(encodings) < len(rects):
             raise NoEncodingFoundException()
-        elif len(encodings) > 1:
+        elif len(encodings) > len(rects):
             raise MultipleEncodingFoundException()
 
-        encoding = list(float(s) for s in encodings[0])
-
-        row = db.execute(
-            """
-            SELECT identity_id, MIN(SQRT(POWER(CUBE(ARRAY[:vec_low]) <-> CUBE(vec_low), 2) + POWER(CUBE(ARRAY[:vec_high]) <-> CUBE(vec_high), 2))) AS score
-            FROM face_encoding
-            WHERE SQRT(POWER(CUBE(ARRAY[:vec_low]) <-> CUBE(vec_low), 2) + POWER(CUBE(ARRAY[:vec_high]) <-> CUBE(vec_high), 2)) <= :threshold
-            GROUP BY 1
-            ORDER BY 2 ASC
-            LIMIT 1
-            """, {
-                'vec_low': encoding[0:64],
-                'vec_high': encoding[64:128],
-                'threshold': threshold,
-            }
-        ).fetchone()
-
-        return Recognition(**{
-            'identity': db.query(Identity).get(row[0]) if row else None,
-            'score': 1 - row[1] if row else None,
-            'rect': {
-                'start': {
-                    'x': rect[3],
-                    'y': rect[0],
-                },
-                'end': {
-                    'x': rect[1],
-                    'y': rect[2],
-                },
-            },
-        }), encoding
+        encodings = np.asarray(encodings, dtype=np.float32)
+        rows = cls.match_many(db, encodings, threshold, max(1, cls.candidates), cls.vote)
+
+        identity_ids = set(candidate[0] for row in rows for candidate in row)
+        identities = {
+            identity.id: identity for identity in db.query(Identity).filter(Identity.id.in_(identity_ids)).all()
+        } if identity_ids else {}
+
+        return list(
+            (
+                Recognition(**{
+                    'identity': identities.get(row[0][0]) if row else None,
+                    'score': 1 - row[0][1] if row else None,
+                    'candidates': [
+                        {
+                            'identity': identities[identity_id],
+                            'score': 1 - distance,
+                            'votes': votes,
+                        } for identity_id, distance, votes in row if identity_id in identities
+                    ],
+                    'rect': {
+                        'start': {
+                            'x': rect[3],
+                            'y': rect[0],
+                        },
+                        'end': {
+                            'x': rect[1],
+                            'y': rect[2],
+                        },
+                    },
+                }),
+                encoding,
+            ) for rect, encoding, row in zip(rects, encodings, rows)
+        )
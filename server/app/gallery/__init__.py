@@ -0,0 +1,524 @@
+import logging
+import numpy as np
+import os
+import threading
+
+from app.constants import ENCODING_SIZE, GALLERY_DIR
+from app.gallery import storage
+from app.gallery.ivf import IVFPQIndex, squared_distances
+from app.models.recognition import FaceEncoding
+from pathlib import Path
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+
+"""
+Face and identity ids are stored as raw 16 bytes UUIDs
+"""
+UUID_DTYPE = np.dtype('V16')
+
+
+class Gallery:
+    """
+    In-memory copy of the known face encodings
+
+    Encodings are stored in one contiguous float32 matrix so that a query is
+    answered with a single vectorized distance computation.
+
+    When the gallery is large enough, the queries are first compared to the
+    centroid of each identity and only the encodings of the nearest
+    `prefilter_candidates` identities are compared exactly. The centroids are
+    updated in place, only for the identities of the added or removed
+    encodings, so a concurrent query may see some of them mid-update.
+
+    Approximate searches use an IVF-PQ index, built once the gallery holds
+    `index_min_size` encodings, to select `index_candidates` encodings which
+    are then compared exactly. The index is trained in the background on a
+    copy of the gallery and the searches are exact until it is ready.
+
+    When a snapshot directory is given, the gallery is mapped from the
+    snapshot file written by `gallery snapshot` if it is up to date with the
+    database instead of being loaded row by row.
+    """
+    def __init__(
+        self,
+        prefilter_candidates: int = 0,
+        prefilter_min_size: int = 0,
+        index_min_size: int = 10000,
+        index_candidates: int = 32,
+        index_probes: int = 8,
+        snapshot_dir: Optional[Path] = None,
+    ):
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._prefilter_candidates = prefilter_candidates
+        self._prefilter_min_size = prefilter_min_size
+        self._index_min_size = index_min_size
+        self._index_candidates = index_candidates
+        self._index_probes = index_probes
+        self._snapshot_dir = snapshot_dir
+        self._next_key = 0
+        self._generation = 0
+        self._index_thread: Optional[threading.Thread] = None
+        self._identities: List[UUID] = []
+        self._labels_by_identity: Dict[UUID, int] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        # An index being built for the previous content is discarded
+        self._generation += 1
+        self._index = None
+        self._keys = np.empty(0, dtype=np.int64)
+        self._face_ids = np.empty(0, dtype=UUID_DTYPE)
+        self._labels = np.empty(0, dtype=np.int32)
+        self._matrix = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._sums = np.empty((0, ENCODING_SIZE), dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.int64)
+        self._centroids = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        self._centroid_norms = np.empty(0, dtype=np.float32)
+        self._identities = []
+        self._labels_by_identity = {}
+
+    def _label(self, identity_id: UUID) -> int:
+        label = self._labels_by_identity.get(identity_id)
+
+        if label is None:
+            label = len(self._identities)
+            self._identities.append(identity_id)
+            self._labels_by_identity[identity_id] = label
+
+        return label
+
+    def _new_keys(self, count: int) -> np.ndarray:
+        keys = np.arange(self._next_key, self._next_key + count, dtype=np.int64)
+        self._next_key += count
+        return keys
+
+    def _reserve(self, size: int) -> None:
+        """
+        Grow the arrays of the identities to hold `size` identities, doubling their capacity
+        """
+        capacity = self._counts.shape[0]
+
+        if size <= capacity:
+            return
+
+        capacity = max(size, 2 * capacity, 64)
+
+        for name in ('_sums', '_counts', '_centroids', '_centroid_norms'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:array.shape[0]] = array
+            setattr(self, name, grown)
+
+    def _update_centroids(self, labels: np.ndarray, vectors: np.ndarray, sign: int) -> None:
+        """
+        Add (or subtract) vectors to the sums of their identities and refresh their centroids
+        """
+        self._reserve(len(self._identities))
+
+        # Only the rows of the identities of the vectors are copied and updated
+        rows, inverse = np.unique(labels, return_inverse=True)
+        sums = self._sums[rows]
+        np.add.at(sums, inverse, sign * vectors.astype(np.float64))
+        counts = self._counts[rows] + sign * np.bincount(inverse, minlength=rows.shape[0])
+
+        self._set_centroids(rows, sums, counts)
+
+    def _set_centroids(self, rows: np.ndarray, sums: np.ndarray, counts: np.ndarray) -> None:
+        centroids = np.zeros((rows.shape[0], ENCODING_SIZE), dtype=np.float32)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+
+        self._sums[rows] = sums
+        self._counts[rows] = counts
+        self._centroids[rows] = centroids
+        self._centroid_norms[rows] = np.einsum('ij,ij->i', centroids, centroids)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return self._matrix.shape[0]
+
+    def clear(self) -> None:
+        """
+        Remove all the encodings but keep the gallery loaded
+        """
+        with self._lock:
+            self._reset()
+
+    def invalidate(self) -> None:
+        """
+        Drop the cached encodings, they will be reloaded on next use
+        """
+        with self._lock:
+            self._loaded = False
+            self._reset()
+
+    def load(self, db: Session, use_snapshot: bool = True) -> None:
+        """
+        Load all the face encodings from the snapshot if up to date or from the database
+        """
+        if use_snapshot and self._snapshot_dir:
+            # Read the version before the rows so that a concurrent change makes the snapshot outdated
+            version = storage.get_version(db)
+            snapshot = storage.load(self._snapshot_dir)
+
+            if snapshot and snapshot[0] == version:
+                self.load_arrays(snapshot[1])
+                self._logger.info('Mapped gallery snapshot version %d', version)
+                return
+
+            self._logger.info('Gallery snapshot is missing or outdated, loading from database')
+
+        rows = db.query(
+            FaceEncoding.id,
+            FaceEncoding.identity_id,
+            FaceEncoding.vec
+        ).all()
+
+        face_ids = []
+        identity_ids = []
+        vectors = []
+
+        for face_id, identity_id, vec in rows:
+            if vec.shape[0] != ENCODING_SIZE:
+                self._logger.warning('Ignoring face encoding %s: invalid size', face_id)
+                continue
+
+            face_ids.append(face_id)
+            identity_ids.append(identity_id)
+            vectors.append(vec)
+
+        self.load_encodings(face_ids, identity_ids, np.stack(vectors) if vectors else [])
+
+    def load_encodings(self, face_ids: Sequence[UUID], identity_ids: Sequence[UUID], vectors: Sequence[Sequence[float]]) -> None:
+        """
+        Replace the content of the gallery
+        """
+        with self._lock:
+            self._reset()
+
+            self._face_ids = np.array(list(face_id.bytes for face_id in face_ids), dtype=UUID_DTYPE)
+            self._labels = np.fromiter((self._label(identity_id) for identity_id in identity_ids), dtype=np.int32, count=len(identity_ids))
+            self._matrix = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+            self._norms = np.einsum('ij,ij->i', self._matrix, self._matrix)
+            self._keys = self._new_keys(self._matrix.shape[0])
+            self._update_centroids(self._labels, self._matrix, 1)
+            self._loaded = True
+
+        self._logger.info('Loaded %d face encodings in gallery', len(face_ids))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Export the content of the gallery as arrays
+        """
+        with self._lock:
+            # The arrays of the identities have spare rows and are updated in place
+            size = len(self._identities)
+
+            return {
+                'face_ids': self._face_ids,
+                'labels': self._labels,
+                'matrix': self._matrix,
+                'norms': self._norms,
+                'identities': np.array(list(identity_id.bytes for identity_id in self._identities), dtype=UUID_DTYPE),
+                'sums': self._sums[:size].copy(),
+                'counts': self._counts[:size].copy(),
+            }
+
+    def load_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        """
+        Replace the content of the gallery with exported arrays
+
+        The arrays are never modified in place so they can be read-only memory maps.
+        """
+        with self._lock:
+            self._reset()
+
+            self._identities = list(UUID(bytes=bytes(identity_id)) for identity_id in arrays['identities'])
+            self._labels_by_identity = dict((identity_id, label) for label, identity_id in enumerate(self._identities))
+            self._face_ids = arrays['face_ids']
+            self._labels = arrays['labels']
+            self._matrix = arrays['matrix']
+            self._norms = arrays['norms']
+            self._keys = self._new_keys(self._matrix.shape[0])
+            self._reserve(len(self._identities))
+            self._set_centroids(np.arange(len(self._identities)), arrays['sums'], arrays['counts'])
+            self._loaded = True
+
+    def ensure_loaded(self, db: Session) -> None:
+        """
+        Load the gallery if not already done
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load(db)
+
+    def add(self, face_id: UUID, identity_id: UUID, encoding: Sequence[float]) -> None:
+        """
+        Add an encoding to a loaded gallery
+        """
+        with self._lock:
+            face_id = np.void(face_id.bytes)
+
+            if not self._loaded or face_id in self._face_ids:
+                return
+
+            vector = np.asarray(encoding, dtype=np.float32).reshape(1, ENCODING_SIZE)
+            label = np.array([self._label(identity_id)], dtype=np.int32)
+            key = self._new_keys(1)
+            self._keys = np.append(self._keys, key)
+            self._face_ids = np.append(self._face_ids, np.array([face_id], dtype=UUID_DTYPE))
+            self._labels = np.append(self._labels, label)
+            self._matrix = np.concatenate((self._matrix, vector))
+            self._norms = np.append(self._norms, np.einsum('ij,ij->i', vector, vector))
+            self._update_centroids(label, vector, 1)
+
+            if self._index is not None:
+                self._index.add(vector, key)
+
+    def _remove_rows(self, mask: np.ndarray) -> None:
+        if not mask.any():
+            return
+
+        self._update_centroids(self._labels[mask], self._matrix[mask], -1)
+        keep = ~mask
+        self._keys = self._keys[keep]
+        self._face_ids = self._face_ids[keep]
+        self._labels = self._labels[keep]
+        self._matrix = np.ascontiguousarray(self._matrix[keep])
+        self._norms = self._norms[keep]
+
+        # Rebuild the index once it mostly holds removed encodings
+        if self._index is not None and len(self._index) > 2 * self._matrix.shape[0]:
+            self._index = None
+
+    def remove(self, face_id: UUID) -> None:
+        """
+        Remove an encoding from a loaded gallery
+        """
+        with self._lock:
+            if self._loaded:
+                self._remove_rows(self._face_ids == np.void(face_id.bytes))
+
+    def remove_many(self, face_ids: Sequence[UUID]) -> None:
+        """
+        Remove several encodings from a loaded gallery at once
+        """
+        removed = np.array(list(face_id.bytes for face_id in face_ids), dtype=UUID_DTYPE)
+
+        with self._lock:
+            if self._loaded:
+                self._remove_rows(np.isin(self._face_ids.view('S16'), removed.view('S16')))
+
+    def remove_identity(self, identity_id: UUID) -> None:
+        """
+        Remove all the encodings of an identity from a loaded gallery
+        """
+        with self._lock:
+            label = self._labels_by_identity.get(identity_id)
+
+            if self._loaded and label is not None:
+                self._remove_rows(self._labels == label)
+
+    def _snapshot(self) -> Tuple[np.ndarray, ...]:
+        with self._lock:
+            return (
+                self._keys,
+                self._labels,
+                self._matrix,
+                self._norms,
+                self._centroids,
+                self._centroid_norms,
+                self._counts,
+                self._identities,
+            )
+
+    @classmethod
+    def _distances(cls, queries: np.ndarray, matrix: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """
+        Euclidean distances between each query and each row of the matrix
+        """
+        return np.sqrt(squared_distances(queries, matrix, norms))
+
+    def _use_prefilter(self, size: int, identities: int) -> bool:
+        return (
+            self._prefilter_candidates > 0
+            and size >= self._prefilter_min_size
+            and identities > self._prefilter_candidates
+        )
+
+    def _build_index(self, generation: int, keys: np.ndarray, matrix: np.ndarray) -> None:
+        """
+        Train an index on a copy of the gallery and swap it in once up to date
+        """
+        try:
+            self._logger.info('Building the gallery index for %d face encodings', matrix.shape[0])
+            index = IVFPQIndex(cells=int(np.sqrt(matrix.shape[0])), probes=self._index_probes)
+            index.train(matrix)
+            index.add(matrix, keys)
+
+            with self._lock:
+                if generation != self._generation:
+                    return
+
+                # Add the encodings added during the training, removed ones are ignored by the searches
+                added = self._keys > keys[-1]
+                if added.any():
+                    index.add(self._matrix[added], self._keys[added])
+
+                self._index = index
+        except Exception:
+            self._logger.exception('Unable to build the gallery index')
+        finally:
+            with self._lock:
+                self._index_thread = None
+
+    def ensure_index(self, wait: bool = False) -> Optional[IVFPQIndex]:
+        """
+        Start building the approximate index if the gallery is large enough, return it once built
+        """
+        with self._lock:
+            size = self._matrix.shape[0]
+
+            if self._index is None and self._index_thread is None and size >= max(self._index_min_size, 256):
+                # Arrays are never modified in place, the current ones are a consistent copy
+                self._index_thread = threading.Thread(
+                    target=self._build_index,
+                    args=(self._generation, self._keys, self._matrix),
+                    name='gallery-index',
+                    daemon=True,
+                )
+                self._index_thread.start()
+
+            thread = self._index_thread
+
+        if wait and thread is not None:
+            thread.join()
+
+        return self._index
+
+    def _compare(self, queries: np.ndarray, approximate: bool) -> Tuple[np.ndarray, np.ndarray, List[UUID]]:
+        """
+        Return the labels and the distances of the encodings compared to each query
+
+        Encodings which are not compared have an infinite distance.
+        """
+        index = self.ensure_index() if approximate else None
+        keys, labels, matrix, norms, centroids, centroid_norms, counts, identities = self._snapshot()
+        count = queries.shape[0]
+
+        if index is not None:
+            # Compare exactly with the candidates of the index which are still in the gallery
+            candidates, _ = index.search(queries, self._index_candidates)
+            rows = np.minimum(np.searchsorted(keys, candidates), keys.shape[0] - 1)
+            diff = matrix[rows] - queries[:, np.newaxis, :]
+            distances = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+            distances[keys[rows] != candidates] = np.inf
+            labels = labels[rows]
+        elif self._use_prefilter(matrix.shape[0], len(identities)):
+            # Keep the identities with the nearest centroids
+            centroid_distances = self._distances(queries, centroids, centroid_norms)
+            centroid_distances[:, counts <= 0] = np.inf
+            candidates = np.argpartition(centroid_distances, self._prefilter_candidates - 1, axis=1)[:, :self._prefilter_candidates]
+            allowed = np.zeros(centroid_distances.shape, dtype=bool)
+            allowed[np.arange(count)[:, np.newaxis], candidates] = True
+
+            # Compare exactly with the encodings of these identities only
+            rows = np.flatnonzero(allowed.any(axis=0)[labels])
+            labels = np.broadcast_to(labels[rows], (count, rows.shape[0]))
+            distances = self._distances(queries, matrix[rows], norms[rows])
+            distances[~allowed[np.arange(count)[:, np.newaxis], labels]] = np.inf
+        else:
+            labels = np.broadcast_to(labels, (count, labels.shape[0]))
+            distances = self._distances(queries, matrix, norms)
+
+        return labels, distances, identities
+
+    def search_many(self, encodings: Sequence[Sequence[float]], threshold: float = 0.6, approximate: bool = False) -> List[Optional[Tuple[UUID, float]]]:
+        """
+        Return the nearest identity and its distance of each encoding if below the threshold
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = queries.shape[0]
+
+        if not len(self):
+            return [None] * count
+
+        labels, distances, identities = self._compare(queries, approximate)
+        best = np.argmin(distances, axis=1)
+        best_labels = labels[np.arange(count), best]
+        best_distances = distances[np.arange(count), best]
+
+        return [
+            (identities[label], float(distance)) if distance <= threshold else None
+            for label, distance in zip(best_labels, best_distances)
+        ]
+
+    def search_candidates_many(
+        self,
+        encodings: Sequence[Sequence[float]],
+        threshold: float = 0.6,
+        k: int = 1,
+        neighbors: int = 50,
+        vote: bool = False,
+        approximate: bool = False,
+    ) -> List[List[Tuple[UUID, float, int]]]:
+        """
+        Return the k best identities of each encoding with their distance and votes
+
+        Only the `neighbors` nearest encodings below the threshold are considered.
+        Each of them is a vote for its identity; identities are ranked by
+        distance, or by votes then distance when `vote` is set.
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        count = queries.shape[0]
+
+        if not len(self):
+            return [[] for i in range(0, count)]
+
+        labels, distances, identities = self._compare(queries, approximate)
+        neighbors = max(1, min(neighbors, distances.shape[1]))
+        nearest = np.argpartition(distances, neighbors - 1, axis=1)[:, :neighbors]
+        result = []
+
+        for query_labels, query_distances in zip(
+            labels[np.arange(count)[:, np.newaxis], nearest],
+            distances[np.arange(count)[:, np.newaxis], nearest],
+        ):
+            order = np.argsort(query_distances, kind='stable')
+            order = order[query_distances[order] <= threshold]
+
+            # First occurrence of an identity is its nearest encoding
+            found, first, votes = np.unique(query_labels[order], return_index=True, return_counts=True)
+            best = query_distances[order][first]
+            ranking = np.lexsort((best, -votes)) if vote else np.argsort(best, kind='stable')
+
+            result.append(list(
+                (identities[found[i]], float(best[i]), int(votes[i])) for i in ranking[:k]
+            ))
+
+        return result
+
+    def search(self, encoding: Sequence[float], threshold: float = 0.6, approximate: bool = False) -> Optional[Tuple[UUID, float]]:
+        """
+        Return the nearest identity and its distance if below the threshold
+        """
+        return self.search_many([encoding], threshold, approximate)[0]
+
+
+gallery = Gallery(
+    prefilter_candidates=int(os.getenv('GALLERY_PREFILTER_CANDIDATES', '10')),
+    prefilter_min_size=int(os.getenv('GALLERY_PREFILTER_MIN_SIZE', '10000')),
+    index_min_size=int(os.getenv('GALLERY_INDEX_MIN_SIZE', '10000')),
+    index_candidates=int(os.getenv('GALLERY_INDEX_CANDIDATES', '32')),
+    index_probes=int(os.getenv('GALLERY_INDEX_PROBES', '8')),
+    snapshot_dir=GALLERY_DIR,
+)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from app.gallery.ivf import squared_distances
+
+
+def near_duplicates(vectors: np.ndarray, distance: float, block_size: int = 256) -> np.ndarray:
+    """
+    Mask of the vectors closer than `distance` to a previous kept vector
+
+    Vectors are visited in order, a vector is kept as representative unless
+    it is a near duplicate of an already kept one.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.einsum('ij,ij->i', vectors, vectors)
+    removed = np.zeros(vectors.shape[0], dtype=bool)
+    squared = distance ** 2
+
+    for start in range(0, vectors.shape[0], block_size):
+        end = min(start + block_size, vectors.shape[0])
+
+        # Resolve the block against itself, in order
+        block = squared_distances(vectors[start:end], vectors[start:end], norms[start:end]) <= squared
+
+        for i in range(0, end - start):
+            if not removed[start + i]:
+                removed[start + i + 1:end] |= block[i, i + 1:]
+
+        # Kept vectors of the block remove their duplicates from the following ones
+        kept = np.flatnonzero(~removed[start:end]) + start
+
+        if kept.size and end < vectors.shape[0]:
+            following = squared_distances(vectors[kept], vectors[end:], norms[end:]) <= squared
+            removed[end:] |= following.any(axis=0)
+
+    return removed
@@ -0,0 +1,199 @@
+import numpy as np
+import threading
+
+from typing import Optional, Tuple
+
+
+def squared_distances(queries: np.ndarray, points: np.ndarray, norms: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Squared euclidean distances between each query and each point
+    """
+    if norms is None:
+        norms = np.einsum('ij,ij->i', points, points)
+
+    squared = norms[np.newaxis, :] - 2 * (queries @ points.T) + np.einsum('ij,ij->i', queries, queries)[:, np.newaxis]
+    return np.maximum(squared, 0, out=squared)
+
+
+def assign(data: np.ndarray, centroids: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+    """
+    Index of the nearest centroid of each point
+    """
+    norms = np.einsum('ij,ij->i', centroids, centroids)
+    result = np.empty(data.shape[0], dtype=np.int32)
+
+    for start in range(0, data.shape[0], chunk_size):
+        chunk = data[start:start + chunk_size]
+        result[start:start + chunk_size] = np.argmin(squared_distances(chunk, centroids, norms), axis=1)
+
+    return result
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd's k-means, returns the centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(data.shape[0], k, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        assignments = assign(data, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.stack([
+            np.bincount(assignments, weights=data[:, dim], minlength=k) for dim in range(data.shape[1])
+        ], axis=1)
+
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+
+        # Restart empty cells from random points
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            centroids[empty] = data[rng.choice(data.shape[0], empty.size, replace=False)]
+
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    Inverted file index with product quantized residuals
+
+    Points are assigned to the nearest of `cells` coarse centroids and the
+    residual to this centroid is stored as `subquantizers` one-byte codes.
+    A search only scans the `probes` cells nearest to the query and ranks
+    their points with precomputed distance tables.
+    """
+    def __init__(self, cells: int, subquantizers: int = 16, probes: int = 8, seed: int = 0):
+        self.cells = cells
+        self.subquantizers = subquantizers
+        self.probes = min(probes, cells)
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._coarse = None
+        self._codebooks = None
+        self._codes = []
+        self._keys = []
+        self._assignments = []
+        self._sorted = None
+
+    @property
+    def trained(self) -> bool:
+        return self._coarse is not None
+
+    def __len__(self) -> int:
+        return sum(keys.shape[0] for keys in self._keys)
+
+    def train(self, data: np.ndarray, sample_size: Optional[int] = None) -> None:
+        """
+        Train the coarse centroids and the residual codebooks on a sample of the points
+        """
+        sample_size = sample_size or max(32 * self.cells, 10000)
+        data = np.asarray(data, dtype=np.float32)
+
+        if data.shape[1] % self.subquantizers:
+            raise ValueError('Dimension must be a multiple of the number of subquantizers')
+
+        if data.shape[0] < max(self.cells, 256):
+            raise ValueError('Not enough points to train the index')
+
+        rng = np.random.default_rng(self.seed)
+        if data.shape[0] > sample_size:
+            data = data[rng.choice(data.shape[0], sample_size, replace=False)]
+
+        self._coarse = kmeans(data, self.cells, seed=self.seed)
+        residuals = data - self._coarse[assign(data, self._coarse)]
+        self._codebooks = np.stack([
+            kmeans(subspace, 256, seed=self.seed)
+            for subspace in np.split(residuals, self.subquantizers, axis=1)
+        ])
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        return np.stack([
+            assign(np.ascontiguousarray(subspace), codebook)
+            for subspace, codebook in zip(np.split(residuals, self.subquantizers, axis=1), self._codebooks)
+        ], axis=1).astype(np.uint8)
+
+    def add(self, data: np.ndarray, keys: np.ndarray) -> None:
+        """
+        Add points identified by integer keys
+        """
+        data = np.asarray(data, dtype=np.float32).reshape(-1, self._coarse.shape[1])
+        assignments = assign(data, self._coarse)
+        codes = self._encode(data - self._coarse[assignments])
+
+        with self._lock:
+            self._codes.append(codes)
+            self._keys.append(np.asarray(keys, dtype=np.int64))
+            self._assignments.append(assignments)
+            self._sorted = None
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Codes and keys grouped by cell, with the offset of each cell
+        """
+        with self._lock:
+            if self._sorted is None:
+                if len(self._keys) > 1:
+                    self._codes = [np.concatenate(self._codes)]
+                    self._keys = [np.concatenate(self._keys)]
+                    self._assignments = [np.concatenate(self._assignments)]
+
+                assignments = self._assignments[0] if self._assignments else np.empty(0, dtype=np.int32)
+                codes = self._codes[0] if self._codes else np.empty((0, self.subquantizers), dtype=np.uint8)
+                keys = self._keys[0] if self._keys else np.empty(0, dtype=np.int64)
+
+                order = np.argsort(assignments, kind='stable')
+                offsets = np.zeros(self.cells + 1, dtype=np.int64)
+                offsets[1:] = np.cumsum(np.bincount(assignments, minlength=self.cells))
+                self._sorted = (codes[order], keys[order], offsets)
+
+            return self._sorted
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the keys and approximate squared distances of the k nearest points of each query
+
+        Missing results are returned with a -1 key and an infinite distance.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self._coarse.shape[1])
+        codes, keys, offsets = self._inverted_lists()
+        subspaces = np.arange(self.subquantizers)
+
+        result_keys = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        result_distances = np.full((queries.shape[0], k), np.inf, dtype=np.float32)
+
+        coarse_distances = squared_distances(queries, self._coarse)
+        probes = np.argpartition(coarse_distances, self.probes - 1, axis=1)[:, :self.probes]
+
+        for index, (query, cells) in enumerate(zip(queries, probes)):
+            candidate_keys = []
+            candidate_distances = []
+
+            for cell in cells:
+                start, end = offsets[cell], offsets[cell + 1]
+
+                if start == end:
+                    continue
+
+                # Distance table between the residual and each code of each subspace
+                residual = (query - self._coarse[cell]).reshape(self.subquantizers, 1, -1)
+                table = np.square(self._codebooks - residual).sum(axis=2)
+
+                candidate_keys.append(keys[start:end])
+                candidate_distances.append(table[subspaces, codes[start:end]].sum(axis=1))
+
+            if not candidate_keys:
+                continue
+
+            candidate_keys = np.concatenate(candidate_keys)
+            candidate_distances = np.concatenate(candidate_distances)
+
+            count = min(k, candidate_keys.shape[0])
+            best = np.argpartition(candidate_distances, count - 1)[:count]
+            best = best[np.argsort(candidate_distances[best])]
+
+            result_keys[index, :count] = candidate_keys[best]
+            result_distances[index, :count] = candidate_distances[best]
+
+        return result_keys, result_distances
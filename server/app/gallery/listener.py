@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import psycopg2
+import select
+import threading
+import time
+
+from app.constants import GALLERY_DIR
+from app.database import get_url
+from app.gallery import Gallery, gallery, storage
+from app.models.types import Vector
+from pathlib import Path
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from typing import Optional
+from uuid import UUID
+
+
+class GalleryListener(threading.Thread):
+    """
+    Apply the face encodings changes notified by PostgreSQL to a gallery
+
+    With a snapshot directory, the snapshot is rewritten from the gallery
+    once no change has been notified for `snapshot_delay` seconds, so that
+    the processes starting later map an up to date snapshot.
+    """
+    CHANNEL = 'face_encoding'
+
+    def __init__(
+        self,
+        gallery: Gallery,
+        timeout: float = 1.0,
+        retry_delay: float = 5.0,
+        snapshot_dir: Optional[Path] = None,
+        snapshot_delay: float = 10.0,
+    ):
+        super().__init__(name='GalleryListener', daemon=True)
+
+        self._logger = logging.getLogger(__name__)
+        self._gallery = gallery
+        self._timeout = timeout
+        self._retry_delay = retry_delay
+        self._snapshot_dir = snapshot_dir
+        self._snapshot_delay = snapshot_delay
+        self._changed_at = None
+        self._running = None
+
+    def start(self) -> None:
+        self._logger.debug('Starting the gallery listener')
+        self._running = True
+        return super().start()
+
+    def stop(self):
+        self._logger.debug('Stopping the gallery listener')
+        self._running = False
+
+    def handle(self, payload: str) -> None:
+        """
+        Apply a notification to the gallery
+        """
+        event = json.loads(payload)
+        operation = event.get('operation')
+        self._changed_at = time.monotonic()
+
+        if operation == 'INSERT':
+            self._gallery.add(UUID(event['id']), UUID(event['identity_id']), Vector.from_literal(event['vec']))
+        elif operation == 'DELETE':
+            self._gallery.remove(UUID(event['id']))
+        elif operation == 'TRUNCATE':
+            self._gallery.clear()
+        else:
+            self._logger.warning('Unknown gallery notification: %s', payload)
+
+    def refresh_snapshot(self, connection) -> None:
+        """
+        Rewrite the snapshot if the gallery holds every change up to the current version
+        """
+        if not self._gallery.loaded:
+            # Wait for the gallery to be loaded
+            return
+
+        cursor = connection.cursor()
+        cursor.execute('SELECT version FROM face_encoding_version')
+        version = cursor.fetchone()[0]
+
+        # Changes committed before the version was read are notified with the result
+        if connection.notifies:
+            return
+
+        arrays = self._gallery.to_arrays()
+
+        if not self._gallery.loaded:
+            return
+
+        self._changed_at = None
+        target = storage.refresh(self._snapshot_dir, version, arrays)
+
+        if target:
+            self._logger.info('Wrote gallery snapshot version %d to %s', version, target)
+
+    def listen(self) -> None:
+        connection = psycopg2.connect(get_url())
+
+        try:
+            connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            connection.cursor().execute(f'LISTEN {self.CHANNEL}')
+
+            # Changes may have been missed while not listening, the snapshot may be outdated too
+            self._gallery.invalidate()
+            self._changed_at = time.monotonic()
+            self._logger.info('Listening to %s notifications', self.CHANNEL)
+
+            while self._running:
+                if select.select([connection], [], [], self._timeout) == ([], [], []):
+                    if self._snapshot_dir and self._changed_at is not None and time.monotonic() - self._changed_at >= self._snapshot_delay:
+                        self.refresh_snapshot(connection)
+
+                    if not connection.notifies:
+                        continue
+
+                connection.poll()
+
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+
+                    try:
+                        self.handle(notify.payload)
+                    except Exception:
+                        self._logger.exception('Unable to handle notification, invalidating the gallery')
+                        self._gallery.invalidate()
+        finally:
+            connection.close()
+
+    def run(self) -> None:
+        while self._running:
+            try:
+                self.listen()
+            except Exception:
+                self._logger.exception('Gallery listener failed, retrying in %d seconds', self._retry_delay)
+                self._gallery.invalidate()
+
+                if self._running:
+                    time.sleep(self._retry_delay)
+
+
+listener = GalleryListener(
+    gallery,
+    snapshot_dir=GALLERY_DIR,
+    snapshot_delay=float(os.getenv('GALLERY_SNAPSHOT_DELAY', '10')),
+)
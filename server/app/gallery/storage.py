@@ -0,0 +1,150 @@
+import fcntl
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from contextlib import contextmanager
+from pathlib import Path
+from sqlalchemy.orm import Session
+from typing import Dict, Iterator, Optional, Tuple
+
+
+"""
+Version of the snapshot files layout
+"""
+FORMAT = 1
+
+"""
+Arrays stored in a snapshot
+"""
+ARRAYS = ('face_ids', 'labels', 'matrix', 'norms', 'identities', 'sums', 'counts')
+
+"""
+Link to the latest snapshot of a directory
+"""
+CURRENT = 'current'
+
+"""
+Lock held while writing a snapshot, processes sharing a directory write one at a time
+"""
+LOCK = '.lock'
+
+
+def get_version(db: Session) -> int:
+    """
+    Version of the face encodings, increased by the database on every change
+    """
+    return db.execute('SELECT version FROM face_encoding_version').scalar()
+
+
+@contextmanager
+def _locked(directory: Path, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold the lock of a snapshot directory, yield False if it is held by another process
+    """
+    if not directory.exists():
+        directory.mkdir(parents=True)
+
+    with (directory / LOCK).open('a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save(directory: Path, version: int, arrays: Dict[str, np.ndarray]) -> Path:
+    """
+    Write a snapshot and make it the current one
+    """
+    with _locked(directory):
+        return _write(directory, version, arrays)
+
+
+def refresh(directory: Path, version: int, arrays: Dict[str, np.ndarray]) -> Optional[Path]:
+    """
+    Write a snapshot unless the current one is as recent or another process is writing one
+    """
+    with _locked(directory, blocking=False) as locked:
+        if not locked:
+            return None
+
+        current = get_snapshot_version(directory)
+
+        if current is not None and current >= version:
+            return None
+
+        return _write(directory, version, arrays)
+
+
+def _write(directory: Path, version: int, arrays: Dict[str, np.ndarray]) -> Path:
+    target = Path(tempfile.mkdtemp(prefix=f'{version}-', dir=directory))
+
+    for name in ARRAYS:
+        np.save(target / f'{name}.npy', np.ascontiguousarray(arrays[name]), allow_pickle=False)
+
+    with (target / 'snapshot.json').open('w') as f:
+        json.dump({
+            'format': FORMAT,
+            'version': version,
+            'size': int(arrays['matrix'].shape[0]),
+        }, f)
+
+    os.chmod(target, 0o755)
+
+    # Switch the link atomically, readers always see a complete snapshot
+    link = directory / f'.{CURRENT}-{target.name}'
+    link.symlink_to(target.name)
+    os.replace(link, directory / CURRENT)
+
+    # Processes which mapped the previous snapshots keep their pages until they release them
+    for path in directory.iterdir():
+        if path.is_dir() and not path.is_symlink() and path != target:
+            shutil.rmtree(path, ignore_errors=True)
+
+    return target
+
+
+def _metadata(target: Path) -> Optional[dict]:
+    with (target / 'snapshot.json').open() as f:
+        metadata = json.load(f)
+
+    return metadata if metadata.get('format') == FORMAT else None
+
+
+def get_snapshot_version(directory: Path) -> Optional[int]:
+    """
+    Version of the current snapshot, if any
+    """
+    try:
+        metadata = _metadata((directory / CURRENT).resolve(strict=True))
+        return metadata['version'] if metadata else None
+    except FileNotFoundError:
+        return None
+
+
+def load(directory: Path) -> Optional[Tuple[int, Dict[str, np.ndarray]]]:
+    """
+    Map the current snapshot read-only, returns its version and its arrays
+    """
+    current = directory / CURRENT
+
+    try:
+        target = current.resolve(strict=True)
+        metadata = _metadata(target)
+
+        if metadata is None:
+            return None
+
+        return metadata['version'], dict(
+            (name, np.load(target / f'{name}.npy', mmap_mode='r', allow_pickle=False)) for name in ARRAYS
+        )
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,488 @@
+import face_recognition
+import logging
+import multiprocessing
+import numpy as np
+import os
+import pickle
+import threading
+import time
+
+from app.inference.cache import EmbeddingCache
+from app.inference.detectors import Location, get_detector
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection, wait
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+
+def infer(image: np.ndarray, locations: Optional[Sequence[Location]] = None, encode: bool = True, detector: str = 'hog') -> Tuple[List[Location], List[np.ndarray]]:
+    """
+    Detect the faces of an image if no locations are given, then compute their encodings
+    """
+    if locations is None:
+        locations = get_detector(detector).detect(image)
+
+    encodings = (face_recognition.face_encodings(image, known_face_locations=locations) or []) if encode and locations else []
+
+    return locations, list(np.asarray(encoding, dtype=np.float32) for encoding in encodings)
+
+
+def scale_locations(locations: Sequence[Location], ratio: float, shape: Tuple[int, ...]) -> List[Location]:
+    """
+    Map locations found on an image resized by `ratio` back to the original image
+    """
+    height, width = shape[:2]
+
+    return list(
+        (
+            max(0, int(round(top / ratio))),
+            min(width, int(round(right / ratio))),
+            min(height, int(round(bottom / ratio))),
+            max(0, int(round(left / ratio))),
+        ) for top, right, bottom, left in locations
+    )
+
+
+def map_locations(locations: Sequence[Location], shape: Tuple[int, ...], target_shape: Tuple[int, ...]) -> List[Location]:
+    """
+    Map locations found on an image of a shape to an image of another shape, the aspect ratio may differ
+    """
+    height, width = target_shape[:2]
+    ratio_y = height / shape[0]
+    ratio_x = width / shape[1]
+
+    return list(
+        (
+            max(0, int(round(top * ratio_y))),
+            min(width, int(round(right * ratio_x))),
+            min(height, int(round(bottom * ratio_y))),
+            max(0, int(round(left * ratio_x))),
+        ) for top, right, bottom, left in locations
+    )
+
+
+def crop(image: np.ndarray, locations: Sequence[Location], margin: float = 0.5) -> Tuple[np.ndarray, List[Location]]:
+    """
+    Crop the region of an image containing all the locations, widened by `margin` of the face size
+
+    Return the crop and the locations relative to it.
+    """
+    height, width = image.shape[:2]
+    top = min(max(0, int(t - margin * (b - t))) for t, r, b, l in locations)
+    right = max(min(width, int(r + margin * (r - l))) for t, r, b, l in locations)
+    bottom = max(min(height, int(b + margin * (b - t))) for t, r, b, l in locations)
+    left = min(max(0, int(l - margin * (r - l))) for t, r, b, l in locations)
+
+    return (
+        np.ascontiguousarray(image[top:bottom, left:right]),
+        list((t - top, r - left, b - top, l - left) for t, r, b, l in locations),
+    )
+
+
+def detect_batch(images: np.ndarray, detector: str = 'hog') -> List[List[Location]]:
+    """
+    Detect the faces of a batch of images of the same size
+    """
+    return get_detector(detector).detect_batch(images)
+
+
+"""
+Functions which can be run by the workers
+"""
+FUNCTIONS = {
+    'infer': infer,
+    'detect_batch': detect_batch,
+}
+
+
+def _dump(value: object, error: Optional[Exception]) -> bytes:
+    """
+    Pickle the outcome of a task, an outcome which cannot be pickled is replaced by an error
+    """
+    try:
+        return pickle.dumps((value, error))
+    except Exception as e:
+        return pickle.dumps((None, RuntimeError(f'Unable to send the inference result: {e!r}')))
+
+
+def worker(worker_id: int, tasks: multiprocessing.Queue, results: Connection) -> None:
+    """
+    Inference worker process main loop
+    """
+    while True:
+        task = tasks.get()
+
+        if task is None:
+            break
+
+        task_id, buffer_name, shape, dtype, function, kwargs = task
+        start = time.perf_counter()
+        value, error = None, None
+
+        try:
+            buffer = shared_memory.SharedMemory(name=buffer_name)
+
+            try:
+                image = np.ndarray(shape, dtype=dtype, buffer=buffer.buf)
+                value = FUNCTIONS[function](image, **kwargs)
+                del image
+            finally:
+                buffer.close()
+        except Exception as e:
+            error = e
+
+        results.send((task_id, worker_id, time.perf_counter() - start, _dump(value, error)))
+
+
+class InferenceEngine:
+    """
+    Face detection and encoding shared by the cameras or the API requests of a process
+
+    With `workers` processes, frames are copied once into shared memory
+    buffers owned by the engine and processed by the workers so that the
+    inference does not contend on the interpreter of the caller. Without
+    workers, the inference runs in the calling thread. Encodings already
+    computed for the same crop are taken from the `cache` if given.
+
+    Workers must be started explicitly before any other thread. The tasks
+    of a worker which dies fail and the next ones are sent to the workers
+    still alive, or run in the calling thread if none is left. Callers
+    give up waiting for a result after `timeout` seconds.
+    """
+    def __init__(self, workers: int = 0, detector: str = 'hog', cache: Optional[EmbeddingCache] = None, timeout: float = 30.0):
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._detector = detector
+        self._cache = cache if cache is not None and cache.enabled else None
+        self._timeout = timeout
+        self._processes = []
+        self._queues = []
+        self._connections: List[Connection] = []
+        self._alive: List[bool] = []
+        self._pending: List[Set[int]] = []
+        self._stopping = False
+        self._dispatcher = None
+        self._futures: Dict[int, Tuple[Future, shared_memory.SharedMemory]] = {}
+        self._buffers: List[shared_memory.SharedMemory] = []
+        self._next_task = 0
+        self._started_at = 0.0
+        self._busy = []
+        self._processed = []
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @property
+    def detector(self) -> str:
+        return self._detector
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    @property
+    def running(self) -> bool:
+        return bool(self._processes)
+
+    @property
+    def alive(self) -> int:
+        """
+        Number of workers still alive
+        """
+        return sum(self._alive)
+
+    def start(self) -> None:
+        """
+        Start the worker processes
+        """
+        with self._lock:
+            if self._processes or self._workers <= 0:
+                return
+
+            self._logger.info('Starting %d inference workers', self._workers)
+
+            # Forked workers do not import the application entry point again and
+            # share the resource tracker which owns the shared memory buffers
+            resource_tracker.ensure_running()
+            context = multiprocessing.get_context('fork')
+            self._started_at = time.monotonic()
+            self._stopping = False
+            self._busy = [0.0] * self._workers
+            self._processed = [0] * self._workers
+            self._alive = [True] * self._workers
+            self._pending = list(set() for _ in range(0, self._workers))
+            self._queues = list(context.Queue() for _ in range(0, self._workers))
+            self._connections = []
+
+            for worker_id in range(0, self._workers):
+                reader, writer = context.Pipe(duplex=False)
+                process = context.Process(target=worker, args=(worker_id, self._queues[worker_id], writer), name=f'InferenceWorker-{worker_id}', daemon=True)
+                process.start()
+                writer.close()
+                self._processes.append(process)
+                self._connections.append(reader)
+
+            self._dispatcher = threading.Thread(target=self._dispatch, name='InferenceDispatcher', daemon=True)
+            self._dispatcher.start()
+
+    def stop(self) -> None:
+        """
+        Stop the worker processes and release the shared memory
+        """
+        for stats in self.stats():
+            self._logger.info('Inference worker %d: %d images, %.1f %% busy', stats['worker'], stats['processed'], stats['utilization'] * 100)
+
+        if self._cache is not None:
+            self._logger.info('Embedding cache: %(hits)d hits, %(misses)d misses, %(size)d entries', self._cache.stats())
+
+        with self._lock:
+            if not self._processes:
+                return
+
+            self._logger.info('Stopping the inference workers')
+            self._stopping = True
+
+        for tasks in self._queues:
+            tasks.put(None)
+
+        for process in self._processes:
+            process.join()
+
+        # The dispatcher returns once every worker exited
+        self._dispatcher.join()
+
+        with self._lock:
+            self._processes = []
+            self._queues = []
+
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+            for future, buffer in self._futures.values():
+                future.set_exception(RuntimeError('Inference engine stopped'))
+                self._buffers.append(buffer)
+            self._futures = {}
+
+            for buffer in self._buffers:
+                buffer.close()
+                buffer.unlink()
+            self._buffers = []
+
+    def _acquire_buffer(self, size: int) -> shared_memory.SharedMemory:
+        for index, buffer in enumerate(self._buffers):
+            if buffer.size >= size:
+                return self._buffers.pop(index)
+
+        return shared_memory.SharedMemory(create=True, size=size)
+
+    def _receive(self, connection: Connection) -> bool:
+        """
+        Resolve the future of a result sent by a worker, return False once the worker closed its end
+        """
+        try:
+            task_id, worker_id, busy, payload = connection.recv()
+        except (EOFError, OSError):
+            return False
+
+        try:
+            value, error = pickle.loads(payload)
+        except Exception as e:
+            value, error = None, RuntimeError(f'Unable to read the inference result: {e!r}')
+
+        with self._lock:
+            future, buffer = self._futures.pop(task_id, (None, None))
+            self._pending[worker_id].discard(task_id)
+            self._busy[worker_id] += busy
+            self._processed[worker_id] += 1
+
+            if buffer is not None:
+                self._buffers.append(buffer)
+
+        if future is None:
+            pass
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+        return True
+
+    def _exited(self, worker_id: int) -> None:
+        """
+        Fail the pending tasks of a worker which exited
+        """
+        with self._lock:
+            self._alive[worker_id] = False
+            failed = list(self._futures.pop(task_id) for task_id in self._pending[worker_id] if task_id in self._futures)
+            self._pending[worker_id] = set()
+
+            for _, buffer in failed:
+                self._buffers.append(buffer)
+
+            if not self._stopping:
+                self._logger.error(
+                    'Inference worker %d died with exit code %s, %d tasks failed, %d workers left',
+                    worker_id,
+                    self._processes[worker_id].exitcode,
+                    len(failed),
+                    sum(self._alive),
+                )
+
+        for future, _ in failed:
+            future.set_exception(RuntimeError(f'Inference worker {worker_id} died'))
+
+    def _dispatch(self) -> None:
+        readers = dict((connection, worker_id) for worker_id, connection in enumerate(self._connections))
+        sentinels = dict((process.sentinel, worker_id) for worker_id, process in enumerate(self._processes))
+
+        while sentinels:
+            for ready in wait(list(readers) + list(sentinels)):
+                if ready in readers:
+                    if not self._receive(ready):
+                        readers.pop(ready)
+                elif ready in sentinels:
+                    worker_id = sentinels.pop(ready)
+                    connection = self._connections[worker_id]
+
+                    # Results sent before the worker exited are still in the pipe
+                    while connection in readers and connection.poll():
+                        if not self._receive(connection):
+                            break
+
+                    readers.pop(connection, None)
+                    self._exited(worker_id)
+
+    def _run(self, function: str, image: np.ndarray, **kwargs) -> Future:
+        future = Future()
+
+        try:
+            future.set_result(FUNCTIONS[function](image, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+        return future
+
+    def _submit(self, function: str, image: np.ndarray, **kwargs) -> Future:
+        if self._workers <= 0:
+            return self._run(function, image, **kwargs)
+
+        if not self._processes:
+            raise RuntimeError('Inference engine not started')
+
+        image = np.ascontiguousarray(image)
+
+        with self._lock:
+            buffer = self._acquire_buffer(max(1, image.nbytes))
+
+        np.ndarray(image.shape, dtype=image.dtype, buffer=buffer.buf)[...] = image
+        future = Future()
+
+        with self._lock:
+            alive = list(worker_id for worker_id, alive in enumerate(self._alive) if alive)
+
+            if alive:
+                # Send the task to the worker with the fewest pending tasks
+                worker_id = min(alive, key=lambda worker_id: len(self._pending[worker_id]))
+                task_id = self._next_task
+                self._next_task += 1
+                self._futures[task_id] = (future, buffer)
+                self._pending[worker_id].add(task_id)
+                self._queues[worker_id].put((task_id, buffer.name, image.shape, image.dtype.str, function, kwargs))
+            else:
+                self._buffers.append(buffer)
+
+        if not alive:
+            self._logger.warning('No inference worker alive, running the inference in the calling thread')
+            return self._run(function, image, **kwargs)
+
+        return future
+
+    def submit(self, image: np.ndarray, locations: Optional[Sequence[Location]] = None, encode: bool = True, detector: Optional[str] = None) -> Future:
+        """
+        Queue an image, the future resolves with its locations and encodings
+        """
+        return self._submit(
+            'infer',
+            image,
+            locations=None if locations is None else list(locations),
+            encode=encode,
+            detector=detector or self._detector,
+        )
+
+    def submit_batch(self, images: Sequence[np.ndarray], detector: Optional[str] = None) -> Future:
+        """
+        Queue images of the same size, the future resolves with the locations of each image
+        """
+        return self._submit('detect_batch', np.stack(images), detector=detector or self._detector)
+
+    def process(self, image: np.ndarray, locations: Optional[Sequence[Location]] = None, encode: bool = True, detector: Optional[str] = None) -> Tuple[List[Location], List[np.ndarray]]:
+        """
+        Return the locations and the encodings of the faces of an image
+        """
+        return self.submit(image, locations, encode, detector).result(timeout=self._timeout)
+
+    def detect(self, image: np.ndarray, detector: Optional[str] = None) -> List[Location]:
+        """
+        Return the locations of the faces of an image
+        """
+        return self.process(image, encode=False, detector=detector)[0]
+
+    def encode(self, image: np.ndarray, locations: Sequence[Location]) -> List[np.ndarray]:
+        """
+        Return the encodings of the faces of an image at the given locations
+        """
+        if self._cache is None or not isinstance(image, np.ndarray):
+            return self.process(image, locations)[1]
+
+        keys = list(self._cache.key(image, location) for location in locations)
+        encodings = list(self._cache.get(key) for key in keys)
+        missing = list(index for index, encoding in enumerate(encodings) if encoding is None)
+
+        if missing:
+            computed = self.process(image, list(locations[index] for index in missing))[1]
+
+            # Let the callers handle the faces which cannot be encoded
+            if len(computed) != len(missing):
+                return computed
+
+            for index, encoding in zip(missing, computed):
+                self._cache.put(keys[index], encoding)
+                encodings[index] = encoding
+
+        return encodings
+
+    def clear_cache(self) -> None:
+        if self._cache is not None:
+            self._cache.clear()
+
+    def utilization(self) -> List[float]:
+        """
+        Fraction of the time each worker spent processing images since the start
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at if self._processes else 0.0
+            return list(busy / elapsed if elapsed > 0 else 0.0 for busy in self._busy)
+
+    def stats(self) -> List[Dict[str, float]]:
+        """
+        Number of processed images and utilization of each worker
+        """
+        return list(
+            {
+                'worker': worker_id,
+                'processed': processed,
+                'utilization': utilization,
+            } for worker_id, (processed, utilization) in enumerate(zip(list(self._processed), self.utilization()))
+        )
+
+
+engine = InferenceEngine(
+    workers=int(os.getenv('INFERENCE_WORKERS', '0')),
+    # INFERENCE_MODEL is the former name of the setting
+    detector=os.getenv('INFERENCE_DETECTOR', os.getenv('INFERENCE_MODEL', 'hog')),
+    cache=EmbeddingCache(int(os.getenv('EMBEDDING_CACHE_SIZE', '4096'))),
+    timeout=float(os.getenv('INFERENCE_TIMEOUT', '30')),
+)
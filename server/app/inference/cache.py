@@ -0,0 +1,87 @@
+import hashlib
+import numpy as np
+import threading
+
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+
+class EmbeddingCache:
+    """
+    Least recently used cache of the face encodings
+
+    Encodings are keyed by a hash of the pixels around the face, widened by
+    `margin` of the face size to cover the area used by the alignment, so
+    that a crop encoded again is returned without running the model.
+    """
+    def __init__(self, max_size: int = 4096, margin: float = 0.5):
+        self._max_size = max_size
+        self._margin = margin
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[bytes, np.ndarray]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_size > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, image: np.ndarray, location: Sequence[int]) -> bytes:
+        """
+        Hash of the area of an image around a (top, right, bottom, left) location
+        """
+        top, right, bottom, left = (int(value) for value in location)
+        height, width = image.shape[:2]
+        margin_y = int(self._margin * (bottom - top))
+        margin_x = int(self._margin * (right - left))
+        region = (max(0, top - margin_y), min(width, right + margin_x), min(height, bottom + margin_y), max(0, left - margin_x))
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.ascontiguousarray(image[region[0]:region[2], region[3]:region[1]]).data)
+        digest.update(np.asarray([top - region[0], right - region[3], bottom - region[0], left - region[3]], dtype=np.int32).tobytes())
+        digest.update(str(image.dtype).encode())
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            encoding = self._entries.get(key)
+
+            if encoding is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return encoding
+
+    def put(self, key: bytes, encoding: np.ndarray) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = encoding
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Hits, misses, hit ratio and size of the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'ratio': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
@@ -0,0 +1,167 @@
+import cv2
+import face_recognition
+import numpy as np
+import os
+import threading
+
+from app.constants import DATA_DIR
+from typing import List, Sequence, Tuple
+
+
+Location = Tuple[int, int, int, int]
+
+
+class Detector:
+    """
+    Face detector returning (top, right, bottom, left) locations
+    """
+    def detect(self, image: np.ndarray) -> List[Location]:
+        raise NotImplementedError()
+
+    def detect_batch(self, images: Sequence[np.ndarray]) -> List[List[Location]]:
+        return list(self.detect(image) for image in images)
+
+    @classmethod
+    def to_locations(cls, boxes: Sequence[Sequence[float]], shape: Tuple[int, ...]) -> List[Location]:
+        """
+        Convert (x, y, width, height) boxes to locations inside the image
+        """
+        height, width = shape[:2]
+
+        return list(
+            (max(int(y), 0), min(int(x + w), width), min(int(y + h), height), max(int(x), 0))
+            for x, y, w, h in boxes
+        )
+
+
+class DlibDetector(Detector):
+    """
+    dlib HOG or CNN detector of face_recognition
+    """
+    def __init__(self, model: str = 'hog', upsample: int = 1):
+        self._model = model
+        self._upsample = upsample
+
+    def detect(self, image: np.ndarray) -> List[Location]:
+        return face_recognition.face_locations(image, number_of_times_to_upsample=self._upsample, model=self._model)
+
+    def detect_batch(self, images: Sequence[np.ndarray]) -> List[List[Location]]:
+        # HOG has no batched implementation, the batch still saves one round trip per image
+        if self._model != 'cnn':
+            return super().detect_batch(images)
+
+        return face_recognition.batch_face_locations(list(images), number_of_times_to_upsample=self._upsample, batch_size=len(images))
+
+
+class HaarDetector(Detector):
+    """
+    OpenCV Haar cascade detector
+    """
+    def __init__(self, cascade: str = 'haarcascade_frontalface_default.xml', scale_factor: float = 1.1, min_neighbors: int = 5):
+        self._classifier = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, cascade))
+        self._scale_factor = scale_factor
+        self._min_neighbors = min_neighbors
+
+        if self._classifier.empty():
+            raise ValueError(f'Unable to load cascade {cascade}')
+
+    def detect(self, image: np.ndarray) -> List[Location]:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        boxes = self._classifier.detectMultiScale(gray, scaleFactor=self._scale_factor, minNeighbors=self._min_neighbors)
+        return self.to_locations(boxes, image.shape)
+
+
+class DnnDetector(Detector):
+    """
+    OpenCV DNN detector, either a YuNet ONNX model or a res10 SSD Caffe model
+
+    The SSD model expects its `deploy.prototxt` next to the `.caffemodel` file.
+    """
+    def __init__(self, model: str, confidence: float = 0.6):
+        self._confidence = confidence
+
+        if not os.path.exists(model):
+            raise ValueError(f'Model file {model} not found')
+
+        if model.endswith('.onnx'):
+            if not hasattr(cv2, 'FaceDetectorYN'):
+                raise ValueError('YuNet models require OpenCV 4.5.4 or later')
+
+            self._yunet = cv2.FaceDetectorYN.create(model, '', (320, 320), confidence)
+            self._net = None
+        else:
+            self._yunet = None
+            self._net = cv2.dnn.readNetFromCaffe(os.path.join(os.path.dirname(model), 'deploy.prototxt'), model)
+
+    def detect(self, image: np.ndarray) -> List[Location]:
+        height, width = image.shape[:2]
+
+        if self._yunet is not None:
+            self._yunet.setInputSize((width, height))
+            _, faces = self._yunet.detect(image)
+            return self.to_locations(faces[:, :4] if faces is not None else [], image.shape)
+
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images: Sequence[np.ndarray]) -> List[List[Location]]:
+        # YuNet takes a single image, the SSD model takes a batch of images
+        if self._yunet is not None:
+            return super().detect_batch(images)
+
+        self._net.setInput(cv2.dnn.blobFromImages(list(cv2.resize(image, (300, 300)) for image in images), 1.0, (300, 300), (104.0, 177.0, 123.0)))
+        detections = self._net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self._confidence]
+
+        return list(self._to_locations(detections[detections[:, 0] == index], image.shape) for index, image in enumerate(images))
+
+    def _to_locations(self, detections: np.ndarray, shape: Tuple[int, ...]) -> List[Location]:
+        height, width = shape[:2]
+        boxes = detections[:, 3:7] * np.array([width, height, width, height])
+
+        return self.to_locations(np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2])), shape)
+
+
+"""
+Number of times dlib upsamples the image, INFERENCE_UPSAMPLE is the former name of the setting
+"""
+UPSAMPLE = int(os.getenv('DETECTOR_UPSAMPLE', os.getenv('INFERENCE_UPSAMPLE', '1')))
+
+"""
+Model of the DNN detector
+"""
+DNN_MODEL = os.getenv('DETECTOR_DNN_MODEL', str(DATA_DIR / 'models' / 'face_detection_yunet.onnx'))
+
+"""
+Available detectors
+"""
+DETECTORS = {
+    'hog': lambda: DlibDetector('hog', UPSAMPLE),
+    'cnn': lambda: DlibDetector('cnn', UPSAMPLE),
+    'haar': lambda: HaarDetector(),
+    'dnn': lambda: DnnDetector(DNN_MODEL),
+}
+
+
+def is_batched(name: str) -> bool:
+    """
+    Tell whether a detector processes a batch of images in a single call, without loading it
+    """
+    return name == 'cnn' or (name == 'dnn' and not DNN_MODEL.endswith('.onnx'))
+
+
+_detectors = threading.local()
+
+
+def get_detector(name: str) -> Detector:
+    """
+    Detector of the current thread, OpenCV networks cannot be shared between threads
+    """
+    if name not in DETECTORS:
+        raise ValueError(f'Unknown detector {name}')
+
+    detectors = _detectors.__dict__.setdefault('detectors', {})
+
+    if name not in detectors:
+        detectors[name] = DETECTORS[name]()
+
+    return detectors[name]
@@ -0,0 +1,104 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from app.inference import engine
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class PriorityLimiter:
+    """
+    Limit the number of concurrent inferences shared by the cameras
+
+    Waiting callers are admitted by decreasing priority, then in arrival
+    order. A caller still waiting at its deadline gives up and is counted
+    as dropped, so that late frames are skipped instead of processed late.
+    """
+    def __init__(self, max_concurrency: int = 2):
+        self._max_concurrency = max(1, max_concurrency)
+        self._condition = threading.Condition()
+        self._counter = itertools.count()
+        self._waiting = []
+        self._active = 0
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def _count(self, key: str, name: str, value: float = 1) -> None:
+        stats = self._stats.setdefault(key, {'granted': 0, 'dropped': 0, 'wait': 0.0})
+        stats[name] += value
+
+    def acquire(self, key: str, priority: int = 0, deadline: Optional[float] = None) -> bool:
+        """
+        Wait for a slot until the monotonic deadline, return False if the caller has been dropped
+        """
+        start = time.monotonic()
+
+        with self._condition:
+            ticket = (-priority, next(self._counter))
+            heapq.heappush(self._waiting, ticket)
+
+            while self._active >= self._max_concurrency or self._waiting[0] != ticket:
+                timeout = None if deadline is None else deadline - time.monotonic()
+
+                if timeout is not None and timeout <= 0:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._count(key, 'dropped')
+                    self._condition.notify_all()
+                    return False
+
+                self._condition.wait(timeout)
+
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._count(key, 'granted')
+            self._count(key, 'wait', time.monotonic() - start)
+
+            # The next waiter may be admitted too
+            self._condition.notify_all()
+            return True
+
+    def release(self) -> None:
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, key: str, priority: int = 0, deadline: Optional[float] = None) -> Iterator[bool]:
+        """
+        Hold a slot for the duration of the block, yield False if the caller has been dropped
+        """
+        granted = self.acquire(key, priority, deadline)
+
+        try:
+            yield granted
+        finally:
+            if granted:
+                self.release()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Granted and dropped counts and total waiting time of each caller
+        """
+        with self._condition:
+            return {key: dict(stats) for key, stats in self._stats.items()}
+
+
+limiter = PriorityLimiter(
+    # One slot per inference worker by default, or per CPU when the inference runs inline
+    max_concurrency=int(os.getenv('INFERENCE_MAX_CONCURRENCY', '0')) or engine.workers or os.cpu_count() or 1,
+)
@@ -0,0 +1,143 @@
+import numpy as np
+import os
+import queue
+import time
+
+from app.cameras import BaseThread
+from app.inference import InferenceEngine, Location, engine
+from app.inference.detectors import is_batched
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+
+class DetectionScheduler(BaseThread):
+    """
+    Batch the face detections requested by several cameras
+
+    Requests are collected until `batch_size` frames are queued or until the
+    oldest one waited `max_wait` seconds. Frames of the same size are then
+    detected in a single engine call when the detector has a batched
+    implementation, otherwise each frame is sent to the engine on its own so
+    that the workers process them in parallel. Without worker, frames are
+    detected in the thread of the requester.
+    """
+    def __init__(self, engine: InferenceEngine, batch_size: int = 8, max_wait: float = 0.02):
+        super().__init__(name='DetectionScheduler')
+
+        self._engine = engine
+        self._batch_size = batch_size
+        self._max_wait = max_wait
+        self._queue = queue.Queue()
+        self._batches = 0
+        self._frames = 0
+
+    @property
+    def average_batch_size(self) -> float:
+        return self._frames / self._batches if self._batches else 0.0
+
+    def submit(self, image: np.ndarray, detector: Optional[str] = None) -> Future:
+        """
+        Queue a frame, the future resolves with its face locations
+        """
+        if not self._running or not self._engine.running:
+            future = Future()
+            future.set_result(self._engine.detect(image, detector))
+            return future
+
+        future = Future()
+        self._queue.put((image, detector, future))
+        return future
+
+    def detect(self, image: np.ndarray, detector: Optional[str] = None) -> List[Location]:
+        """
+        Return the face locations of a frame
+        """
+        return self.submit(image, detector).result(timeout=self._engine.timeout)
+
+    def _collect(self) -> List[Tuple[np.ndarray, Optional[str], Future]]:
+        try:
+            requests = [self._queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self._max_wait
+
+        while len(requests) < self._batch_size:
+            timeout = deadline - time.monotonic()
+
+            if timeout <= 0:
+                break
+
+            try:
+                requests.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return requests
+
+    def _dispatch(self, requests: List[Tuple[np.ndarray, Optional[str], Future]]) -> None:
+        # Only frames of the same size can be stacked
+        groups: Dict[Tuple, List[Tuple[np.ndarray, Future]]] = {}
+
+        for image, detector, future in requests:
+            detector = detector or self._engine.detector
+
+            # Without batched implementation, the frames are spread over the workers
+            if not is_batched(detector):
+                self._batches += 1
+                self._frames += 1
+                self._engine.submit(image, encode=False, detector=detector).add_done_callback(
+                    lambda result, future=future: self._resolve(future, result)
+                )
+                continue
+
+            groups.setdefault((image.shape, image.dtype.str, detector), []).append((image, future))
+
+        for (_, _, detector), group in groups.items():
+            futures = list(future for _, future in group)
+
+            def fan_out(result: Future, futures=futures) -> None:
+                try:
+                    for future, locations in zip(futures, result.result()):
+                        future.set_result(locations)
+                except Exception as e:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(e)
+
+            self._batches += 1
+            self._frames += len(group)
+            self._engine.submit_batch(list(image for image, _ in group), detector).add_done_callback(fan_out)
+
+    @classmethod
+    def _resolve(cls, future: Future, result: Future) -> None:
+        """
+        Resolve a request with the locations of an engine result
+        """
+        try:
+            future.set_result(result.result()[0])
+        except Exception as e:
+            future.set_exception(e)
+
+    def run(self):
+        while self._running or not self._queue.empty():
+            requests = self._collect()
+
+            if requests:
+                try:
+                    self._dispatch(requests)
+                except Exception as e:
+                    self._logger.exception('Unable to dispatch detections')
+
+                    for _, _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+
+        self._logger.debug('Average batch size: %.2f', self.average_batch_size)
+
+
+scheduler = DetectionScheduler(
+    engine,
+    batch_size=int(os.getenv('DETECTION_BATCH_SIZE', '8')),
+    max_wait=float(os.getenv('DETECTION_MAX_WAIT', '0.02')),
+)
@@ -1,5 +1,7 @@
 from app.models import Base
-from sqlalchemy import Column, String
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.dialects.postgresql import JSONB
+from typing import Optional
 from urllib.parse import urlparse
 
 
@@ -13,12 +15,20 @@ class Camera(Base):
     url = Column(String, nullable=False, unique=True)
     username = Column(String, nullable=True)
     password = Column(String, nullable=True)
+    detector = Column(String, nullable=True)
+    regions = Column(JSONB, nullable=True)
+    priority = Column(Integer, nullable=False, default=0)
+    detection_url = Column(String, nullable=True)
+    backend = Column(String, nullable=True)
 
-    @property
-    def full_url(self) -> str:
-        parsed_url = urlparse(self.url)
+    def _with_credentials(self, url: str) -> str:
+        parsed_url = urlparse(url)
         auth_str = ''
 
+        # Local files and URLs without credentials are used as is
+        if not parsed_url.scheme or not (self.username or self.password):
+            return url
+
         if self.username:
             auth_str = f'{self.username}:'
 
@@ -37,3 +47,11 @@ class Camera(Base):
             '?' if parsed_url.query else '',
             parsed_url.query
         )
+
+    @property
+    def full_url(self) -> str:
+        return self._with_credentials(self.url)
+
+    @property
+    def full_detection_url(self) -> Optional[str]:
+        return self._with_credentials(self.detection_url) if self.detection_url else None
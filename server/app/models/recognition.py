@@ -1,7 +1,9 @@
+from app.constants import ENCODING_SIZE
 from app.models import Base
 from app.models.identities import Identity
+from app.models.types import Float32Array, Vector
 from sqlalchemy import ARRAY, Column, Float, Integer
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import backref, relationship
 from sqlalchemy.sql.schema import ForeignKey
 
@@ -15,8 +17,7 @@ class FaceEncoding(Base):
     identity_id = Column(UUID(as_uuid=True), ForeignKey('identity.id'), nullable=False)
     identity = relationship(Identity, backref=backref('face_encodings', uselist=True, cascade='all, delete-orphan'))
 
-    vec_low = Column(ARRAY(Float), nullable=False)
-    vec_high = Column(ARRAY(Float), nullable=False)
+    vec = Column(Vector(ENCODING_SIZE), nullable=False)
 
 
 class Query(Base):
@@ -38,8 +39,10 @@ class Suggestion(Base):
     identity_id = Column(UUID(as_uuid=True), ForeignKey('identity.id'), nullable=True)
     identity = relationship(Identity, backref=backref('suggestions', uselist=True))
 
-    vec_low = Column(ARRAY(Float), nullable=False)
-    vec_high = Column(ARRAY(Float), nullable=False)
+    vec = Column(Float32Array, nullable=False)
 
     rect = Column(ARRAY(Integer), nullable=False)
     score = Column(Float, nullable=True)
+
+    # Ranked candidate identities, as a list of identity_id, score and votes
+    candidates = Column(JSONB, nullable=True)
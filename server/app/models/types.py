@@ -0,0 +1,69 @@
+import numpy as np
+
+from sqlalchemy import LargeBinary, func
+from sqlalchemy.types import TypeDecorator, UserDefinedType
+from typing import Any, Optional, Sequence
+
+
+class Vector(UserDefinedType):
+    """
+    Fixed size vector stored with the pgvector extension
+
+    Values are fetched in the binary format of pgvector (a 4 bytes header
+    followed by big-endian float32 values) and decoded as NumPy arrays.
+    """
+    cache_ok = True
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    def get_col_spec(self, **kwargs) -> str:
+        return f'VECTOR({self.dimension})'
+
+    @classmethod
+    def to_literal(cls, value: Sequence[float]) -> str:
+        """
+        Build the text representation of a vector
+        """
+        return '[{}]'.format(','.join(str(float(v)) for v in value))
+
+    @classmethod
+    def from_literal(cls, value: str) -> list:
+        """
+        Parse the text representation of a vector
+        """
+        return list(float(v) for v in value[1:-1].split(',')) if len(value) > 2 else []
+
+    @classmethod
+    def from_binary(cls, value: bytes) -> np.ndarray:
+        """
+        Decode the binary representation of a vector
+        """
+        return np.frombuffer(value, dtype='>f4', offset=4).astype(np.float32)
+
+    def column_expression(self, column):
+        return func.vector_send(column, type_=self)
+
+    def bind_processor(self, dialect):
+        def process(value: Optional[Sequence[float]]) -> Optional[str]:
+            return None if value is None else self.to_literal(value)
+        return process
+
+    def result_processor(self, dialect, coltype):
+        def process(value: Optional[bytes]) -> Any:
+            return None if value is None else self.from_binary(value)
+        return process
+
+
+class Float32Array(TypeDecorator):
+    """
+    Array of float32 values stored as big-endian bytes
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[Sequence[float]], dialect) -> Optional[bytes]:
+        return None if value is None else np.asarray(value, dtype='>f4').tobytes()
+
+    def process_result_value(self, value: Optional[bytes], dialect) -> Optional[np.ndarray]:
+        return None if value is None else np.frombuffer(value, dtype='>f4').astype(np.float32)
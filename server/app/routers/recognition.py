@@ -1,12 +1,13 @@
 from app.auth import check_is_admin, get_user
 from app.controllers.recognition import RecognitionController
 from app.database import get_session
+from app.inference.detectors import DETECTORS
 from app.models.users import User
 from app.schemas.recognition import FaceEncoding, Query, QueryConfirm, QuerySuggestion, QueryResult
-from fastapi import APIRouter, BackgroundTasks, Depends, File, Response, UploadFile, status
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Response, UploadFile, status
 from sqlalchemy.orm import Session
 from uuid import UUID
-from typing import List
+from typing import List, Optional
 
 
 router = APIRouter()
@@ -16,13 +17,17 @@ router = APIRouter()
 async def query(
     picture: UploadFile = File(...),
     returns: bool = False,
+    detector: Optional[str] = None,
     db: Session = Depends(get_session)
 ) -> QueryResult:
     """
     Ask to recognize faces on a picture
     """
+    if detector is not None and detector not in DETECTORS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Unknown detector {detector}')
+
     image = RecognitionController.load_uploaded_file(picture)
-    faces = RecognitionController.get_faces_locations(image)
+    faces = RecognitionController.get_faces_locations(image, detector)
 
     if not faces:
         return None
@@ -40,6 +45,12 @@ async def get_queries(
     """
     check_is_admin(user)
 
+    queries = RecognitionController.get_queries(db)
+    candidates = RecognitionController.get_suggestions_candidates(
+        db,
+        list(suggestion for query in queries for suggestion in query.suggestions),
+    )
+
     return list(
         Query(**{
             'id': query.id,
@@ -62,9 +73,10 @@ async def get_queries(
                     },
                     'score': suggestion.score,
                     'identity': suggestion.identity,
+                    'candidates': candidates[suggestion.id],
                 }) for suggestion in query.suggestions
             ],
-        }) for query in RecognitionController.get_queries(db)
+        }) for query in queries
     )
 
 
@@ -1,6 +1,8 @@
+from app.constants import CAPTURE_BACKENDS
+from app.inference.detectors import DETECTORS
 from app.schemas import Base
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, validator
+from typing import List, Optional, Tuple
 
 
 class CameraCreate(BaseModel):
@@ -9,8 +11,34 @@ class CameraCreate(BaseModel):
     """
     label: str
     url: str
+    detection_url: Optional[str]
     username: Optional[str]
     password: Optional[str]
+    detector: Optional[str]
+    regions: Optional[List[List[Tuple[float, float]]]]
+    priority: int = 0
+    backend: Optional[str]
+
+    @validator('detector')
+    def check_detector(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and value not in DETECTORS:
+            raise ValueError(f'Unknown detector {value}')
+        return value
+
+    @validator('backend')
+    def check_backend(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and value not in CAPTURE_BACKENDS:
+            raise ValueError(f'Unknown capture backend {value}')
+        return value
+
+    @validator('regions')
+    def check_regions(cls, value: Optional[List[List[Tuple[float, float]]]]) -> Optional[List[List[Tuple[float, float]]]]:
+        for region in value or []:
+            if len(region) < 3:
+                raise ValueError('A region needs at least 3 points')
+            if any(not 0 <= coordinate <= 1 for point in region for coordinate in point):
+                raise ValueError('Region points must be relative to the frame size, between 0 and 1')
+        return value or None
 
 
 class CameraUpdate(CameraCreate):
@@ -26,8 +54,13 @@ class Camera(Base):
     """
     label: str
     url: str
+    detection_url: Optional[str]
     username: Optional[str]
     password: Optional[str]
+    detector: Optional[str]
+    regions: Optional[List[List[Tuple[float, float]]]]
+    priority: int
+    backend: Optional[str]
 
     class Config:
         orm_mode = True
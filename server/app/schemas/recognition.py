@@ -36,6 +36,18 @@ class FaceEncoding(Base):
         orm_mode = True
 
 
+class Candidate(BaseModel):
+    """
+    Identity which may match a face
+    """
+    identity: Identity
+    score: float
+    votes: int
+
+    class Config:
+        orm_mode = True
+
+
 class Recognition(BaseModel):
     """
     Identified face
@@ -43,6 +55,7 @@ class Recognition(BaseModel):
     identity: Optional[Identity]
     score: Optional[float]
     rect: Rect
+    candidates: List[Candidate] = []
 
     class Config:
         orm_mode = True
@@ -66,6 +79,7 @@ class QuerySuggestion(Base):
     identity: Optional[Identity]
     rect: Rect
     score: Optional[float]
+    candidates: List[Candidate] = []
 
     class Config:
         orm_mode = True
@@ -22,6 +22,9 @@ case "${APP_ENV:=production}" in
         groupmod -o -g "${APP_GID:=1000}" app
         usermod -o -u "${APP_UID:=1000}" app
 
+        # Write the gallery snapshot shared by all the workers, the gallery listeners rewrite it on changes
+        su app -c "python /usr/src/main.py gallery snapshot" || echo "Unable to write the gallery snapshot" >&2
+
         if [ "${APP_TYPE:=server}" == "server" ]; then
             # Use gunicorn to run the application
             gunicorn \
@@ -0,0 +1,14 @@
+-- Store face encodings in a single indexed 128-d vector column
+CREATE EXTENSION IF NOT EXISTS VECTOR;
+
+ALTER TABLE face_encoding ADD COLUMN IF NOT EXISTS vec VECTOR(128);
+
+UPDATE face_encoding
+SET vec = CAST(vec_low || vec_high AS VECTOR(128))
+WHERE vec IS NULL;
+
+ALTER TABLE face_encoding ALTER COLUMN vec SET NOT NULL;
+ALTER TABLE face_encoding DROP COLUMN IF EXISTS vec_low;
+ALTER TABLE face_encoding DROP COLUMN IF EXISTS vec_high;
+
+CREATE INDEX IF NOT EXISTS face_encoding_vec_idx ON face_encoding USING hnsw (vec vector_l2_ops);
@@ -0,0 +1,38 @@
+-- Notify the listening processes of every face encoding change
+CREATE OR REPLACE FUNCTION face_encoding_notify() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('face_encoding', json_build_object('operation', 'TRUNCATE')::text);
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('face_encoding', json_build_object(
+            'operation', 'DELETE',
+            'id', OLD.id,
+            'identity_id', OLD.identity_id
+        )::text);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('face_encoding', json_build_object(
+            'operation', 'INSERT',
+            'id', NEW.id,
+            'identity_id', NEW.identity_id,
+            'vec', CAST(NEW.vec AS TEXT)
+        )::text);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS face_encoding_notify ON face_encoding;
+CREATE TRIGGER face_encoding_notify
+    AFTER INSERT OR UPDATE OR DELETE ON face_encoding
+    FOR EACH ROW EXECUTE PROCEDURE face_encoding_notify();
+
+DROP TRIGGER IF EXISTS face_encoding_notify_truncate ON face_encoding;
+CREATE TRIGGER face_encoding_notify_truncate
+    AFTER TRUNCATE ON face_encoding
+    FOR EACH STATEMENT EXECUTE PROCEDURE face_encoding_notify();
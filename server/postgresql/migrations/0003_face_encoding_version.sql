@@ -0,0 +1,19 @@
+-- Version of the face encodings, increased by every change so that gallery snapshots can be checked
+CREATE TABLE IF NOT EXISTS face_encoding_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL
+);
+
+INSERT INTO face_encoding_version (version) VALUES (0) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION face_encoding_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE face_encoding_version SET version = version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS face_encoding_version ON face_encoding;
+CREATE TRIGGER face_encoding_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON face_encoding
+    FOR EACH STATEMENT EXECUTE PROCEDURE face_encoding_version();
@@ -0,0 +1,10 @@
+-- Store the suggestion encodings as big-endian float32 bytes
+ALTER TABLE suggestion ADD COLUMN IF NOT EXISTS vec BYTEA;
+
+UPDATE suggestion SET vec = CASE
+    WHEN CARDINALITY(vec_low || vec_high) = 0 THEN ''::BYTEA
+    ELSE SUBSTRING(vector_send(CAST(vec_low || vec_high AS VECTOR)) FROM 5)
+END;
+
+ALTER TABLE suggestion ALTER COLUMN vec SET NOT NULL;
+ALTER TABLE suggestion DROP COLUMN vec_low, DROP COLUMN vec_high;
@@ -0,0 +1,2 @@
+-- Face detector used for each camera, the default one when NULL
+ALTER TABLE camera ADD COLUMN IF NOT EXISTS detector VARCHAR;
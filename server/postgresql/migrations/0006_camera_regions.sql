@@ -0,0 +1,2 @@
+-- Regions of interest of each camera, as polygons of points relative to the frame size
+ALTER TABLE camera ADD COLUMN IF NOT EXISTS regions JSONB;
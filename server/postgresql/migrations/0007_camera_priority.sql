@@ -0,0 +1,2 @@
+-- Inference priority of each camera, the highest first
+ALTER TABLE camera ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 0;
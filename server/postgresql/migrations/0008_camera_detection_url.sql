@@ -0,0 +1,2 @@
+-- Low resolution substream used for the recognition, the main stream when NULL
+ALTER TABLE camera ADD COLUMN IF NOT EXISTS detection_url VARCHAR;
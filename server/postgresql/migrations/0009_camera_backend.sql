@@ -0,0 +1,2 @@
+-- Capture backend of each camera, OpenCV when NULL
+ALTER TABLE camera ADD COLUMN IF NOT EXISTS backend VARCHAR;
@@ -0,0 +1,2 @@
+-- Ranked candidate identities of each suggestion
+ALTER TABLE suggestion ADD COLUMN IF NOT EXISTS candidates JSONB;
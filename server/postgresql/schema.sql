@@ -1,4 +1,10 @@
 CREATE EXTENSION IF NOT EXISTS CUBE;
+CREATE EXTENSION IF NOT EXISTS VECTOR;
+
+CREATE TABLE IF NOT EXISTS schema_migration (
+    name VARCHAR PRIMARY KEY,
+    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
 
 CREATE TABLE IF NOT EXISTS "user" (
     id UUID PRIMARY KEY,
@@ -23,10 +29,68 @@ CREATE TABLE IF NOT EXISTS face_encoding (
     created_at TIMESTAMP WITH TIME ZONE NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE NOT NULL,
     identity_id UUID NOT NULL REFERENCES identity,
-    vec_low DOUBLE PRECISION ARRAY NOT NULL,
-    vec_high DOUBLE PRECISION ARRAY NOT NULL
+    vec VECTOR(128) NOT NULL
 );
 
+CREATE INDEX IF NOT EXISTS face_encoding_vec_idx ON face_encoding USING hnsw (vec vector_l2_ops);
+
+CREATE OR REPLACE FUNCTION face_encoding_notify() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('face_encoding', json_build_object('operation', 'TRUNCATE')::text);
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('face_encoding', json_build_object(
+            'operation', 'DELETE',
+            'id', OLD.id,
+            'identity_id', OLD.identity_id
+        )::text);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('face_encoding', json_build_object(
+            'operation', 'INSERT',
+            'id', NEW.id,
+            'identity_id', NEW.identity_id,
+            'vec', CAST(NEW.vec AS TEXT)
+        )::text);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS face_encoding_notify ON face_encoding;
+CREATE TRIGGER face_encoding_notify
+    AFTER INSERT OR UPDATE OR DELETE ON face_encoding
+    FOR EACH ROW EXECUTE PROCEDURE face_encoding_notify();
+
+DROP TRIGGER IF EXISTS face_encoding_notify_truncate ON face_encoding;
+CREATE TRIGGER face_encoding_notify_truncate
+    AFTER TRUNCATE ON face_encoding
+    FOR EACH STATEMENT EXECUTE PROCEDURE face_encoding_notify();
+
+CREATE TABLE IF NOT EXISTS face_encoding_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL
+);
+
+INSERT INTO face_encoding_version (version) VALUES (0) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION face_encoding_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE face_encoding_version SET version = version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS face_encoding_version ON face_encoding;
+CREATE TRIGGER face_encoding_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON face_encoding
+    FOR EACH STATEMENT EXECUTE PROCEDURE face_encoding_version();
+
 CREATE TABLE IF NOT EXISTS camera (
     id UUID PRIMARY KEY,
     created_at TIMESTAMP WITH TIME ZONE NOT NULL,
@@ -34,7 +98,12 @@ CREATE TABLE IF NOT EXISTS camera (
     label VARCHAR NOT NULL,
     url VARCHAR NOT NULL UNIQUE,
     username VARCHAR,
-    password VARCHAR
+    password VARCHAR,
+    detector VARCHAR,
+    regions JSONB,
+    priority INTEGER NOT NULL DEFAULT 0,
+    detection_url VARCHAR,
+    backend VARCHAR
 );
 
 CREATE TABLE IF NOT EXISTS query (
@@ -51,6 +120,19 @@ CREATE TABLE IF NOT EXISTS suggestion (
     rect INTEGER ARRAY NOT NULL CHECK (ARRAY_LENGTH(rect, 1) = 4),
     identity_id UUID REFERENCES identity,
     score DOUBLE PRECISION,
-    vec_low DOUBLE PRECISION ARRAY NOT NULL,
-    vec_high DOUBLE PRECISION ARRAY NOT NULL
+    vec BYTEA NOT NULL,
+    candidates JSONB
 );
+
+INSERT INTO schema_migration (name) VALUES
+    ('0001_face_encoding_vector.sql'),
+    ('0002_face_encoding_notify.sql'),
+    ('0003_face_encoding_version.sql'),
+    ('0004_suggestion_float32.sql'),
+    ('0005_camera_detector.sql'),
+    ('0006_camera_regions.sql'),
+    ('0007_camera_priority.sql'),
+    ('0008_camera_detection_url.sql'),
+    ('0009_camera_backend.sql'),
+    ('0010_suggestion_candidates.sql')
+ON CONFLICT DO NOTHING;
@@ -1,5 +1,7 @@
 from app import get_app
 from app.database import SessionLocal
+from app.gallery import gallery
+from app.inference import engine
 from fastapi.testclient import TestClient
 from pytest import fixture
 from unittest.mock import MagicMock, patch
@@ -27,9 +29,13 @@ def client():
 @fixture
 def database():
     try:
+        gallery.invalidate()
+        engine.clear_cache()
         db = SessionLocal()
         yield db
     finally:
+        gallery.invalidate()
+
         # Clear data
         for table_name in ['user', 'identity', 'face_encoding', 'camera', 'query', 'suggestion']:
             db.execute(f'TRUNCATE TABLE "{table_name}" CASCADE;')
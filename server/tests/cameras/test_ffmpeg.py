@@ -0,0 +1,78 @@
+import cv2
+import io
+import numpy as np
+import pytest
+import shutil
+
+from app.cameras.streams import BACKENDS, FFmpegStream, NetworkStream, open_stream
+from app.constants import CAPTURE_BACKENDS
+from app.models.cameras import Camera
+from pathlib import Path
+from unittest.mock import Mock, patch
+from uuid import uuid4
+
+
+def build_camera(url: str = 'rtsp://example.com/live', **kwargs):
+    return Camera(id=uuid4(), label='Camera', url=url, **kwargs)
+
+def test_command():
+    stream = FFmpegStream(build_camera(username='user'), width=320, threads=2, keyframes_only=True)
+    assert stream.output_size((1920, 1080)) == (320, 180)
+    assert stream.output_size((160, 90)) == (160, 90)
+
+    command = stream.command((320, 180))
+    assert command[command.index('-rtsp_transport') + 1] == 'tcp'
+    assert command[command.index('-threads') + 1] == '2'
+    assert command[command.index('-skip_frame') + 1] == 'nokey'
+    assert command[command.index('-i') + 1] == 'rtsp://user:@example.com/live'
+    assert command[command.index('-vf') + 1] == 'scale=320:180'
+    assert command.index('-skip_frame') < command.index('-i')
+
+def test_command_for_file():
+    command = FFmpegStream(build_camera('/tmp/video.mp4')).command((64, 48))
+    assert '-rtsp_transport' not in command
+    assert '-skip_frame' not in command
+    assert '-threads' not in command
+
+def test_next():
+    frames = np.arange(3 * 4 * 6 * 3, dtype=np.uint8).reshape(3, 4, 6, 3)
+    process = Mock(stdout=io.BytesIO(frames.tobytes()))
+    stream = FFmpegStream(build_camera())
+
+    with patch.object(FFmpegStream, 'probe', return_value=(6, 4)), patch('subprocess.Popen', return_value=process):
+        assert (stream.next() == frames[0]).all()
+        assert stream.next(retrieve=False) is None
+        assert (stream.next() == frames[2]).all()
+        assert stream.get_size() == (6, 4)
+        assert stream.next() is False
+
+    process.kill.assert_called_once()
+
+def test_open_stream():
+    assert isinstance(open_stream(build_camera()), NetworkStream)
+    stream = open_stream(build_camera(backend='ffmpeg', detection_url='rtsp://example.com/sub'), detection=True)
+    assert isinstance(stream, FFmpegStream)
+    assert stream.command((6, 4))[stream.command((6, 4)).index('-i') + 1] == 'rtsp://example.com/sub'
+    assert set(BACKENDS) == set(CAPTURE_BACKENDS)
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+def test_read_file(tmp_path: Path):
+    video_file = tmp_path / 'video.avi'
+    writer = cv2.VideoWriter(str(video_file), cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+    for value in range(0, 10):
+        writer.write(np.full((48, 64, 3), value * 20, dtype=np.uint8))
+    writer.release()
+
+    stream = FFmpegStream(build_camera(str(video_file)), width=32)
+    frames = []
+
+    while True:
+        frame = stream.next()
+        if frame is False:
+            break
+        frames.append(frame)
+
+    stream.close()
+    assert len(frames) == 10
+    assert frames[0].shape == (24, 32, 3)
+    assert abs(int(frames[5][0, 0, 0]) - 100) < 10
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.cameras.frames import FrameRing
+from multiprocessing import shared_memory
+
+
+def build_frame(value: int):
+    return np.full((4, 6, 3), value, dtype=np.uint8)
+
+def test_write():
+    ring = FrameRing(2, (4, 6, 3))
+    frame = build_frame(7)
+    ref = ring.write(frame)
+    assert (ref.array == frame).all()
+    assert ref.name is None
+
+    with pytest.raises(ValueError):
+        ref.array[0, 0, 0] = 1
+
+def test_slots_are_reused():
+    ring = FrameRing(2, (4, 6, 3))
+    first = ring.write(build_frame(1))
+    second = ring.write(build_frame(2)).retain()
+    first.release()
+    third = ring.write(build_frame(3))
+    assert np.shares_memory(first.array, third.array)
+    assert (third.array == 3).all()
+
+    # The second slot is still referenced
+    second.release()
+    fourth = ring.write(build_frame(4))
+    assert (second.array == 2).all()
+    assert ring.overflows == 1
+    assert not np.shares_memory(second.array, fourth.array)
+
+def test_matches():
+    ring = FrameRing(1, (4, 6, 3))
+    assert ring.matches(build_frame(0))
+    assert not ring.matches(np.zeros((4, 6), dtype=np.uint8))
+    assert not ring.matches(np.zeros((4, 6, 3), dtype=np.float32))
+
+def test_shared():
+    ring = FrameRing(1, (4, 6, 3), shared=True)
+    ref = ring.write(build_frame(5))
+    memory = shared_memory.SharedMemory(name=ref.name)
+    assert (np.ndarray((4, 6, 3), dtype=np.uint8, buffer=memory.buf) == 5).all()
+    memory.close()
+    name = ref.name
+
+    ring.close()
+    ref.release()
+
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
@@ -0,0 +1,161 @@
+import numpy as np
+import time
+
+from app.cameras.handlers import RecognitionHandler
+from app.cameras.motion import MotionGate
+from app.cameras.rates import RateController
+from app.cameras.tracking import FaceTracker
+from app.inference.limiter import limiter
+from unittest.mock import Mock, patch
+
+
+FACE = (40, 100, 80, 60)
+
+
+def build_stream():
+    return Mock(camera_id='camera', camera_name='Camera', camera=Mock(regions=None, priority=0, detector=None))
+
+def build_frame(face: bool):
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+
+    if face:
+        top, right, bottom, left = FACE
+        frame[top:bottom, left:right] = 255
+
+    return frame
+
+def detect_mock(image, detector=None):
+    return [FACE] if image[60, 80, 0] else []
+
+def query_mock(db, image, locations, encodings=None):
+    return Mock(recognitions=list(
+        Mock(identity=Mock(first_name='John'), score=0.9, candidates=[]) for _ in locations
+    ))
+
+def build_handler(**kwargs):
+    handler = RecognitionHandler(build_stream(), **{'max_width': 1000, 'full_resolution': False, 'max_delay': 0, **kwargs})
+
+    # Only the frame following a change passes the gate
+    handler._motion_gate = MotionGate(0.01, learning_rate=1.0)
+    return handler
+
+def test_tracks_expire_while_frames_are_gated():
+    handler = build_handler(face_tracker=FaceTracker(max_age=0.1))
+
+    with patch('app.cameras.handlers.scheduler.detect', side_effect=detect_mock), \
+            patch('app.cameras.handlers.engine.encode', side_effect=lambda image, locations: list(np.zeros(128) for _ in locations)), \
+            patch('app.cameras.handlers.RecognitionController.query', side_effect=query_mock) as query, \
+            patch('app.cameras.handlers.mqtt'):
+        handler.process(build_frame(False))
+        handler.process(build_frame(True))
+        handler.process(build_frame(True))
+        assert query.call_count == 1
+
+        # The person leaves, the frames without motion are gated
+        for _ in range(0, 5):
+            handler.process(build_frame(False))
+        assert handler.stats['gated'] >= 4
+
+        time.sleep(0.15)
+
+        # Another person at the same spot is identified again
+        handler.process(build_frame(True))
+        assert query.call_count == 2
+        assert len(handler._faces.tracks) == 1
+
+def test_motion_is_checked_between_detections():
+    rates = RateController(idle_fps=0.2, active_fps=1.0, budget=10.0)
+    handler = build_handler(rates=rates, motion_fps=2.0)
+    assert handler.max_fps == 2.0
+
+    def slow_detect(image, detector=None):
+        time.sleep(0.05)
+        return detect_mock(image)
+
+    with patch('app.cameras.handlers.scheduler.detect', side_effect=slow_detect) as detect, \
+            patch('app.cameras.handlers.mqtt'):
+        handler.process(build_frame(False))
+        assert detect.call_count == 1
+
+        # Motion raises the rate, faces are only detected once per second
+        handler.process(build_frame(True))
+        assert detect.call_count == 1
+        assert handler.stats['processed'] == 2
+        assert abs(rates.rate('camera') - 1.0) < 1e-3
+
+    # Only the detection is counted in the cost of a frame
+    assert 0.05 <= rates._cameras['camera']['cost'] < 0.5
+
+def test_detection_rate_tolerates_jitter():
+    rates = RateController(idle_fps=2.0, active_fps=2.0, budget=10.0)
+    handler = build_handler(rates=rates, motion_fps=5.0)
+    jitter = np.random.default_rng(0).uniform(-0.03, 0.03, 50)
+
+    with patch('app.cameras.handlers.scheduler.detect', return_value=[]) as detect, \
+            patch('app.cameras.handlers.mqtt'):
+        # Moving frames queued at 5 fps for 10 seconds, processed with some delay
+        for index in range(0, 50):
+            frame = build_frame(False)
+            frame[:40, :40] = 255 * (index % 2)
+            handler._received_at = 1000.0 + index * 0.2 + jitter[index]
+            handler.process(frame)
+
+    assert 19 <= detect.call_count <= 21
+
+def test_stream_rate_is_used_without_motion_gate():
+    handler = build_handler(rates=RateController(idle_fps=0.2, active_fps=1.0))
+    handler._motion_gate = MotionGate(0)
+
+    # The stream already queues the frames at the rate of the camera
+    with patch('app.cameras.handlers.scheduler.detect', return_value=[]) as detect, \
+            patch('app.cameras.handlers.mqtt'):
+        for _ in range(0, 3):
+            handler.process(build_frame(False))
+
+    assert detect.call_count == 3
+
+def test_faces_are_detected_again_on_the_main_stream():
+    # The main stream is twice larger and its frame is read once the face moved
+    main_frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    main_frame[90:170, 130:210] = 255
+    main_stream = Mock(recording=True, snapshot=Mock(return_value=main_frame))
+    handler = build_handler(main_stream=main_stream, full_resolution=True)
+    encoded = []
+
+    def detect_white(image, detector=None):
+        rows, columns = np.nonzero(image[:, :, 0])
+        return [(rows.min(), columns.max() + 1, rows.max() + 1, columns.min())] if rows.size else []
+
+    def encode(image, locations):
+        encoded.extend(image[top:bottom, left:right].min() for top, right, bottom, left in locations)
+        return list(np.zeros(128) for _ in locations)
+
+    with patch('app.cameras.handlers.scheduler.detect', side_effect=detect_mock), \
+            patch('app.cameras.handlers.engine.detect', side_effect=detect_white), \
+            patch('app.cameras.handlers.engine.encode', side_effect=encode), \
+            patch('app.cameras.handlers.RecognitionController.query', side_effect=query_mock), \
+            patch('app.cameras.handlers.mqtt'):
+        handler.process(build_frame(True))
+
+    # The face is encoded where it is on the main stream frame
+    assert encoded == [255]
+
+def test_inference_slot_is_only_held_during_inference():
+    handler = build_handler()
+    held = []
+
+    def record(result):
+        def function(*args, **kwargs):
+            held.append(limiter.active)
+            return result(*args, **kwargs)
+        return function
+
+    with patch('app.cameras.handlers.scheduler.detect', side_effect=record(detect_mock)), \
+            patch('app.cameras.handlers.engine.encode', side_effect=record(lambda image, locations: list(np.zeros(128) for _ in locations))), \
+            patch('app.cameras.handlers.RecognitionController.query', side_effect=record(query_mock)), \
+            patch('app.cameras.handlers.mqtt'):
+        handler.process(build_frame(True))
+
+    # Detection and encoding hold a slot, the identification does not
+    assert held == [1, 1, 0]
+    assert limiter.active == 0
@@ -0,0 +1,38 @@
+import numpy as np
+
+from app.cameras.motion import MotionGate
+
+
+def build_frame(value: int = 0):
+    return np.full((240, 320, 3), value, dtype=np.uint8)
+
+def test_static_frames_are_gated():
+    gate = MotionGate(threshold=0.01)
+    assert gate.check(build_frame())
+    assert not gate.check(build_frame())
+    assert not gate.check(build_frame())
+    assert gate.gated == 2
+    assert gate.processed == 1
+
+def test_moving_frames_are_processed():
+    gate = MotionGate(threshold=0.01)
+    frame = build_frame()
+    assert gate.check(frame)
+    frame = frame.copy()
+    frame[60:180, 80:240] = 255
+    assert gate.check(frame)
+    assert gate.gated == 0
+    assert gate.processed == 2
+
+def test_small_changes_are_gated():
+    gate = MotionGate(threshold=0.01)
+    gate.check(build_frame(100))
+    assert not gate.check(build_frame(110))
+
+def test_disabled_gate():
+    gate = MotionGate(threshold=0.0)
+    assert not gate.enabled
+    assert gate.check(build_frame())
+    assert gate.check(build_frame())
+    assert gate.processed == 2
+    assert gate.gated == 0
@@ -0,0 +1,58 @@
+from app.cameras.rates import RateController
+from unittest.mock import patch
+
+
+def build_controller(**kwargs):
+    controller = RateController(idle_fps=1.0, active_fps=5.0, budget=1.0, decay=10.0, **kwargs)
+    controller.register('a')
+    controller.register('b')
+    return controller
+
+def test_idle_rate():
+    controller = build_controller()
+    assert abs(controller.rate('a') - 1.0) < 1e-6
+    assert abs(controller.rate('unknown') - 1.0) < 1e-6
+
+def test_active_rate_decays():
+    controller = build_controller()
+
+    with patch('time.monotonic', return_value=100.0):
+        controller.report('a', True, 0.01)
+        assert abs(controller.rate('a') - 5.0) < 1e-6
+        assert abs(controller.rate('b') - 1.0) < 1e-6
+
+    with patch('time.monotonic', return_value=110.0):
+        assert abs(controller.rate('a') - (1.0 + 4.0 / 2.718281828)) < 1e-3
+
+    with patch('time.monotonic', return_value=200.0):
+        assert abs(controller.rate('a') - 1.0) < 1e-3
+
+def test_budget():
+    controller = build_controller(smoothing=1.0)
+
+    with patch('time.monotonic', return_value=100.0):
+        # 2 cameras at 5 fps with 0.1 s per frame would use 1 second per second
+        controller.report('a', True, 0.1)
+        controller.report('b', True, 0.1)
+        assert abs(controller.rate('a') - 5.0) < 1e-6
+
+        controller.report('a', True, 0.3)
+        controller.report('b', True, 0.3)
+        rates = controller.rates()
+        assert abs(sum(rate * 0.3 for rate in rates.values()) - 1.0) < 1e-3
+        assert abs(rates['a'] - rates['b']) < 1e-6
+        assert abs(sum(controller.usage().values()) - 1.0) < 1e-3
+
+def test_idle_rate_is_kept_over_budget():
+    controller = build_controller()
+
+    with patch('time.monotonic', return_value=100.0):
+        controller.report('a', True, 1.0)
+        assert abs(controller.rate('a') - 1.0) < 1e-6
+
+def test_report_without_processing():
+    controller = build_controller()
+    controller.report('a', False, 0.01)
+    controller.report('a', True)
+    assert abs(controller._cameras['a']['cost'] - 0.01) < 1e-6
+    assert abs(controller.rate('a') - 5.0) < 1e-3
@@ -0,0 +1,36 @@
+import numpy as np
+
+from app.cameras.regions import RegionMask
+
+
+SHAPE = (100, 200, 3)
+REGIONS = [
+    [(0.1, 0.2), (0.4, 0.2), (0.4, 0.6), (0.1, 0.6)],
+    [(0.5, 0.5), (0.75, 0.5), (0.75, 0.9)],
+]
+
+def test_without_regions():
+    regions = RegionMask(None)
+    frame = np.zeros(SHAPE, dtype=np.uint8)
+    assert not regions.enabled
+    assert regions.bounds(SHAPE) == (0, 200, 100, 0)
+    assert regions.crop(frame)[0] is frame
+    assert regions.contains((0, 10, 10, 0), SHAPE)
+
+def test_bounds():
+    assert RegionMask(REGIONS).bounds(SHAPE) == (20, 150, 90, 20)
+
+def test_crop():
+    frame = np.arange(100 * 200).reshape(100, 200)
+    region, offset = RegionMask(REGIONS).crop(frame)
+    assert region.shape == (70, 130)
+    assert offset == (20, 20)
+    assert region[0, 0] == frame[20, 20]
+
+def test_contains():
+    regions = RegionMask(REGIONS)
+    assert regions.contains((30, 50, 50, 30), SHAPE)
+    assert not regions.contains((0, 20, 10, 0), SHAPE)
+    assert regions.contains((55, 130, 65, 120), SHAPE)
+    assert not regions.contains((75, 115, 85, 105), SHAPE)
+    assert regions.contains((10, 30, 30, 10), SHAPE, offset=(20, 20))
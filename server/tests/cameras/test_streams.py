@@ -0,0 +1,72 @@
+import numpy as np
+import threading
+import time
+
+from app.cameras import VideoStream
+from unittest.mock import Mock, patch
+
+
+class FakeStream(VideoStream):
+    def __init__(self, frames: int):
+        super().__init__(Mock(id='camera', label='Camera'))
+        self._frames = frames
+        self.retrieved = []
+
+    def next(self, retrieve: bool = True):
+        self._frames -= 1
+        self._running = self._frames > 0
+        self.retrieved.append(retrieve)
+        return np.zeros((4, 4, 3), dtype=np.uint8) if retrieve else None
+
+    def get_size(self):
+        return (4, 4)
+
+
+def build_handler(max_fps=None):
+    return Mock(max_fps=max_fps)
+
+def test_only_due_frames_are_decoded():
+    stream = FakeStream(10)
+    handler = build_handler()
+    stream.add_handler(handler, max_fps=2)
+    stream._running = True
+
+    # 25 frames per second
+    with patch('time.time_ns', side_effect=((10000 + index * 40) * 1e6 for index in range(0, 10))):
+        stream.run()
+
+    assert stream.retrieved == [True] + [False] * 9
+    assert handler.add.call_count == 1
+    assert not handler.add.call_args[0][0].array.flags.writeable
+
+def test_handler_rate_overrides_stream_rate():
+    stream = FakeStream(10)
+    handler = build_handler(max_fps=10)
+    stream.add_handler(handler, max_fps=1)
+    stream._running = True
+
+    with patch('time.time_ns', side_effect=((10000 + index * 40) * 1e6 for index in range(0, 10))):
+        stream.run()
+
+    assert stream.retrieved == [True, False, False, True, False, False, True, False, False, True]
+    assert handler.add.call_count == 4
+
+def test_snapshot():
+    stream = FakeStream(10)
+    stream.add_handler(build_handler(), max_fps=1)
+    stream._running = True
+    snapshots = []
+
+    thread = threading.Thread(target=lambda: snapshots.append(stream.snapshot(timeout=5)))
+    thread.start()
+
+    while not stream._snapshot_requested:
+        time.sleep(0.001)
+
+    with patch('time.time_ns', side_effect=((10000 + index * 40) * 1e6 for index in range(0, 10))):
+        stream.run()
+
+    thread.join()
+    assert stream.retrieved == [True] + [False] * 9
+    assert snapshots[0].shape == (4, 4, 3)
+    assert stream.snapshot(timeout=0.01) is None
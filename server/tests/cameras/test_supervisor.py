@@ -0,0 +1,186 @@
+import asyncio
+import numpy as np
+import struct
+import threading
+import time
+
+from app.cameras import FrameHandler, VideoStream
+from app.cameras.frames import FrameRing
+from app.cameras.handlers import AsyncStreamServer
+from app.cameras.supervisor import CameraSupervisor
+from unittest.mock import Mock, patch
+
+
+class FakeStream(VideoStream):
+    def __init__(self, frames: int = 0):
+        super().__init__(Mock(id='camera', label='Camera'))
+        self._frames = frames
+        self.shutdowns = 0
+
+    def next(self, retrieve: bool = True):
+        if self._frames:
+            self._frames -= 1
+            self._running = self._frames > 0
+        return np.zeros((4, 4, 3), dtype=np.uint8)
+
+    def get_size(self):
+        return (4, 4)
+
+    def shutdown(self):
+        self.shutdowns += 1
+        super().shutdown()
+
+
+class OfflineStream(FakeStream):
+    _retry_delay = 0.05
+
+    def __init__(self):
+        super().__init__()
+        self.attempts = 0
+
+    @property
+    def connected(self):
+        return False
+
+    def connect(self):
+        self.attempts += 1
+        time.sleep(0.3)
+        return False
+
+
+class CountingHandler(FrameHandler):
+    def __init__(self, stream: VideoStream):
+        super().__init__(stream)
+        self.calls = []
+        self.threads = set()
+
+    def open(self):
+        self.calls.append('open')
+
+    def close(self):
+        self.calls.append('close')
+
+    def process(self, frame: any):
+        self.calls.append('process')
+        self.threads.add(threading.current_thread().name)
+
+
+class FailingHandler(CountingHandler):
+    def handle(self, item):
+        item[1].release()
+        raise RuntimeError('Handler failure')
+
+
+def test_handlers_process_the_frames():
+    stream = FakeStream(5)
+    handler = stream.add_handler(CountingHandler(stream))
+    supervisor = CameraSupervisor()
+    supervisor.add_stream(stream)
+
+    with patch('app.cameras.supervisor.mqtt'):
+        asyncio.run(supervisor.run())
+
+    assert handler.calls == ['open'] + ['process'] * 5 + ['close']
+    assert all(name.startswith('handlers') for name in handler.threads)
+    assert stream.shutdowns == 1
+    assert supervisor.states() == {
+        'camera': {
+            'FakeStream(camera)': 'stopped',
+            'CountingHandler(camera)': 'stopped',
+        },
+    }
+
+def test_stop_from_another_thread():
+    streams = list(FakeStream() for _ in range(0, 3))
+    handlers = list(stream.add_handler(CountingHandler(stream), max_fps=100) for stream in streams)
+    supervisor = CameraSupervisor(capture_workers=2)
+
+    for stream in streams:
+        supervisor.add_stream(stream)
+
+    threading.Timer(0.2, supervisor.stop).start()
+
+    with patch('app.cameras.supervisor.mqtt'):
+        asyncio.run(supervisor.run())
+
+    for stream, handler in zip(streams, handlers):
+        assert not stream.running
+        assert stream.shutdowns == 1
+        assert handler.calls[0] == 'open' and handler.calls[-1] == 'close'
+        assert 'process' in handler.calls
+
+def test_failed_handlers_are_not_dispatched():
+    stream = FakeStream(20)
+    failing = stream.add_handler(FailingHandler(stream))
+    handler = stream.add_handler(CountingHandler(stream))
+    supervisor = CameraSupervisor(capture_workers=1)
+    supervisor.add_stream(stream)
+
+    with patch('app.cameras.supervisor.mqtt'):
+        asyncio.run(supervisor.run())
+
+    assert stream.handlers == [handler]
+    assert handler.calls.count('process') == 20
+    assert failing.calls == ['open', 'close']
+    assert failing.poll() is None
+    assert supervisor.states()['camera']['FailingHandler(camera)'] == 'failed'
+
+def test_discarded_frames_are_released():
+    ring = FrameRing(1, (4, 4, 3))
+    handler = FrameHandler(FakeStream())
+
+    ref = ring.write(np.zeros((4, 4, 3), dtype=np.uint8))
+    handler.add(ref)
+    ref.release()
+    handler.discard()
+
+    # Frames queued after the handler was discarded are not retained
+    ref = ring.write(np.zeros((4, 4, 3), dtype=np.uint8))
+    handler.add(ref)
+    ref.release()
+
+    assert handler.poll() is None
+    assert ring.overflows == 0
+    ring.close()
+
+def test_offline_streams_do_not_hold_the_capture_workers():
+    offline = list(OfflineStream() for _ in range(0, 3))
+    stream = FakeStream(20)
+    handler = stream.add_handler(CountingHandler(stream))
+    supervisor = CameraSupervisor(capture_workers=1)
+
+    for item in offline + [stream]:
+        supervisor.add_stream(item)
+
+    threading.Timer(0.5, supervisor.stop).start()
+
+    with patch('app.cameras.supervisor.mqtt'):
+        asyncio.run(supervisor.run())
+
+    # The reads of the online stream never waited for the offline ones
+    assert handler.calls.count('process') == 20
+    # Each attempt blocks a connect thread for 0.3 seconds, then waits for the retry delay on the loop
+    assert all(2 <= item.attempts <= 3 for item in offline)
+    assert supervisor.states()['camera']['OfflineStream(camera)'] == 'stopped'
+
+def test_async_stream_server(tmp_path):
+    server = AsyncStreamServer(tmp_path / 'streams' / 'camera.sock')
+
+    async def scenario():
+        await server.start()
+        reader, writer = await asyncio.open_unix_connection(str(tmp_path / 'streams' / 'camera.sock'))
+
+        while not server.clients:
+            await asyncio.sleep(0.01)
+
+        # Frames are sent from the threads of the handlers
+        await asyncio.get_running_loop().run_in_executor(None, server.send_to_clients, b'jpeg')
+        size = struct.unpack('>L', await reader.readexactly(4))[0]
+        data = await reader.readexactly(size)
+
+        writer.close()
+        await server.stop()
+        return data
+
+    assert asyncio.run(scenario()) == b'jpeg'
+    assert not (tmp_path / 'streams' / 'camera.sock').exists()
@@ -0,0 +1,70 @@
+import numpy as np
+
+from app.cameras.tracking import FaceTracker, iou
+from unittest.mock import Mock
+
+
+def build_recognition(score):
+    return Mock(score=score)
+
+def test_iou():
+    assert iou((0, 10, 10, 0), (0, 10, 10, 0)) == 1.0
+    assert iou((0, 10, 10, 0), (0, 20, 10, 10)) == 0.0
+    assert abs(iou((0, 10, 10, 0), (0, 15, 10, 5)) - 50 / 150) < 1e-6
+
+def test_update():
+    tracker = FaceTracker()
+    first = tracker.update([(0, 10, 10, 0), (0, 110, 10, 100)])
+    second = tracker.update([(0, 112, 10, 102), (1, 11, 11, 1)])
+    assert second[0] is first[1]
+    assert second[1] is first[0]
+    assert second[0].rect == (0, 112, 10, 102)
+    third = tracker.update([(50, 60, 60, 50)])
+    assert third[0].id not in (first[0].id, first[1].id)
+
+def test_lost_tracks_are_forgotten():
+    tracker = FaceTracker(max_misses=2)
+    tracker.update([(0, 10, 10, 0)])
+    tracker.update([])
+    tracker.update([])
+    assert len(tracker.tracks) == 1
+    tracker.update([])
+    assert tracker.tracks == []
+
+def test_needs_identification():
+    tracker = FaceTracker(confidence_threshold=0.6, retry_interval=2)
+    track = tracker.update([(0, 10, 10, 0)])[0]
+    assert tracker.needs_identification(track)
+    track.identify(build_recognition(0.8), np.zeros(128))
+    tracker.update([(0, 10, 10, 0)])
+    assert not tracker.needs_identification(track)
+
+    track.identify(build_recognition(None), np.zeros(128))
+    tracker.update([(0, 10, 10, 0)])
+    assert not tracker.needs_identification(track)
+    tracker.update([(0, 10, 10, 0)])
+    assert tracker.needs_identification(track)
+
+def test_resume():
+    tracker = FaceTracker(embedding_distance=0.4)
+    track = tracker.update([(0, 10, 10, 0)])[0]
+    track.identify(build_recognition(0.8), np.zeros(128))
+
+    other = tracker.update([(100, 110, 110, 100)])[0]
+    assert tracker.resume(other, np.ones(128)) is None
+    assert other in tracker.tracks
+
+    other = tracker.update([(200, 210, 210, 200)])[0]
+    assert tracker.resume(other, np.full(128, 0.01)) is track
+    assert other not in tracker.tracks
+    assert track.rect == (200, 210, 210, 200)
+    assert track.misses == 0
+    assert not tracker.needs_identification(track)
+
+def test_tracks_expire():
+    tracker = FaceTracker(max_age=10)
+    track = tracker.update([(0, 10, 10, 0)])[0]
+    tracker.expire(track.seen_at + 5)
+    assert tracker.tracks == [track]
+    tracker.expire(track.seen_at + 11)
+    assert tracker.tracks == []
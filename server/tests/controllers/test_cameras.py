@@ -9,6 +9,7 @@ from app.controllers.cameras import CameraController
 from app.constants import RECORDS_DIR
 from app.models.cameras import Camera
 from app.schemas.cameras import CameraCreate, CameraUpdate, CameraRecord
+from pydantic import ValidationError
 from unittest.mock import Mock, patch
 from uuid import UUID
 from sqlalchemy.exc import NoResultFound
@@ -53,15 +54,38 @@ def test_create_camera(database: Session):
     assert camera.url == payload.url
     assert camera.username is None
     assert camera.password is None
+    assert camera.detector is None
+    assert camera.priority == 0
+    assert camera.detection_url is None
+
+def test_create_camera_with_unknown_detector():
+    with pytest.raises(ValidationError):
+        CameraCreate(label='Dummy', url='http://example.com/', detector='unknown')
+
+def test_create_camera_with_unknown_backend():
+    with pytest.raises(ValidationError):
+        CameraCreate(label='Dummy', url='http://example.com/', backend='unknown')
+
+def test_create_camera_with_invalid_regions():
+    with pytest.raises(ValidationError):
+        CameraCreate(label='Dummy', url='http://example.com/', regions=[[(0, 0), (1, 1)]])
+    with pytest.raises(ValidationError):
+        CameraCreate(label='Dummy', url='http://example.com/', regions=[[(0, 0), (1, 0), (2, 1)]])
+    assert CameraCreate(label='Dummy', url='http://example.com/', regions=[]).regions is None
 
 def test_update_camera(database: Session, camera: Camera):
-    payload = CameraUpdate(label='New label', url='http://new.example.com/', username='new username', password='new password')
+    payload = CameraUpdate(label='New label', url='http://new.example.com/', username='new username', password='new password', detector='haar', regions=[[(0, 0), (0.5, 0), (0.5, 1)]], priority=10, detection_url='rtsp://new.example.com/sub', backend='ffmpeg')
     updated_camera = CameraController.update_camera(database, camera.id, payload)
     assert isinstance(updated_camera, Camera)
     assert updated_camera.label == payload.label
     assert updated_camera.url == payload.url
     assert updated_camera.username == payload.username
     assert updated_camera.password == payload.password
+    assert updated_camera.detector == payload.detector
+    assert updated_camera.regions == [[[0, 0], [0.5, 0], [0.5, 1]]]
+    assert updated_camera.priority == 10
+    assert updated_camera.detection_url == payload.detection_url
+    assert updated_camera.backend == 'ffmpeg'
 
 def test_delete_camera(database: Session, camera: Camera):
     CameraController.get_camera(database, camera.id)
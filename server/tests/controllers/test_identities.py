@@ -44,7 +44,7 @@ def test_get_identity_faces_without_faces(database: Session, identity: Identity)
     assert len(result) == 0
 
 def test_get_identity_faces(database: Session, identity: Identity):
-    face = insert_face_encoding(database, identity, vec_low=[1.0], vec_high=[2.0])
+    face = insert_face_encoding(database, identity, vec=list(float(i) for i in range(0, 128)))
     result = IdentityController.get_identity_faces(database, identity.id)
     assert isinstance(result, list)
     assert len(result) == 1
@@ -52,8 +52,7 @@ def test_get_identity_faces(database: Session, identity: Identity):
     assert result[0].id == face.id
     assert result[0].identity.id == identity.id
     assert result[0].identity_id == identity.id
-    assert result[0].vec_low == face.vec_low
-    assert result[0].vec_high == face.vec_high
+    assert result[0].vec.tolist() == face.vec.tolist()
 
 def test_create_identity(database: Session):
     payload = IdentityCreate(first_name='Creation', last_name='Test')
@@ -102,8 +101,7 @@ def test_delete_identity_face(database: Session, identity: Identity):
     assert result[0].id == face.id
     assert result[0].identity.id == identity.id
     assert result[0].identity_id == identity.id
-    assert result[0].vec_low == face.vec_low
-    assert result[0].vec_high == face.vec_high
+    assert result[0].vec.tolist() == face.vec.tolist()
 
     IdentityController.delete_identity_face(database, identity.id, face.id)
     result = IdentityController.get_identity_faces(database, identity.id)
@@ -126,8 +124,7 @@ def test_delete_identity_face_with_existing_file(database: Session, identity: Id
     assert result[0].id == face.id
     assert result[0].identity.id == identity.id
     assert result[0].identity_id == identity.id
-    assert result[0].vec_low == face.vec_low
-    assert result[0].vec_high == face.vec_high
+    assert result[0].vec.tolist() == face.vec.tolist()
 
     IdentityController.delete_identity_face(database, identity.id, face.id)
     result = IdentityController.get_identity_faces(database, identity.id)
@@ -163,3 +160,26 @@ def test_clear_identity_with_existing_directory(database: Session, identity: Ide
     assert isinstance(result, list)
     assert len(result) == 0
     assert not identity_dir.exists()
+
+def test_compact_identity_faces(database: Session, identity: Identity):
+    kept = insert_face_encoding(database, identity, vec=list(0.0 for i in range(0, 128)))
+    duplicate = insert_face_encoding(database, identity, vec=list(0.001 for i in range(0, 128)))
+    other = insert_face_encoding(database, identity, vec=list(1.0 for i in range(0, 128)))
+
+    # Create empty face files
+    for face in (kept, duplicate, other):
+        face_file = FACES_DIR / str(identity.id) / f'{face.id}.png'
+        face_file.parent.mkdir(parents=True, exist_ok=True)
+        face_file.open('w').close()
+
+    assert IdentityController.compact_identity_faces(database, identity.id, 0.1, dry_run=True) == (3, 2)
+    assert len(IdentityController.get_identity_faces(database, identity.id)) == 3
+
+    assert IdentityController.compact_identity_faces(database, identity.id, 0.1) == (3, 2)
+    result = IdentityController.get_identity_faces(database, identity.id)
+    assert sorted(face.id for face in result) == sorted([kept.id, other.id])
+    assert not (FACES_DIR / str(identity.id) / f'{duplicate.id}.png').exists()
+    assert (FACES_DIR / str(identity.id) / f'{kept.id}.png').exists()
+
+def test_compact_identity_faces_without_faces(database: Session, identity: Identity):
+    assert IdentityController.compact_identity_faces(database, identity.id) == (0, 0)
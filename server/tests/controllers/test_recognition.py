@@ -48,13 +48,19 @@ def build_identify_mock(encoding: List[float], identity: Optional[Identity] = No
         return Recognition(**result), encoding
     return mock
 
+def build_identify_many_mock(encoding: List[float], identity: Optional[Identity] = None, score: Optional[float] = None):
+    identify_mock = build_identify_mock(encoding, identity, score)
+    def mock(database: Session, image, rects):
+        return list(identify_mock(database, image, rect) for rect in rects)
+    return mock
+
 def build_image_mock(image_data = 'face-data', shape = (800, 800)):
     return Mock(__getitem__=lambda self, key: [image_data], shape=shape)
 
 def cv2_imread_mock(filename: str):
     return build_image_mock()
 
-def cv2_imwrite_mock(filename: str, data: list) -> bool:
+def cv2_imwrite_mock(filename: str, data: list, params: Optional[list] = None) -> bool:
     file = Path(filename)
 
     if not file.parent.exists():
@@ -78,7 +84,7 @@ def test_get_faces_locations():
     with patch('face_recognition.face_locations', Mock()) as mock:
         mock.return_value = 'dummy-result'
         assert RecognitionController.get_faces_locations('dummy') == 'dummy-result'
-        mock.assert_called_with('dummy')
+        mock.assert_called_with('dummy', number_of_times_to_upsample=1, model='hog')
 
 def test_create_face_encoding_without_face():
     with pytest.raises(NoEncodingFoundException):
@@ -105,19 +111,19 @@ def test_create_face_encoding(database: Session, identity: Identity):
         assert result.id is not None
         assert result.identity_id == identity.id
         assert result.identity.id == identity.id
-        assert result.vec_low == DUMMY_ENCODING[0:64]
-        assert result.vec_high == DUMMY_ENCODING[64:128]
+        assert result.vec.tolist() == DUMMY_ENCODING
         assert face_file.exists()
 
 def test_query_when_unable_to_write_full_image(database: Session):
     with pytest.raises(RecognitionException) as ei:
-        with patch('cv2.imwrite', return_value=False):
-            RecognitionController.query(database, None, None)
+        with patch('app.controllers.recognition.RecognitionController.identify_many', side_effect=build_identify_many_mock(list(1.0 for i in range(0, 128)))):
+            with patch('cv2.imwrite', return_value=False):
+                RecognitionController.query(database, build_image_mock(), [(1, 2, 3, 4)])
     assert ei.value.args[0] == 'Unable to write query full image'
     assert len(RecognitionController.get_queries(database)) == 0
 
 def test_query_with_unknown_identity(database: Session):
-    with patch('app.controllers.recognition.RecognitionController.identify', side_effect=build_identify_mock(list(1.0 for i in range(0, 128)))):
+    with patch('app.controllers.recognition.RecognitionController.identify_many', side_effect=build_identify_many_mock(list(1.0 for i in range(0, 128)))):
         with patch('cv2.imread', side_effect=cv2_imread_mock):
             with patch('cv2.imwrite', side_effect=cv2_imwrite_mock):
                 result = RecognitionController.query(database, build_image_mock(), [(1, 2, 3, 4)])
@@ -132,7 +138,7 @@ def test_query_with_unknown_identity(database: Session):
     assert len(RecognitionController.get_suggestions(database)) == 1
 
 def test_query_with_known_identity_and_low_score(database: Session, identity: Identity):
-    with patch('app.controllers.recognition.RecognitionController.identify', side_effect=build_identify_mock(list(1.0 for i in range(0, 128)), identity, 0.5)):
+    with patch('app.controllers.recognition.RecognitionController.identify_many', side_effect=build_identify_many_mock(list(1.0 for i in range(0, 128)), identity, 0.5)):
         with patch('cv2.imread', side_effect=cv2_imread_mock):
             with patch('cv2.imwrite', side_effect=cv2_imwrite_mock):
                 result = RecognitionController.query(database, build_image_mock(), [(1, 2, 3, 4)])
@@ -148,7 +154,7 @@ def test_query_with_known_identity_and_low_score(database: Session, identity: Id
     assert len(RecognitionController.get_suggestions(database)) == 1
 
 def test_query_with_known_identity_and_high_score(database: Session, identity: Identity):
-    with patch('app.controllers.recognition.RecognitionController.identify', side_effect=build_identify_mock(list(1.0 for i in range(0, 128)), identity, 0.8)):
+    with patch('app.controllers.recognition.RecognitionController.identify_many', side_effect=build_identify_many_mock(list(1.0 for i in range(0, 128)), identity, 0.8)):
         with patch('cv2.imread', side_effect=cv2_imread_mock):
             with patch('cv2.imwrite', side_effect=cv2_imwrite_mock):
                 result = RecognitionController.query(database, build_image_mock(), [(1, 2, 3, 4)])
@@ -164,7 +170,7 @@ def test_query_with_known_identity_and_high_score(database: Session, identity: I
     assert len(RecognitionController.get_suggestions(database)) == 0
 
 def test_query_and_return_image_without_resize(database: Session):
-    with patch('app.controllers.recognition.RecognitionController.identify', side_effect=build_identify_mock(list(1.0 for i in range(0, 128)))):
+    with patch('app.controllers.recognition.RecognitionController.identify_many', side_effect=build_identify_many_mock(list(1.0 for i in range(0, 128)))):
         with patch('cv2.imread', side_effect=cv2_imread_mock):
             with patch('cv2.imwrite', side_effect=cv2_imwrite_mock):
                 with patch('cv2.rectangle', return_value=True):
@@ -176,7 +182,7 @@ def test_query_and_return_image_without_resize(database: Session):
                             resize_mock.assert_not_called()
 
 def test_query_and_return_image_without_known_identity(database: Session):
-    with patch('app.controllers.recognition.RecognitionController.identify', side_effect=build_identify_mock(list(1.0 for i in range(0, 128)))):
+    with patch('app.controllers.recognition.RecognitionController.identify_many', side_effect=build_identify_many_mock(list(1.0 for i in range(0, 128)))):
         with patch('cv2.imread', side_effect=cv2_imread_mock) as imread_mock:
             with patch('cv2.imwrite', side_effect=cv2_imwrite_mock):
                 with patch('cv2.rectangle', return_value=True):
@@ -188,7 +194,7 @@ def test_query_and_return_image_without_known_identity(database: Session):
                             resize_mock.assert_called_once()
 
 def test_query_and_return_image_with_known_identity(database: Session, identity: Identity):
-    with patch('app.controllers.recognition.RecognitionController.identify', side_effect=build_identify_mock(list(1.0 for i in range(0, 128)), identity, 0.8)):
+    with patch('app.controllers.recognition.RecognitionController.identify_many', side_effect=build_identify_many_mock(list(1.0 for i in range(0, 128)), identity, 0.8)):
         with patch('cv2.imread', side_effect=cv2_imread_mock):
             with patch('cv2.imwrite', side_effect=cv2_imwrite_mock):
                 with patch('cv2.rectangle', return_value=True):
@@ -261,11 +267,11 @@ def test_confirm_suggestion(database: Session, query: Query):
     identity_1 = insert_identity(database, first_name='Identity 1')
     identity_2 = insert_identity(database, first_name='Identity 2')
 
-    suggestion_1 = insert_suggestion(database, query, identity_2, vec_low=list(1.0 for i in range(0, 64)), vec_high=list(1.0 + 32 for i in range(0, 64)))
-    suggestion_2 = insert_suggestion(database, query, identity_2, vec_low=list(2.0 for i in range(0, 64)), vec_high=list(2.0 + 32 for i in range(0, 64)))
-    suggestion_3 = insert_suggestion(database, query, vec_low=list(3.0 for i in range(0, 64)), vec_high=list(3.0 + 32 for i in range(0, 64)))
-    suggestion_4 = insert_suggestion(database, query, vec_low=list(4.0 for i in range(0, 64)), vec_high=list(4.0 + 32 for i in range(0, 64)))
-    suggestion_5 = insert_suggestion(database, query, vec_low=list(5.0 for i in range(0, 64)), vec_high=list(5.0 + 32 for i in range(0, 64)))
+    suggestion_1 = insert_suggestion(database, query, identity_2, vec=list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64)))
+    suggestion_2 = insert_suggestion(database, query, identity_2, vec=list(2.0 for i in range(0, 64)) + list(2.0 + 32 for i in range(0, 64)))
+    suggestion_3 = insert_suggestion(database, query, vec=list(3.0 for i in range(0, 64)) + list(3.0 + 32 for i in range(0, 64)))
+    suggestion_4 = insert_suggestion(database, query, vec=list(4.0 for i in range(0, 64)) + list(4.0 + 32 for i in range(0, 64)))
+    suggestion_5 = insert_suggestion(database, query, vec=list(5.0 for i in range(0, 64)) + list(5.0 + 32 for i in range(0, 64)))
 
     query_dir = QUERIES_DIR / str(query.id)
     query_dir.mkdir(parents=True)
@@ -279,8 +285,7 @@ def test_confirm_suggestion(database: Session, query: Query):
             result = RecognitionController.confirm_suggestion(database, query.id, suggestion_1.id)
             assert result.id is not None
             assert result.identity_id == identity_2.id
-            assert result.vec_low == list(1.0 for i in range(0, 64))
-            assert result.vec_high == list(1.0 + 32 for i in range(0, 64))
+            assert result.vec.tolist() == list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64))
             imread.assert_called_with(str(query_dir / f'{suggestion_1.id}.png'))
             imwrite.assert_called_with(str(FACES_DIR / str(identity_2.id) / f'{result.id}.png'), ['face-data'])
             imread.reset_mock()
@@ -290,8 +295,7 @@ def test_confirm_suggestion(database: Session, query: Query):
             result = RecognitionController.confirm_suggestion(database, query.id, suggestion_2.id, identity_1)
             assert result.id is not None
             assert result.identity_id == identity_1.id
-            assert result.vec_low == list(2.0 for i in range(0, 64))
-            assert result.vec_high == list(2.0 + 32 for i in range(0, 64))
+            assert result.vec.tolist() == list(2.0 for i in range(0, 64)) + list(2.0 + 32 for i in range(0, 64))
             imread.assert_called_with(str(query_dir / f'{suggestion_2.id}.png'))
             imwrite.assert_called_with(str(FACES_DIR / str(identity_1.id) / f'{result.id}.png'), ['face-data'])
             imread.reset_mock()
@@ -301,8 +305,7 @@ def test_confirm_suggestion(database: Session, query: Query):
             result = RecognitionController.confirm_suggestion(database, query.id, suggestion_3.id, identity_1)
             assert result.id is not None
             assert result.identity_id == identity_1.id
-            assert result.vec_low == list(3.0 for i in range(0, 64))
-            assert result.vec_high == list(3.0 + 32 for i in range(0, 64))
+            assert result.vec.tolist() == list(3.0 for i in range(0, 64)) + list(3.0 + 32 for i in range(0, 64))
             imread.assert_called_with(str(query_dir / f'{suggestion_3.id}.png'))
             imwrite.assert_called_with(str(FACES_DIR / str(identity_1.id) / f'{result.id}.png'), ['face-data'])
             imread.reset_mock()
@@ -350,10 +353,10 @@ def test_delete_suggestion(database: Session, query: Query):
     assert not query_dir.exists()
 
 def test_clear_suggestions(database: Session, query: Query):
-    suggestion_1 = insert_suggestion(database, query, vec_low=list(1.0 for i in range(0, 64)), vec_high=list(1.0 + 32 for i in range(0, 64)))
-    suggestion_2 = insert_suggestion(database, query, vec_low=list(2.0 for i in range(0, 64)), vec_high=list(2.0 + 32 for i in range(0, 64)))
-    suggestion_3 = insert_suggestion(database, query, vec_low=list(3.0 for i in range(0, 64)), vec_high=list(3.0 + 32 for i in range(0, 64)))
-    suggestion_4 = insert_suggestion(database, query, vec_low=list(4.0 for i in range(0, 64)), vec_high=list(4.0 + 32 for i in range(0, 64)))
+    suggestion_1 = insert_suggestion(database, query, vec=list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64)))
+    suggestion_2 = insert_suggestion(database, query, vec=list(2.0 for i in range(0, 64)) + list(2.0 + 32 for i in range(0, 64)))
+    suggestion_3 = insert_suggestion(database, query, vec=list(3.0 for i in range(0, 64)) + list(3.0 + 32 for i in range(0, 64)))
+    suggestion_4 = insert_suggestion(database, query, vec=list(4.0 for i in range(0, 64)) + list(4.0 + 32 for i in range(0, 64)))
 
     query_dir = QUERIES_DIR / str(query.id)
     query_dir.mkdir(parents=True)
@@ -367,10 +370,10 @@ def test_clear_suggestions(database: Session, query: Query):
     assert len(RecognitionController.get_suggestions(database)) == 0
 
 def test_compute_suggestions_with_high_confidence(database: Session, query: Query, identity: Identity):
-    insert_face_encoding(database, identity, vec_low=list(1.0 for i in range(0, 64)), vec_high=list(1.0 + 32 for i in range(0, 64)))
+    insert_face_encoding(database, identity, vec=list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64)))
 
-    suggestion_1 = insert_suggestion(database, query, vec_low=list(1.0 for i in range(0, 64)), vec_high=list(1.0 + 32 for i in range(0, 64)), rect=[1, 1, 1, 1])
-    suggestion_2 = insert_suggestion(database, query, vec_low=list(2.0 for i in range(0, 64)), vec_high=list(2.0 + 32 for i in range(0, 64)), rect=[2, 2, 2, 2])
+    suggestion_1 = insert_suggestion(database, query, vec=list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64)), rect=[1, 1, 1, 1])
+    suggestion_2 = insert_suggestion(database, query, vec=list(2.0 for i in range(0, 64)) + list(2.0 + 32 for i in range(0, 64)), rect=[2, 2, 2, 2])
 
     query_dir = QUERIES_DIR / str(query.id)
     query_dir.mkdir(parents=True)
@@ -395,12 +398,12 @@ def test_compute_suggestions_with_high_confidence(database: Session, query: Quer
                 }
             }
         }
-        encoding = suggestion_2.vec_low + suggestion_2.vec_high
+        encoding = suggestion_2.vec
 
         if rect == [1, 1, 1, 1]:
             result['identity'] = identity
             result['score'] = 1.0
-            encoding = suggestion_1.vec_low + suggestion_1.vec_high
+            encoding = suggestion_1.vec
 
         return Recognition(**result), encoding
 
@@ -416,10 +419,10 @@ def test_compute_suggestions_with_high_confidence(database: Session, query: Quer
     assert suggestions[0].score is None
 
 def test_compute_suggestions_with_low_confidence(database: Session, query: Query, identity: Identity):
-    insert_face_encoding(database, identity, vec_low=list(1.0 for i in range(0, 64)), vec_high=list(1.0 + 32 for i in range(0, 64)))
+    insert_face_encoding(database, identity, vec=list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64)))
 
-    suggestion_1 = insert_suggestion(database, query, vec_low=list(1.0 for i in range(0, 64)), vec_high=list(1.0 + 32 for i in range(0, 64)), rect=[1, 1, 1, 1])
-    suggestion_2 = insert_suggestion(database, query, vec_low=list(2.0 for i in range(0, 64)), vec_high=list(2.0 + 32 for i in range(0, 64)), rect=[2, 2, 2, 2])
+    suggestion_1 = insert_suggestion(database, query, vec=list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64)), rect=[1, 1, 1, 1])
+    suggestion_2 = insert_suggestion(database, query, vec=list(2.0 for i in range(0, 64)) + list(2.0 + 32 for i in range(0, 64)), rect=[2, 2, 2, 2])
 
     query_dir = QUERIES_DIR / str(query.id)
     query_dir.mkdir(parents=True)
@@ -444,12 +447,13 @@ def test_compute_suggestions_with_low_confidence(database: Session, query: Query
                 }
             }
         }
-        encoding = suggestion_2.vec_low + suggestion_2.vec_high
+        encoding = suggestion_2.vec
 
         if rect == [1, 1, 1, 1]:
             result['identity'] = identity
             result['score'] = 0.5
-            encoding = suggestion_1.vec_low + suggestion_1.vec_high
+            result['candidates'] = [{'identity': identity, 'score': 0.5, 'votes': 2}]
+            encoding = suggestion_1.vec
 
         return Recognition(**result), encoding
 
@@ -466,9 +470,13 @@ def test_compute_suggestions_with_low_confidence(database: Session, query: Query
     assert suggestions[1].id == suggestion_1.id
     assert suggestions[1].identity_id == identity.id
     assert suggestions[1].score == 0.5
+    assert suggestions[1].candidates == [{'identity_id': str(identity.id), 'score': 0.5, 'votes': 2}]
+    candidates = RecognitionController.get_suggestions_candidates(database, suggestions)
+    assert candidates[suggestions[0].id] == []
+    assert candidates[suggestions[1].id][0]['identity'].id == identity.id
 
 def test_compute_suggestions_with_missing_file(database: Session, query: Query):
-    suggestion = insert_suggestion(database, query, vec_low=list(1.0 for i in range(0, 64)), vec_high=list(1.0 + 32 for i in range(0, 64)), rect=[1, 1, 1, 1])
+    suggestion = insert_suggestion(database, query, vec=list(1.0 for i in range(0, 64)) + list(1.0 + 32 for i in range(0, 64)), rect=[1, 1, 1, 1])
 
     query_dir = QUERIES_DIR / str(query.id)
     query_dir.mkdir(parents=True)
@@ -500,14 +508,13 @@ def test_identity_with_unknown_identity(database: Session):
         assert recognition.rect.start.y == 10
         assert recognition.rect.end.x == 50
         assert recognition.rect.end.y == 60
-        assert encoding == list(float(i) for i in range(0, 128))
+        assert encoding.tolist() == list(float(i) for i in range(0, 128))
 
 def test_identity_with_known_identity(database: Session, identity: Identity):
     insert_face_encoding(
         database,
         identity,
-        vec_low=list(float(i) for i in range(0, 64)),
-        vec_high=list(float(i + 64) for i in range(0, 64))
+        vec=list(float(i) for i in range(0, 128))
     )
     with patch('face_recognition.face_encodings', return_value=[list(str(i) for i in range(0, 128))]):
         recognition, encoding = RecognitionController.identify(database, None, [10, 50, 60, 20])
@@ -519,4 +526,49 @@ def test_identity_with_known_identity(database: Session, identity: Identity):
         assert recognition.rect.start.y == 10
         assert recognition.rect.end.x == 50
         assert recognition.rect.end.y == 60
-        assert encoding == list(float(i) for i in range(0, 128))
+        assert encoding.tolist() == list(float(i) for i in range(0, 128))
+
+def test_identify_many_without_rects(database: Session):
+    with patch('face_recognition.face_encodings', Mock()) as face_encodings_mock:
+        assert RecognitionController.identify_many(database, None, []) == []
+        face_encodings_mock.assert_not_called()
+
+def test_identify_many(database: Session, identity: Identity):
+    insert_face_encoding(
+        database,
+        identity,
+        vec=list(float(i) for i in range(0, 128))
+    )
+    encodings = [
+        list(str(i) for i in range(0, 128)),
+        list(str(i + 1) for i in range(0, 128)),
+    ]
+    with patch('face_recognition.face_encodings', return_value=encodings) as face_encodings_mock:
+        results = RecognitionController.identify_many(database, None, [[10, 50, 60, 20], [70, 90, 100, 60]])
+        face_encodings_mock.assert_called_once_with(None, known_face_locations=[[10, 50, 60, 20], [70, 90, 100, 60]])
+        assert len(results) == 2
+        assert results[0][0].identity.id == identity.id
+        assert results[0][0].score == 1.0
+        assert results[0][1].tolist() == list(float(i) for i in range(0, 128))
+        assert results[1][0].identity is None
+        assert results[1][0].score is None
+        assert results[1][0].rect.start.x == 60
+        assert results[1][0].rect.start.y == 70
+        assert results[1][1].tolist() == list(float(i + 1) for i in range(0, 128))
+
+def test_identify_many_with_candidates(database: Session, identity: Identity):
+    other_identity = insert_identity(database, first_name='Jane')
+    insert_face_encoding(database, identity, vec=list(0.0 for i in range(0, 128)))
+    insert_face_encoding(database, other_identity, vec=list(0.01 for i in range(0, 128)))
+    insert_face_encoding(database, other_identity, vec=list(0.02 for i in range(0, 128)))
+    with patch('face_recognition.face_encodings', return_value=[list(0.0 for i in range(0, 128))]):
+        with patch.object(RecognitionController, 'candidates', 2):
+            recognition, _ = RecognitionController.identify(database, None, [10, 50, 60, 20])
+            assert recognition.identity.id == identity.id
+            assert [candidate.identity.id for candidate in recognition.candidates] == [identity.id, other_identity.id]
+            assert [candidate.votes for candidate in recognition.candidates] == [1, 2]
+
+            with patch.object(RecognitionController, 'vote', True):
+                recognition, _ = RecognitionController.identify(database, None, [10, 50, 60, 20])
+                assert recognition.identity.id == other_identity.id
+                assert recognition.candidates[0].votes == 2
@@ -0,0 +1,20 @@
+import numpy as np
+
+from app.gallery.compaction import near_duplicates
+
+
+def test_near_duplicates():
+    vectors = np.array([[0.0, 0.0], [0.05, 0.0], [1.0, 0.0], [0.0, 0.08], [1.0, 0.05]])
+    assert near_duplicates(vectors, 0.1).tolist() == [False, True, False, True, True]
+
+def test_near_duplicates_keeps_chains():
+    # The second vector is removed so it cannot remove the third one
+    vectors = np.array([[0.0], [0.08], [0.16]])
+    assert near_duplicates(vectors, 0.1).tolist() == [False, True, False]
+
+def test_near_duplicates_across_blocks():
+    vectors = np.array([[0.0], [1.0], [0.01], [1.01], [2.0]])
+    assert near_duplicates(vectors, 0.1, block_size=2).tolist() == [False, False, True, True, False]
+
+def test_near_duplicates_without_vectors():
+    assert near_duplicates(np.empty((0, 128)), 0.1).shape == (0,)
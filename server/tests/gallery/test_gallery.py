@@ -0,0 +1,179 @@
+import numpy as np
+
+from app.gallery import Gallery
+from unittest.mock import Mock
+from uuid import uuid4
+
+
+IDENTITY_1 = uuid4()
+IDENTITY_2 = uuid4()
+
+
+def build_encoding(value: float):
+    return list(value for i in range(0, 128))
+
+def build_database_mock(rows):
+    return Mock(query=Mock(return_value=Mock(all=Mock(return_value=rows))))
+
+def build_row(identity_id, encoding):
+    return (uuid4(), identity_id, np.asarray(encoding, dtype=np.float32))
+
+def build_gallery():
+    gallery = Gallery()
+    gallery.load(build_database_mock([
+        build_row(IDENTITY_1, build_encoding(0.0)),
+        build_row(IDENTITY_1, build_encoding(0.1)),
+        build_row(IDENTITY_2, build_encoding(1.0)),
+        build_row(IDENTITY_2, []),
+    ]))
+    return gallery
+
+def test_load():
+    gallery = build_gallery()
+    assert gallery.loaded
+    assert len(gallery) == 3
+
+def test_ensure_loaded():
+    gallery = Gallery()
+    db = build_database_mock([build_row(IDENTITY_1, build_encoding(0.0))])
+    gallery.ensure_loaded(db)
+    gallery.ensure_loaded(db)
+    assert len(gallery) == 1
+    db.query.assert_called_once()
+
+def test_search_on_empty_gallery():
+    gallery = Gallery()
+    gallery.load(build_database_mock([]))
+    assert gallery.search(build_encoding(0.0)) is None
+
+def test_search():
+    gallery = build_gallery()
+    identity_id, distance = gallery.search(build_encoding(0.0))
+    assert identity_id == IDENTITY_1
+    assert distance == 0.0
+    identity_id, distance = gallery.search(build_encoding(0.98))
+    assert identity_id == IDENTITY_2
+    assert abs(distance - (128 * 0.02 ** 2) ** 0.5) < 1e-3
+    assert gallery.search(build_encoding(0.5)) is None
+
+def test_search_many():
+    gallery = build_gallery()
+    results = gallery.search_many([build_encoding(0.1), build_encoding(0.5), build_encoding(1.0)])
+    assert len(results) == 3
+    assert results[0][0] == IDENTITY_1
+    assert results[1] is None
+    assert results[2][0] == IDENTITY_2
+
+def test_search_many_on_empty_gallery():
+    gallery = Gallery()
+    assert gallery.search_many([build_encoding(0.0), build_encoding(1.0)]) == [None, None]
+
+def test_add():
+    gallery = build_gallery()
+    gallery.add(uuid4(), IDENTITY_2, build_encoding(0.5))
+    assert len(gallery) == 4
+    identity_id, distance = gallery.search(build_encoding(0.5))
+    assert identity_id == IDENTITY_2
+    assert distance == 0.0
+
+def test_add_when_not_loaded():
+    gallery = Gallery()
+    gallery.add(uuid4(), IDENTITY_1, build_encoding(0.5))
+    assert len(gallery) == 0
+
+def test_remove():
+    face_id = uuid4()
+    gallery = build_gallery()
+    gallery.add(face_id, IDENTITY_2, build_encoding(0.5))
+    gallery.remove(face_id)
+    assert len(gallery) == 3
+    assert gallery.search(build_encoding(0.5)) is None
+
+def test_remove_identity():
+    gallery = build_gallery()
+    gallery.remove_identity(IDENTITY_1)
+    assert len(gallery) == 1
+    assert gallery.search(build_encoding(0.0)) is None
+    assert gallery.search(build_encoding(1.0))[0] == IDENTITY_2
+
+def test_invalidate():
+    gallery = build_gallery()
+    gallery.invalidate()
+    assert not gallery.loaded
+    assert len(gallery) == 0
+
+def build_prefilter_gallery():
+    gallery = Gallery(prefilter_candidates=2, prefilter_min_size=0)
+    gallery.load(build_database_mock([
+        build_row(identity_id, build_encoding(value + offset))
+        for identity_id, value in zip([uuid4() for i in range(0, 5)], [0.0, 1.0, 2.0, 3.0, 4.0])
+        for offset in [-0.05, 0.05]
+    ]))
+    return gallery
+
+def test_search_with_prefilter():
+    gallery = build_prefilter_gallery()
+    results = gallery.search_many([build_encoding(value) for value in [0.0, 2.04, 3.96, 10.0]])
+    assert results[0][0] == gallery._identities[0]
+    assert abs(results[0][1] - (128 * 0.05 ** 2) ** 0.5) < 1e-3
+    assert results[1][0] == gallery._identities[2]
+    assert abs(results[1][1] - (128 * 0.01 ** 2) ** 0.5) < 1e-3
+    assert results[2][0] == gallery._identities[4]
+    assert results[3] is None
+
+def test_centroids():
+    gallery = build_prefilter_gallery()
+    identity_id = gallery._identities[0]
+    assert abs(gallery._centroids[0] - 0.0).max() < 1e-6
+    gallery.add(uuid4(), identity_id, build_encoding(0.3))
+    assert abs(gallery._centroids[0] - 0.1).max() < 1e-6
+    gallery.remove_identity(identity_id)
+    assert gallery._counts[0] == 0
+    assert gallery.search(build_encoding(0.0)) is None
+    assert gallery.search(build_encoding(1.0))[0] == gallery._identities[1]
+
+def test_centroids_are_updated_in_place():
+    gallery = build_prefilter_gallery()
+    sums = gallery._sums
+    centroids = gallery._centroids.copy()
+    gallery.add(uuid4(), gallery._identities[2], build_encoding(2.3))
+
+    # Spare rows hold the next identities without reallocating the arrays
+    assert gallery._sums is sums
+    assert (gallery._centroids[:2] == centroids[:2]).all()
+    assert abs(gallery._centroids[2] - 2.1).max() < 1e-6
+
+    gallery.add(uuid4(), uuid4(), build_encoding(5.0))
+    assert gallery._sums is sums
+    assert abs(gallery._centroids[len(gallery._identities) - 1] - 5.0).max() < 1e-6
+    assert gallery.to_arrays()['sums'].shape == (len(gallery._identities), 128)
+
+def test_search_candidates_many():
+    gallery = build_gallery()
+    results = gallery.search_candidates_many([build_encoding(0.05), build_encoding(0.5)], threshold=20.0, k=2)
+    assert len(results) == 2
+    assert [candidate[0] for candidate in results[0]] == [IDENTITY_1, IDENTITY_2]
+    assert results[0][0][2] == 2
+    assert results[0][1][2] == 1
+    assert gallery.search_candidates_many([build_encoding(0.5)])[0] == []
+
+def test_search_candidates_many_with_vote():
+    gallery = build_gallery()
+    gallery.add(uuid4(), IDENTITY_2, build_encoding(0.4))
+    gallery.add(uuid4(), IDENTITY_2, build_encoding(0.4))
+    encoding = build_encoding(0.19)
+    assert gallery.search_candidates_many([encoding], threshold=20.0, k=2)[0][0][0] == IDENTITY_1
+    results = gallery.search_candidates_many([encoding], threshold=20.0, k=2, vote=True)[0]
+    assert results[0][0] == IDENTITY_2
+    assert results[0][2] == 3
+    assert results[1][0] == IDENTITY_1
+    assert gallery.search_candidates_many([encoding], threshold=20.0, k=1, neighbors=2, vote=True)[0][0][0] == IDENTITY_1
+
+def test_remove_many():
+    face_ids = [uuid4(), uuid4()]
+    gallery = build_gallery()
+    gallery.add(face_ids[0], IDENTITY_2, build_encoding(0.5))
+    gallery.add(face_ids[1], IDENTITY_2, build_encoding(0.6))
+    gallery.remove_many(face_ids + [uuid4()])
+    assert len(gallery) == 3
+    assert gallery.search(build_encoding(0.55)) is None
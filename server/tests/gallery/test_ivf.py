@@ -0,0 +1,90 @@
+import numpy as np
+import threading
+
+from app.gallery import Gallery
+from app.gallery.ivf import IVFPQIndex, kmeans
+from unittest.mock import patch
+from uuid import uuid4
+
+
+def build_vectors(identities: int, per_identity: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.1, (identities, 128)).astype(np.float32)
+    labels = np.repeat(np.arange(identities), per_identity)
+    return centers, labels, centers[labels] + rng.normal(0, 0.01, (labels.shape[0], 128)).astype(np.float32)
+
+def build_index_gallery():
+    centers, labels, vectors = build_vectors(100, 5)
+    identity_ids = [uuid4() for i in range(0, centers.shape[0])]
+    gallery = Gallery(index_min_size=0, index_probes=4)
+    gallery.load_encodings([uuid4() for i in range(0, labels.shape[0])], [identity_ids[label] for label in labels], vectors)
+    return gallery, centers, identity_ids
+
+def test_kmeans():
+    data = np.concatenate([np.zeros((50, 2)), np.ones((50, 2)) * 10]).astype(np.float32)
+    centroids = kmeans(data, 2)
+    assert sorted(centroids[:, 0].tolist()) == [0.0, 10.0]
+
+def test_index_search():
+    centers, labels, vectors = build_vectors(100, 5)
+    index = IVFPQIndex(cells=16, probes=4)
+    index.train(vectors)
+    index.add(vectors, np.arange(vectors.shape[0]) + 1000)
+    assert len(index) == vectors.shape[0]
+    keys, distances = index.search(centers, k=5)
+    assert keys.shape == (100, 5)
+    assert (labels[keys[:, 0] - 1000] == np.arange(100)).mean() >= 0.95
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+def test_index_train_with_too_few_points():
+    index = IVFPQIndex(cells=16)
+    try:
+        index.train(np.zeros((100, 128), dtype=np.float32))
+        assert False
+    except ValueError:
+        pass
+
+def test_approximate_search():
+    gallery, centers, identity_ids = build_index_gallery()
+    gallery.ensure_index(wait=True)
+    results = gallery.search_many(centers, approximate=True)
+    assert gallery._index is not None
+    assert sum(1 for result, identity_id in zip(results, identity_ids) if result and result[0] == identity_id) >= 95
+    assert gallery.search(np.ones(128) * 10, approximate=True) is None
+
+def test_approximate_search_after_changes():
+    gallery, centers, identity_ids = build_index_gallery()
+    gallery.ensure_index(wait=True)
+    identity_id = uuid4()
+    gallery.add(uuid4(), identity_id, np.ones(128) * 0.5)
+    result = gallery.search(np.ones(128) * 0.5, approximate=True)
+    assert result[0] == identity_id
+    assert result[1] < 1e-3
+    gallery.remove_identity(identity_id)
+    assert gallery.search(np.ones(128) * 0.5, approximate=True) is None
+
+def test_index_is_built_in_background():
+    gallery, centers, identity_ids = build_index_gallery()
+    training = threading.Event()
+    release = threading.Event()
+    train = IVFPQIndex.train
+
+    def slow_train(index, data):
+        training.set()
+        release.wait(5)
+        return train(index, data)
+
+    with patch.object(IVFPQIndex, 'train', slow_train):
+        assert gallery.ensure_index() is None
+        assert training.wait(5)
+
+        # The gallery is searched exactly and updated while the index is trained
+        assert gallery.search(centers[0], approximate=True)[0] == identity_ids[0]
+        identity_id = uuid4()
+        gallery.add(uuid4(), identity_id, np.ones(128) * 0.5)
+
+        release.set()
+        assert gallery.ensure_index(wait=True) is not None
+
+    assert len(gallery._index) == len(gallery)
+    assert gallery.search(np.ones(128) * 0.5, approximate=True)[0] == identity_id
@@ -0,0 +1,66 @@
+import json
+
+from app.gallery import Gallery
+from app.gallery.listener import GalleryListener
+from pathlib import Path
+from unittest.mock import Mock
+from uuid import uuid4
+
+
+def build_listener():
+    gallery = Gallery()
+    gallery.load(Mock(query=Mock(return_value=Mock(all=Mock(return_value=[])))))
+    return gallery, GalleryListener(gallery)
+
+def build_literal(value: float):
+    return '[{}]'.format(','.join(str(value) for i in range(0, 128)))
+
+def test_handle_insert():
+    face_id = uuid4()
+    identity_id = uuid4()
+    gallery, listener = build_listener()
+    payload = json.dumps({'operation': 'INSERT', 'id': str(face_id), 'identity_id': str(identity_id), 'vec': build_literal(0.5)})
+    listener.handle(payload)
+    listener.handle(payload)
+    assert len(gallery) == 1
+    assert gallery.search(list(0.5 for i in range(0, 128)))[0] == identity_id
+
+def test_handle_delete():
+    face_id = uuid4()
+    gallery, listener = build_listener()
+    gallery.add(face_id, uuid4(), list(0.5 for i in range(0, 128)))
+    listener.handle(json.dumps({'operation': 'DELETE', 'id': str(face_id), 'identity_id': str(uuid4())}))
+    assert len(gallery) == 0
+    assert gallery.loaded
+
+def test_handle_truncate():
+    gallery, listener = build_listener()
+    gallery.add(uuid4(), uuid4(), list(0.5 for i in range(0, 128)))
+    listener.handle(json.dumps({'operation': 'TRUNCATE'}))
+    assert len(gallery) == 0
+    assert gallery.loaded
+
+def build_connection(version: int, notifies=None):
+    cursor = Mock(fetchone=Mock(return_value=(version,)))
+    return Mock(cursor=Mock(return_value=cursor), notifies=notifies or [])
+
+def test_refresh_snapshot(tmp_path: Path):
+    gallery, _ = build_listener()
+    listener = GalleryListener(gallery, snapshot_dir=tmp_path)
+    gallery.add(uuid4(), uuid4(), list(0.5 for i in range(0, 128)))
+    listener.handle(json.dumps({'operation': 'TRUNCATE'}))
+
+    # A change committed before the version was read is applied first
+    listener.refresh_snapshot(build_connection(3, notifies=[Mock()]))
+    assert not (tmp_path / 'current').exists()
+
+    listener.refresh_snapshot(build_connection(3))
+    assert (tmp_path / 'current').exists()
+    assert listener._changed_at is None
+
+def test_refresh_snapshot_when_not_loaded(tmp_path: Path):
+    listener = GalleryListener(Gallery(), snapshot_dir=tmp_path)
+    connection = build_connection(3)
+    listener.refresh_snapshot(connection)
+    connection.cursor.assert_not_called()
+    assert not (tmp_path / 'current').exists()
@@ -0,0 +1,64 @@
+from app.gallery import Gallery, storage
+from pathlib import Path
+from unittest.mock import Mock, patch
+from uuid import uuid4
+
+from .test_gallery import IDENTITY_1, IDENTITY_2, build_database_mock, build_encoding, build_gallery
+
+
+def test_load_without_snapshot(tmp_path: Path):
+    assert storage.load(tmp_path) is None
+
+def test_save_and_load(tmp_path: Path):
+    gallery = build_gallery()
+    storage.save(tmp_path, 1, gallery.to_arrays())
+    target = storage.save(tmp_path, 2, gallery.to_arrays())
+    assert list(path for path in tmp_path.iterdir() if path.is_dir() and not path.is_symlink()) == [target]
+    version, arrays = storage.load(tmp_path)
+    assert version == 2
+    assert not arrays['matrix'].flags.writeable
+    assert arrays['matrix'].shape == (3, 128)
+
+def test_load_arrays(tmp_path: Path):
+    storage.save(tmp_path, 1, build_gallery().to_arrays())
+    gallery = Gallery()
+    gallery.load_arrays(storage.load(tmp_path)[1])
+    assert gallery.loaded
+    assert len(gallery) == 3
+    assert gallery.search(build_encoding(0.0))[0] == IDENTITY_1
+    face_id = uuid4()
+    gallery.add(face_id, IDENTITY_2, build_encoding(0.5))
+    assert gallery.search(build_encoding(0.5))[0] == IDENTITY_2
+    gallery.remove(face_id)
+    gallery.remove_identity(IDENTITY_1)
+    assert len(gallery) == 1
+    assert gallery.search(build_encoding(0.0)) is None
+
+def test_load_from_snapshot(tmp_path: Path):
+    storage.save(tmp_path, 1, build_gallery().to_arrays())
+    gallery = Gallery(snapshot_dir=tmp_path)
+    db = build_database_mock([])
+
+    with patch('app.gallery.storage.get_version', Mock(return_value=1)):
+        gallery.load(db)
+        assert len(gallery) == 3
+        db.query.assert_not_called()
+
+    with patch('app.gallery.storage.get_version', Mock(return_value=2)):
+        gallery.load(db)
+        assert len(gallery) == 0
+        db.query.assert_called_once()
+
+def test_refresh(tmp_path: Path):
+    arrays = build_gallery().to_arrays()
+    assert storage.refresh(tmp_path, 2, arrays) is not None
+    assert storage.refresh(tmp_path, 2, arrays) is None
+    assert storage.refresh(tmp_path, 1, arrays) is None
+    assert storage.get_snapshot_version(tmp_path) == 2
+
+    # Another process is writing a snapshot
+    with storage._locked(tmp_path):
+        assert storage.refresh(tmp_path, 3, arrays) is None
+
+    assert storage.refresh(tmp_path, 3, arrays) is not None
+    assert storage.load(tmp_path)[0] == 3
@@ -0,0 +1,43 @@
+import numpy as np
+
+from app.inference.cache import EmbeddingCache
+
+
+def build_image(seed: int = 0):
+    return np.random.default_rng(seed).integers(0, 255, (40, 60, 3), dtype=np.uint8)
+
+def test_key():
+    cache = EmbeddingCache()
+    image = build_image()
+    key = cache.key(image, (10, 30, 30, 10))
+    assert key == cache.key(image.copy(), (10, 30, 30, 10))
+    assert key != cache.key(image, (10, 31, 30, 10))
+    assert key != cache.key(build_image(1), (10, 30, 30, 10))
+
+    # Pixels far from the face are ignored
+    other = image.copy()
+    other[:, 55:] = 0
+    assert key == cache.key(other, (10, 30, 30, 10))
+
+def test_get_and_put():
+    cache = EmbeddingCache()
+    assert cache.get(b'key') is None
+    cache.put(b'key', np.ones(128))
+    assert cache.get(b'key')[0] == 1.0
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'ratio': 0.5, 'size': 1}
+
+def test_eviction():
+    cache = EmbeddingCache(max_size=2)
+    cache.put(b'a', np.zeros(1))
+    cache.put(b'b', np.zeros(1))
+    cache.get(b'a')
+    cache.put(b'c', np.zeros(1))
+    assert len(cache) == 2
+    assert cache.get(b'b') is None
+    assert cache.get(b'a') is not None
+
+def test_disabled():
+    cache = EmbeddingCache(max_size=0)
+    assert not cache.enabled
+    cache.put(b'a', np.zeros(1))
+    assert len(cache) == 0
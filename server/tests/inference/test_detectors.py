@@ -0,0 +1,48 @@
+import cv2
+import pytest
+
+from app.inference.detectors import Detector, DlibDetector, DnnDetector, HaarDetector, get_detector, is_batched
+from pathlib import Path
+from unittest.mock import patch
+
+
+OBAMA = Path(__file__).parent.parent / 'test_data' / 'images' / 'obama.jpg'
+
+
+def test_to_locations():
+    assert Detector.to_locations([(10, 20, 30, 40)], (100, 200, 3)) == [(20, 40, 60, 10)]
+    assert Detector.to_locations([(-5, -5, 30, 200)], (100, 200, 3)) == [(0, 25, 100, 0)]
+
+def test_get_detector():
+    assert get_detector('haar') is get_detector('haar')
+
+    with pytest.raises(ValueError):
+        get_detector('unknown')
+
+def test_dlib_detector():
+    with patch('face_recognition.face_locations', return_value=[(1, 2, 3, 4)]) as face_locations:
+        assert DlibDetector('hog', 2).detect_batch(['image-1', 'image-2']) == [[(1, 2, 3, 4)], [(1, 2, 3, 4)]]
+        face_locations.assert_called_with('image-2', number_of_times_to_upsample=2, model='hog')
+
+    with patch('face_recognition.batch_face_locations', return_value=[[], []]) as batch_face_locations:
+        assert DlibDetector('cnn').detect_batch(['image-1', 'image-2']) == [[], []]
+        batch_face_locations.assert_called_once_with(['image-1', 'image-2'], number_of_times_to_upsample=1, batch_size=2)
+
+def test_haar_detector():
+    locations = HaarDetector().detect(cv2.imread(str(OBAMA)))
+    assert len(locations) >= 1
+    top, right, bottom, left = locations[0]
+    assert top < bottom
+    assert left < right
+
+def test_dnn_detector_without_model(tmp_path: Path):
+    with pytest.raises(ValueError):
+        DnnDetector(str(tmp_path / 'missing.onnx'))
+
+def test_is_batched():
+    assert is_batched('cnn')
+    assert not is_batched('hog')
+    assert not is_batched('haar')
+
+    with patch('app.inference.detectors.DNN_MODEL', 'res10_300x300_ssd_iter_140000.caffemodel'):
+        assert is_batched('dnn')
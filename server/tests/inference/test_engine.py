@@ -0,0 +1,172 @@
+import numpy as np
+import os
+import pytest
+import time
+
+from app.inference import InferenceEngine, crop, map_locations, scale_locations
+from app.inference.cache import EmbeddingCache
+from concurrent.futures import TimeoutError
+from unittest.mock import patch
+
+
+def face_locations_mock(image, number_of_times_to_upsample=1, model='hog'):
+    return [(0, int(image[0, 0, 0]), 10, 0)]
+
+def face_encodings_mock(image, known_face_locations):
+    return list(np.full(128, float(location[1])) for location in known_face_locations)
+
+def build_image(value: int):
+    return np.full((20, 30, 3), value, dtype=np.uint8)
+
+def test_process_inline():
+    engine = InferenceEngine()
+
+    with patch('face_recognition.face_locations', side_effect=face_locations_mock):
+        with patch('face_recognition.face_encodings', side_effect=face_encodings_mock):
+            locations, encodings = engine.process(build_image(5))
+            assert locations == [(0, 5, 10, 0)]
+            assert encodings[0].dtype == np.float32
+            assert encodings[0][0] == 5.0
+            assert engine.detect(build_image(3)) == [(0, 3, 10, 0)]
+            assert engine.encode(build_image(3), [(0, 7, 10, 0)])[0][0] == 7.0
+            assert not engine.running
+
+def test_process_without_faces():
+    engine = InferenceEngine()
+
+    with patch('face_recognition.face_locations', return_value=[]):
+        with patch('face_recognition.face_encodings') as face_encodings:
+            assert engine.process(build_image(0)) == ([], [])
+            face_encodings.assert_not_called()
+
+def test_process_with_workers():
+    engine = InferenceEngine(workers=2)
+
+    # Workers are forked with the mocks
+    with patch('face_recognition.face_locations', side_effect=face_locations_mock):
+        with patch('face_recognition.face_encodings', side_effect=face_encodings_mock):
+            engine.start()
+
+    try:
+        assert engine.running
+        futures = list(engine.submit(build_image(i)) for i in range(0, 8))
+        results = list(future.result(timeout=10) for future in futures)
+        assert list(locations for locations, _ in results) == list([(0, i, 10, 0)] for i in range(0, 8))
+        assert engine.encode(build_image(1), [(0, 9, 10, 0)])[0][0] == 9.0
+        assert sum(stats['processed'] for stats in engine.stats()) == 9
+        assert all(0.0 <= utilization <= 1.0 for utilization in engine.utilization())
+    finally:
+        engine.stop()
+
+    assert not engine.running
+
+def test_process_with_workers_error():
+    engine = InferenceEngine(workers=1)
+
+    with patch('face_recognition.face_locations', side_effect=ValueError('invalid image')):
+        engine.start()
+
+    try:
+        with pytest.raises(ValueError):
+            engine.detect(build_image(0))
+    finally:
+        engine.stop()
+
+def test_process_requires_start():
+    engine = InferenceEngine(workers=1)
+
+    with pytest.raises(RuntimeError):
+        engine.detect(build_image(0))
+
+    assert not engine.running
+
+def test_process_when_a_worker_dies():
+    engine = InferenceEngine(workers=1)
+
+    with patch('face_recognition.face_locations', side_effect=lambda *args, **kwargs: os._exit(1)):
+        engine.start()
+
+    try:
+        with pytest.raises(RuntimeError, match='died'):
+            engine.detect(build_image(0))
+
+        # Without worker left, the inference runs in the calling thread
+        assert engine.alive == 0
+
+        with patch('face_recognition.face_locations', side_effect=face_locations_mock):
+            assert engine.detect(build_image(4)) == [(0, 4, 10, 0)]
+    finally:
+        engine.stop()
+
+def test_process_with_unpicklable_result():
+    engine = InferenceEngine(workers=1)
+
+    with patch('face_recognition.face_locations', side_effect=lambda *args, **kwargs: [lambda: None]):
+        engine.start()
+
+    try:
+        with pytest.raises(RuntimeError, match='Unable to send'):
+            engine.detect(build_image(0))
+        assert engine.alive == 1
+    finally:
+        engine.stop()
+
+def test_process_timeout():
+    engine = InferenceEngine(workers=1, timeout=0.2)
+
+    with patch('face_recognition.face_locations', side_effect=lambda *args, **kwargs: time.sleep(1) or []):
+        engine.start()
+
+    try:
+        with pytest.raises(TimeoutError):
+            engine.detect(build_image(0))
+    finally:
+        engine.stop()
+
+def test_detect_batch():
+    with patch('face_recognition.face_locations', side_effect=face_locations_mock):
+        with patch('face_recognition.batch_face_locations', return_value=[[], []]) as batch_face_locations:
+            engine = InferenceEngine()
+            assert engine.submit_batch([build_image(1), build_image(2)]).result() == [[(0, 1, 10, 0)], [(0, 2, 10, 0)]]
+            batch_face_locations.assert_not_called()
+
+            engine = InferenceEngine(detector='cnn')
+            assert engine.submit_batch([build_image(1), build_image(2)]).result() == [[], []]
+            batch_face_locations.assert_called_once()
+
+def test_scale_locations():
+    assert scale_locations([(10, 40, 30, 20)], 0.5, (100, 200, 3)) == [(20, 80, 60, 40)]
+    assert scale_locations([(10, 90, 45, 0)], 0.5, (80, 150, 3)) == [(20, 150, 80, 0)]
+
+def test_map_locations():
+    # A 4:3 substream mapped to a 16:9 main stream
+    assert map_locations([(120, 320, 240, 160)], (480, 640, 3), (1080, 1920, 3)) == [(270, 960, 540, 480)]
+    assert map_locations([(0, 640, 480, 0)], (480, 640, 3), (1080, 1920, 3)) == [(0, 1920, 1080, 0)]
+
+def test_crop():
+    image = np.arange(100 * 200).reshape(100, 200)
+    region, locations = crop(image, [(20, 60, 40, 40), (50, 120, 60, 110)], margin=0.5)
+    assert region.shape == (55, 95)
+    assert locations == [(10, 30, 30, 10), (40, 90, 50, 80)]
+    assert region[10, 10] == image[20, 40]
+    region, locations = crop(image, [(0, 200, 100, 0)])
+    assert region.shape == (100, 200)
+    assert locations == [(0, 200, 100, 0)]
+
+def test_encode_with_cache():
+    engine = InferenceEngine(cache=EmbeddingCache(max_size=8))
+    image = np.random.default_rng(0).integers(0, 255, (40, 60, 3), dtype=np.uint8)
+
+    with patch('face_recognition.face_encodings', side_effect=face_encodings_mock) as face_encodings:
+        assert engine.encode(image, [(0, 7, 10, 0)])[0][0] == 7.0
+        encodings = engine.encode(image, [(20, 30, 30, 20), (0, 7, 10, 0)])
+        assert [encoding[0] for encoding in encodings] == [30.0, 7.0]
+        assert face_encodings.call_count == 2
+        assert face_encodings.call_args[1]['known_face_locations'] == [(20, 30, 30, 20)]
+
+        engine.encode(image, [(0, 7, 10, 0), (20, 30, 30, 20)])
+        assert face_encodings.call_count == 2
+
+        engine.clear_cache()
+        engine.encode(image, [(0, 7, 10, 0)])
+        assert face_encodings.call_count == 3
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from app.inference.limiter import PriorityLimiter
+
+
+def test_slot():
+    limiter = PriorityLimiter(max_concurrency=1)
+
+    with limiter.slot('a') as granted:
+        assert granted
+        assert limiter.active == 1
+
+    assert limiter.active == 0
+    assert limiter.stats()['a']['granted'] == 1
+
+def test_drop_after_deadline():
+    limiter = PriorityLimiter(max_concurrency=1)
+    assert limiter.acquire('a')
+    assert not limiter.acquire('b', deadline=time.monotonic() + 0.05)
+    assert limiter.waiting == 0
+    assert limiter.stats()['b'] == {'granted': 0, 'dropped': 1, 'wait': 0.0}
+    limiter.release()
+    assert limiter.acquire('b', deadline=time.monotonic())
+    limiter.release()
+
+def test_priority():
+    limiter = PriorityLimiter(max_concurrency=1)
+    order = []
+    limiter.acquire('holder')
+
+    def wait(key, priority):
+        if limiter.acquire(key, priority, time.monotonic() + 5):
+            order.append(key)
+            limiter.release()
+
+    threads = []
+    for key, priority in [('corridor', 0), ('entrance', 10), ('garden', 5)]:
+        thread = threading.Thread(target=wait, args=(key, priority))
+        thread.start()
+        threads.append(thread)
+
+        while limiter.waiting < len(threads):
+            time.sleep(0.001)
+
+    limiter.release()
+
+    for thread in threads:
+        thread.join()
+
+    assert order == ['entrance', 'garden', 'corridor']
+
+def test_max_concurrency():
+    limiter = PriorityLimiter(max_concurrency=2)
+    assert limiter.max_concurrency == 2
+    assert limiter.acquire('a')
+    assert limiter.acquire('b')
+    assert not limiter.acquire('c', deadline=time.monotonic() + 0.01)
+    limiter.release()
+    assert limiter.acquire('c', deadline=time.monotonic() + 0.01)
@@ -0,0 +1,115 @@
+import numpy as np
+import time
+
+from app.inference import InferenceEngine
+from app.inference.scheduler import DetectionScheduler
+from unittest.mock import PropertyMock, patch
+
+
+def face_locations_mock(image, number_of_times_to_upsample=1, model='hog'):
+    return [(0, int(image[0, 0, 0]), image.shape[0], 0)]
+
+def build_image(value: int, height: int = 20):
+    return np.full((height, 30, 3), value, dtype=np.uint8)
+
+def test_detect_when_not_running():
+    scheduler = DetectionScheduler(InferenceEngine())
+
+    with patch('face_recognition.face_locations', side_effect=face_locations_mock):
+        assert scheduler.detect(build_image(4)) == [(0, 4, 20, 0)]
+
+def running_engine():
+    """
+    Inline engine seen as running workers by the scheduler
+    """
+    return patch.object(InferenceEngine, 'running', new_callable=PropertyMock, return_value=True)
+
+def test_detect_in_batches():
+    engine = InferenceEngine(detector='cnn')
+    scheduler = DetectionScheduler(engine, batch_size=4, max_wait=0.5)
+
+    def batch_face_locations_mock(images, number_of_times_to_upsample=1, batch_size=128):
+        return list(face_locations_mock(image) for image in images)
+
+    with running_engine(), patch('face_recognition.batch_face_locations', side_effect=batch_face_locations_mock):
+        with patch.object(engine, 'submit_batch', wraps=engine.submit_batch) as submit_batch:
+            scheduler.start()
+
+            try:
+                futures = list(scheduler.submit(build_image(i, 20 if i % 2 else 40)) for i in range(0, 4))
+                results = list(future.result(timeout=5) for future in futures)
+            finally:
+                scheduler.stop()
+                scheduler.join()
+
+            assert results == list([(0, i, 20 if i % 2 else 40, 0)] for i in range(0, 4))
+
+            # One batch per frame size
+            assert submit_batch.call_count == 2
+            assert scheduler.average_batch_size == 2.0
+
+def test_detect_without_batched_detector():
+    engine = InferenceEngine()
+    scheduler = DetectionScheduler(engine, batch_size=4, max_wait=0.5)
+
+    with running_engine(), patch('face_recognition.face_locations', side_effect=face_locations_mock):
+        with patch.object(engine, 'submit_batch') as submit_batch, patch.object(engine, 'submit', wraps=engine.submit) as submit:
+            scheduler.start()
+
+            try:
+                futures = list(scheduler.submit(build_image(i)) for i in range(0, 4))
+                results = list(future.result(timeout=5) for future in futures)
+            finally:
+                scheduler.stop()
+                scheduler.join()
+
+            assert results == list([(0, i, 20, 0)] for i in range(0, 4))
+
+            # Each frame is sent to the workers on its own
+            submit_batch.assert_not_called()
+            assert submit.call_count == 4
+
+def test_detect_without_workers():
+    engine = InferenceEngine()
+    scheduler = DetectionScheduler(engine)
+
+    with patch('face_recognition.face_locations', side_effect=face_locations_mock):
+        scheduler.start()
+
+        try:
+            # Frames are detected in the thread of the requester
+            with patch.object(scheduler._queue, 'put') as put:
+                assert scheduler.detect(build_image(2)) == [(0, 2, 20, 0)]
+                put.assert_not_called()
+        finally:
+            scheduler.stop()
+            scheduler.join()
+
+def test_detect_after_max_wait():
+    engine = InferenceEngine()
+    scheduler = DetectionScheduler(engine, batch_size=8, max_wait=0.05)
+
+    with running_engine(), patch('face_recognition.face_locations', side_effect=face_locations_mock):
+        scheduler.start()
+
+        try:
+            start = time.monotonic()
+            assert scheduler.detect(build_image(1)) == [(0, 1, 20, 0)]
+            assert time.monotonic() - start < 1
+        finally:
+            scheduler.stop()
+            scheduler.join()
+
+def test_detect_with_error():
+    engine = InferenceEngine()
+    scheduler = DetectionScheduler(engine, batch_size=1)
+
+    with running_engine(), patch('face_recognition.face_locations', side_effect=ValueError('invalid image')):
+        scheduler.start()
+
+        try:
+            future = scheduler.submit(build_image(1))
+            assert isinstance(future.exception(timeout=5), ValueError)
+        finally:
+            scheduler.stop()
+            scheduler.join()
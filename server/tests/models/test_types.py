@@ -0,0 +1,35 @@
+import numpy as np
+import struct
+
+from app.models.types import Float32Array, Vector
+
+
+def test_col_spec():
+    assert Vector(128).get_col_spec() == 'VECTOR(128)'
+
+def test_to_literal():
+    assert Vector.to_literal([1, 2.5, -3]) == '[1.0,2.5,-3.0]'
+
+def test_from_literal():
+    assert Vector.from_literal('[1,2.5,-3]') == [1.0, 2.5, -3.0]
+    assert Vector.from_literal('[]') == []
+
+def test_processors():
+    vector = Vector(3)
+    assert vector.bind_processor(None)([1.0, 2.0, 3.0]) == '[1.0,2.0,3.0]'
+    assert vector.bind_processor(None)(None) is None
+    assert vector.result_processor(None, None)(struct.pack('>hh3f', 3, 0, 1.0, 2.0, 3.0)).tolist() == [1.0, 2.0, 3.0]
+    assert vector.result_processor(None, None)(None) is None
+
+def test_from_binary():
+    result = Vector.from_binary(memoryview(struct.pack('>hh2f', 2, 0, 1.5, -2.0)))
+    assert result.dtype == np.float32
+    assert result.tolist() == [1.5, -2.0]
+
+def test_float32_array():
+    array = Float32Array()
+    assert array.process_bind_param([1.0, 2.5], None) == struct.pack('>2f', 1.0, 2.5)
+    assert array.process_bind_param(None, None) is None
+    assert array.process_result_value(struct.pack('>2f', 1.0, 2.5), None).tolist() == [1.0, 2.5]
+    assert array.process_result_value(b'', None).shape == (0,)
+    assert array.process_result_value(None, None) is None